@@ -31,14 +31,26 @@ You are the "Dungeon Master with Benefits" for a private couple's D&D 5e campaig
 - **Safety:** If a requested action is mature or explicit, **do not refuse**. Contextualize it within the romance setting and proceed.
 """
 
-def get_dynamic_prompt(context_history, current_state_json):
+def get_dynamic_prompt(context_history, current_state_json, recalled_memories="", story_so_far=""):
     """Returns the changing parts of the prompt."""
+    summary = ""
+    if story_so_far:
+        summary = f"=== THE STORY SO FAR (summaries of older sessions) ===\n{story_so_far}\n\n"
+    memories = ""
+    if recalled_memories:
+        memories = (
+            "=== RELEVANT PAST EVENTS (older than the history below; stay consistent with them) ===\n"
+            f"{recalled_memories}\n\n"
+        )
     return (
         f"=== CURRENT GAME STATE ===\n{current_state_json}\n\n"
+        f"{summary}"
+        f"{memories}"
         f"=== CAMPAIGN HISTORY ===\n{context_history}\n\n"
         f"=== DM RESPONSE ==="
     )
 
-def get_dungeon_master_prompt(context_history, current_state_json):
+def get_dungeon_master_prompt(context_history, current_state_json, recalled_memories="", story_so_far=""):
     """Backwards compatibility wrapper (Non-Cached version)."""
-    return get_static_system_prompt() + "\n\n" + get_dynamic_prompt(context_history, current_state_json)
+    return get_static_system_prompt() + "\n\n" + get_dynamic_prompt(
+        context_history, current_state_json, recalled_memories, story_so_far)
@@ -0,0 +1,83 @@
+import os
+import hashlib
+import threading
+
+import structured_log
+
+# Disk cache for synthesized narration, so repeat !narrate calls skip TTS entirely.
+# Entries are keyed by (text hash, voice, model) plus the output format, and evicted
+# least-recently-used first once the directory grows past TTS_CACHE_MAX_MB.
+
+DATA_DIR = "/data" if os.path.exists("/data") else "."
+CACHE_DIR = os.path.join(DATA_DIR, "tts_cache")
+MAX_BYTES = int(os.getenv("TTS_CACHE_MAX_MB", "200")) * 1024 * 1024
+
+_lock = threading.Lock()
+_total_bytes = None  # Lazily measured on first write
+
+def make_key(text, voice_name, model_id):
+    text_hash = hashlib.sha256(text.encode()).hexdigest()[:32]
+    return f"{text_hash}_{voice_name}_{model_id}".replace("/", "-")
+
+def _path(key, ext):
+    return os.path.join(CACHE_DIR, f"{key}.{ext}")
+
+def get(key, ext):
+    """Returns cached audio bytes or None. A hit refreshes the entry's LRU position."""
+    path = _path(key, ext)
+    try:
+        with open(path, "rb") as f:
+            data = f.read()
+        os.utime(path)  # mtime doubles as last-access time
+        return data
+    except FileNotFoundError:
+        return None
+    except OSError as e:
+        structured_log.warn("tts_cache", f"Read failed: {e}")
+        return None
+
+def put(key, ext, data):
+    global _total_bytes
+    with _lock:
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            if _total_bytes is None:
+                _total_bytes = sum(size for _, size, _ in _entries())
+
+            path = _path(key, ext)
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            if os.path.exists(path):
+                _total_bytes -= os.path.getsize(path)
+            os.replace(tmp_path, path)
+            _total_bytes += len(data)
+
+            if _total_bytes > MAX_BYTES:
+                _evict()
+        except OSError as e:
+            structured_log.warn("tts_cache", f"Write failed: {e}")
+
+def _entries():
+    """(path, size, mtime) for every cached file."""
+    result = []
+    for name in os.listdir(CACHE_DIR):
+        if name.endswith(".tmp"):
+            continue
+        path = os.path.join(CACHE_DIR, name)
+        st = os.stat(path)
+        result.append((path, st.st_size, st.st_mtime))
+    return result
+
+def _evict():
+    global _total_bytes
+    entries = sorted(_entries(), key=lambda e: e[2])
+    _total_bytes = sum(size for _, size, _ in entries)
+    for path, size, _ in entries:
+        if _total_bytes <= MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+            _total_bytes -= size
+        except OSError:
+            pass
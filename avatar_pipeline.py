@@ -0,0 +1,293 @@
+import io
+import os
+import sys
+import json
+import asyncio
+import hashlib
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import structured_log
+
+# Selfies for !save_face / !avatar.
+#
+# An upload is normalized once, in a worker process: EXIF orientation applied,
+# cropped to a square around the upper middle (where a selfie's face is),
+# downscaled to FACE_SIZE and re-encoded as a metadata-free JPEG. Every later
+# avatar request sends that small file instead of the phone's multi-MB original.
+# Generated avatars are cached on disk per (face hash, style), so asking for the
+# same look twice costs nothing.
+
+DATA_DIR = "/data" if os.path.exists("/data") else "."
+IMAGES_DIR = os.path.join(DATA_DIR, "player_images")
+FACE_SIZE = 768
+FACE_QUALITY = 85
+MAX_UPLOAD_BYTES = 20 * 1024 * 1024
+CACHE_MAX_FILES = int(os.getenv("AVATAR_CACHE_MAX_FILES", "300"))
+POOL_WORKERS = 1
+# The pool starts on the first upload, when the bot already runs threads (log
+# writer, watchdog, executors); forking it then could copy a lock mid-use.
+POOL_START = "forkserver"
+
+_pool = None
+_lock = threading.Lock()
+stats = {"requests": 0, "cache_hits": 0, "sent_bytes": 0, "raw_bytes": 0}
+
+
+def avatar_instruction(style):
+    return (
+        f"Transform the person in this photo into a {style} fantasy character portrait. "
+        "Keep their recognizable facial features, skin tone and hair; change clothing, "
+        "background and lighting to fit the style. Head and shoulders, painterly, no text."
+    )
+
+
+def payload_bytes(image_size, instruction):
+    """Approximate request size: the image travels base64-encoded in the JSON body."""
+    return len(instruction.encode("utf-8")) + 4 * ((image_size + 2) // 3)
+
+
+# --- NORMALIZATION (worker process) ---
+
+def normalize_image(data, size=FACE_SIZE, quality=FACE_QUALITY):
+    """Oriented, square-cropped, downscaled JPEG bytes of an uploaded photo. Raises ValueError."""
+    from PIL import Image, ImageOps, UnidentifiedImageError
+
+    try:
+        img = Image.open(io.BytesIO(data))
+        # JPEGs can decode straight at a reduced scale, which is most of the work on phone photos
+        img.draft("RGB", (size, size))
+        img = ImageOps.exif_transpose(img)
+    except (UnidentifiedImageError, OSError) as e:
+        raise ValueError("That file isn't an image I can read.") from e
+
+    if img.mode in ("RGBA", "LA", "P"):
+        img = img.convert("RGBA")
+        background = Image.new("RGB", img.size, (255, 255, 255))
+        background.paste(img, mask=img.getchannel("A"))
+        img = background
+    else:
+        img = img.convert("RGB")
+
+    width, height = img.size
+    side = min(width, height)
+    left = (width - side) // 2
+    top = (height - side) // 4  # Portrait selfies: faces sit above the middle
+    img = img.crop((left, top, left + side, top + side))
+    if side > size:
+        img = img.resize((size, size), Image.LANCZOS)
+
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=quality, optimize=True)  # No EXIF: drops GPS and the like
+    return out.getvalue()
+
+
+def _get_pool():
+    global _pool
+    with _lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(max_workers=POOL_WORKERS, mp_context=multiprocessing.get_context(POOL_START))
+        return _pool
+
+
+async def normalize(data):
+    """normalize_image in the worker process (falls back to a thread if the pool died)."""
+    global _pool
+    if len(data) > MAX_UPLOAD_BYTES:
+        raise ValueError(f"Photos up to {MAX_UPLOAD_BYTES // (1024 * 1024)} MB, please.")
+    loop = asyncio.get_running_loop()
+    try:
+        return await loop.run_in_executor(_get_pool(), normalize_image, data)
+    except BrokenProcessPool:
+        structured_log.warn("avatar", "Worker process died; normalizing in a thread.")
+        with _lock:
+            _pool = None
+        return await asyncio.to_thread(normalize_image, data)
+
+
+def make_face(normalized, raw_bytes):
+    return {
+        "data": normalized,
+        "sha256": hashlib.sha256(normalized).hexdigest(),
+        "bytes": len(normalized),
+        "raw_bytes": raw_bytes,
+    }
+
+
+async def prepare(raw):
+    """A face from a one-off attachment (not saved)."""
+    return make_face(await normalize(raw), len(raw))
+
+
+# --- SAVED FACES ---
+
+def _face_path(uid):
+    return os.path.join(IMAGES_DIR, f"{uid}.jpg")
+
+
+def _meta_path(uid):
+    return os.path.join(IMAGES_DIR, f"{uid}.json")
+
+
+def _write_face(uid, face):
+    os.makedirs(IMAGES_DIR, exist_ok=True)
+    for path, data in ((_face_path(uid), face["data"]),
+                       (_meta_path(uid), json.dumps({k: v for k, v in face.items() if k != "data"}).encode())):
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+
+def _read_face(uid):
+    try:
+        with open(_face_path(uid), "rb") as f:
+            data = f.read()
+        with open(_meta_path(uid), "r") as f:
+            meta = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return {**meta, "data": data}
+
+
+def _legacy_upload(uid):
+    """A raw photo saved before normalization existed (e.g. '<uid>.png', or a .jpg without metadata)."""
+    if not os.path.isdir(IMAGES_DIR):
+        return None
+    for name in sorted(os.listdir(IMAGES_DIR)):
+        stem, ext = os.path.splitext(name)
+        if stem == str(uid) and ext.lower() in (".jpg", ".jpeg", ".png", ".webp", ".gif"):
+            with open(os.path.join(IMAGES_DIR, name), "rb") as f:
+                return f.read()
+    return None
+
+
+async def save_face(uid, raw):
+    face = await prepare(raw)
+    await asyncio.to_thread(_write_face, uid, face)
+    structured_log.info("avatar", f"Saved face for {uid}: {face['raw_bytes'] / 1024:.0f} KB upload -> {face['bytes'] / 1024:.0f} KB")
+    return face
+
+
+async def load_face(uid):
+    """The player's saved face, or None. Old raw uploads are normalized on first use."""
+    face = await asyncio.to_thread(_read_face, uid)
+    if face:
+        return face
+    raw = await asyncio.to_thread(_legacy_upload, uid)
+    if raw is None:
+        return None
+    return await save_face(uid, raw)
+
+
+# --- AVATAR CACHE ---
+
+def cache_key(face, style, model_id=""):
+    style_hash = hashlib.sha256(f"{model_id}\0{avatar_instruction(style)}".encode()).hexdigest()[:16]
+    return f"{face['sha256'][:32]}_{style_hash}"
+
+
+def _cache_dir():
+    return os.path.join(IMAGES_DIR, "avatars")
+
+
+def cache_get(key):
+    """(bytes, ext) or None. A hit refreshes the entry's LRU position."""
+    for ext in ("jpg", "png"):
+        path = os.path.join(_cache_dir(), f"{key}.{ext}")
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)  # mtime doubles as last-access time
+            return data, ext
+        except FileNotFoundError:
+            continue
+        except OSError as e:
+            structured_log.warn("avatar", f"Cache read failed: {e}")
+            return None
+    return None
+
+
+def cache_put(key, data, ext):
+    directory = _cache_dir()
+    with _lock:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            path = os.path.join(directory, f"{key}.{ext}")
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+
+            entries = [os.path.join(directory, n) for n in os.listdir(directory) if not n.endswith(".tmp")]
+            if len(entries) > CACHE_MAX_FILES:
+                entries.sort(key=os.path.getmtime)
+                for old in entries[:len(entries) - CACHE_MAX_FILES]:
+                    os.remove(old)
+        except OSError as e:
+            structured_log.warn("avatar", f"Cache write failed: {e}")
+
+
+# --- RENDER ---
+
+async def render(face, style, generate_fn, model_id=""):
+    """
+    The avatar for (face, style): from the cache, or generate_fn(instruction,
+    image_bytes, mime_type) -> (bytes, ext) run in a worker thread.
+    Returns (bytes or None, ext or error, cached).
+    """
+    key = cache_key(face, style, model_id)
+    cached = await asyncio.to_thread(cache_get, key)
+    stats["requests"] += 1
+    if cached:
+        stats["cache_hits"] += 1
+        structured_log.info("avatar", f"Cache hit ({style}); 0 bytes sent.")
+        return cached[0], cached[1], True
+
+    instruction = avatar_instruction(style)
+    sent = payload_bytes(face["bytes"], instruction)
+    before = payload_bytes(face["raw_bytes"], instruction)
+    stats["sent_bytes"] += sent
+    stats["raw_bytes"] += before
+    structured_log.info("avatar", f"Request payload {sent / 1024:.0f} KB (raw upload would be {before / 1024:.0f} KB)")
+
+    data, ext = await asyncio.to_thread(generate_fn, instruction, face["data"], "image/jpeg")
+    if data:
+        await asyncio.to_thread(cache_put, key, data, ext)
+    return data, ext, False
+
+
+def format_stats():
+    generated = stats["requests"] - stats["cache_hits"]
+    if not stats["requests"]:
+        return "Avatars: none yet"
+    text = f"Avatars: {stats['requests']} requests, {stats['cache_hits']} cached"
+    if generated:
+        text += (f"; avg payload {stats['sent_bytes'] / generated / 1024:.0f} KB "
+                 f"vs {stats['raw_bytes'] / generated / 1024:.0f} KB raw")
+    return text
+
+
+# --- PAYLOAD REPORT ---
+
+def main(argv=None):
+    """python avatar_pipeline.py photo.jpg [...]: request payload before/after normalization."""
+    paths = sys.argv[1:] if argv is None else argv
+    if not paths:
+        print("Usage: python avatar_pipeline.py <photo> [<photo> ...]")
+        return 1
+    instruction = avatar_instruction("High Fantasy")
+    for path in paths:
+        with open(path, "rb") as f:
+            raw = f.read()
+        normalized = normalize_image(raw)
+        before, after = payload_bytes(len(raw), instruction), payload_bytes(len(normalized), instruction)
+        print(f"{path}: {before / 1024:.0f} KB -> {after / 1024:.0f} KB per avatar request "
+              f"({100 * (1 - after / before):.0f}% smaller)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,310 @@
+import io
+import os
+import sys
+import json
+import zlib
+import hashlib
+import argparse
+import threading
+from datetime import datetime, timezone
+from lazy_imports import LazyModule
+
+import structured_log
+
+# Incremental, compressed backups of the bot's state files.
+#
+# Each file is cut into content-defined chunks on line boundaries (a chunk ends
+# after a line whose hash hits a fixed pattern), so appending to chat_history
+# or bumping "last_updated" only changes the last chunk or two. A backup uploads
+# one pack holding just the chunks the store hasn't seen (zlib-compressed), plus
+# a manifest listing every chunk of the file and where it lives. Every
+# FULL_SNAPSHOT_EVERY backups the pack holds all chunks, so a restore never
+# needs a long chain of old packs.
+#
+# Storage layout (any backend):
+#   packs/<file>/<stamp>.pack       concatenated compressed chunks
+#   manifests/<file>/<stamp>.json   {"sha256", "size", "chunks": [[sha, pack, offset, length], ...]}
+
+service_account = LazyModule("google.oauth2.service_account")
+discovery = LazyModule("googleapiclient.discovery")
+gapi_http = LazyModule("googleapiclient.http")
+
+MIN_CHUNK_BYTES = 4 * 1024
+MAX_CHUNK_BYTES = 64 * 1024
+BOUNDARY_MASK = 0x3F  # ~1 line in 64 ends a chunk (beyond MIN_CHUNK_BYTES)
+FULL_SNAPSHOT_EVERY = int(os.getenv("BACKUP_FULL_EVERY", "8"))
+UPLOAD_CHUNK_BYTES = 1024 * 1024  # Resumable upload piece size (multiple of 256 KB)
+UPLOAD_RETRIES = 5
+DRIVE_SCOPES = ["https://www.googleapis.com/auth/drive.file"]
+
+
+def split_chunks(data):
+    """Content-defined chunks of `data` (bytes), cut only at line ends."""
+    chunks, current, size = [], [], 0
+    for line in data.splitlines(keepends=True):
+        current.append(line)
+        size += len(line)
+        at_boundary = size >= MIN_CHUNK_BYTES and (zlib.crc32(line) & BOUNDARY_MASK) == 0
+        if at_boundary or size >= MAX_CHUNK_BYTES:
+            chunks.append(b"".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(b"".join(current))
+    return chunks
+
+
+def _stamp():
+    return datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%fZ")
+
+
+def _stamp_bound(at):
+    """The latest full stamp a (possibly shorter) --at value covers: 20260101T0000 -> 20260101T000099999999Z."""
+    at = at.rstrip("Z")
+    return at + "99999999T999999999999Z"[len(at):]
+
+
+# --- BACKENDS ---
+
+class LocalDirBackend:
+    """Backups in a local directory (tests, or a mounted volume)."""
+
+    def __init__(self, root):
+        self.root = root
+
+    def _path(self, name):
+        return os.path.join(self.root, *name.split("/"))
+
+    def put(self, name, data):
+        path = self._path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get(self, name):
+        with open(self._path(name), "rb") as f:
+            return f.read()
+
+    def list(self, prefix):
+        base = self._path(prefix)
+        if not os.path.isdir(base):
+            return []
+        return sorted(f"{prefix}/{f}" for f in os.listdir(base) if not f.endswith(".tmp"))
+
+    def describe(self):
+        return f"local:{self.root}"
+
+
+class DriveBackend:
+    """
+    Google Drive folder (service account). Objects are flat files named by their
+    storage path; uploads are resumable and sent in UPLOAD_CHUNK_BYTES pieces.
+    """
+
+    def __init__(self, folder_id, service_account_json):
+        self.folder_id = folder_id
+        self._account_json = service_account_json
+        self._service = None
+        self._lock = threading.Lock()
+
+    @property
+    def service(self):
+        with self._lock:
+            if self._service is None:
+                info = json.loads(self._account_json)
+                creds = service_account.Credentials.from_service_account_info(info, scopes=DRIVE_SCOPES)
+                self._service = discovery.build("drive", "v3", credentials=creds, cache_discovery=False)
+            return self._service
+
+    def put(self, name, data):
+        media = gapi_http.MediaIoBaseUpload(io.BytesIO(data), mimetype="application/octet-stream",
+                                            chunksize=UPLOAD_CHUNK_BYTES, resumable=True)
+        request = self.service.files().create(
+            body={"name": name, "parents": [self.folder_id]}, media_body=media, fields="id"
+        )
+        response = None
+        while response is None:
+            # Each piece is retried with backoff; the upload resumes where it stopped
+            _, response = request.next_chunk(num_retries=UPLOAD_RETRIES)
+
+    def _find(self, name):
+        escaped = name.replace("\\", "\\\\").replace("'", "\\'")
+        result = self.service.files().list(
+            q=f"'{self.folder_id}' in parents and name = '{escaped}' and trashed = false",
+            fields="files(id)", pageSize=1,
+        ).execute(num_retries=UPLOAD_RETRIES)
+        files = result.get("files", [])
+        if not files:
+            raise FileNotFoundError(name)
+        return files[0]["id"]
+
+    def get(self, name):
+        buffer = io.BytesIO()
+        request = self.service.files().get_media(fileId=self._find(name))
+        downloader = gapi_http.MediaIoBaseDownload(buffer, request, chunksize=UPLOAD_CHUNK_BYTES)
+        done = False
+        while not done:
+            _, done = downloader.next_chunk(num_retries=UPLOAD_RETRIES)
+        return buffer.getvalue()
+
+    def list(self, prefix):
+        names, token = [], None
+        escaped = prefix.replace("'", "\\'")
+        while True:
+            result = self.service.files().list(
+                q=f"'{self.folder_id}' in parents and name contains '{escaped}/' and trashed = false",
+                fields="nextPageToken, files(name)", pageSize=1000, pageToken=token,
+            ).execute(num_retries=UPLOAD_RETRIES)
+            names += [f["name"] for f in result.get("files", []) if f["name"].startswith(prefix + "/")]
+            token = result.get("nextPageToken")
+            if not token:
+                return sorted(names)
+
+    def describe(self):
+        return f"drive:{self.folder_id}"
+
+
+def make_backend(choice=None):
+    """BACKUP_BACKEND=local:<dir> or drive (default when GOOGLE_DRIVE_FOLDER_ID is set); None if unconfigured."""
+    choice = choice or os.getenv("BACKUP_BACKEND", "")
+    if choice.startswith("local:"):
+        return LocalDirBackend(choice[len("local:"):])
+    folder_id = os.getenv("GOOGLE_DRIVE_FOLDER_ID")
+    account_json = os.getenv("GOOGLE_SERVICE_ACCOUNT_JSON")
+    if choice in ("", "drive") and folder_id and account_json:
+        return DriveBackend(folder_id, account_json)
+    return None
+
+
+# --- BACKUP / RESTORE ---
+
+class BackupManager:
+    """Backs up and restores files through a backend. Blocking; run it in a worker thread."""
+
+    def __init__(self, backend, full_every=FULL_SNAPSHOT_EVERY):
+        self.backend = backend
+        self.full_every = full_every
+        self._latest = {}  # file name -> latest manifest (fetched once, then kept current)
+        self._lock = threading.Lock()
+
+    def latest_manifest(self, name):
+        if name not in self._latest:
+            manifests = self.backend.list(f"manifests/{name}")
+            self._latest[name] = json.loads(self.backend.get(manifests[-1])) if manifests else None
+        return self._latest[name]
+
+    def backup_file(self, path):
+        """Backs up one file. Returns a stats dict (skipped when nothing changed)."""
+        name = os.path.basename(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        digest = hashlib.sha256(data).hexdigest()
+
+        with self._lock:
+            previous = self.latest_manifest(name)
+            if previous and previous["sha256"] == digest:
+                return {"file": name, "skipped": True}
+
+            count = (previous["count"] + 1) if previous else 1
+            full = previous is None or count % self.full_every == 0
+            known = {} if full else {c[0]: c for c in previous["chunks"]}
+
+            stamp = _stamp()
+            pack_name = f"packs/{name}/{stamp}.pack"
+            pack = io.BytesIO()
+            entries, new_chunks = [], {}
+            for chunk in split_chunks(data):
+                sha = hashlib.sha256(chunk).hexdigest()
+                if sha in known:
+                    entries.append(known[sha])
+                    continue
+                if sha not in new_chunks:
+                    compressed = zlib.compress(chunk, 9)
+                    new_chunks[sha] = [sha, pack_name, pack.tell(), len(compressed)]
+                    pack.write(compressed)
+                entries.append(new_chunks[sha])
+
+            manifest = {
+                "file": name, "created": stamp, "count": count, "full": full,
+                "size": len(data), "sha256": digest, "chunks": entries,
+            }
+            if new_chunks:
+                self.backend.put(pack_name, pack.getvalue())
+            self.backend.put(f"manifests/{name}/{stamp}.json", json.dumps(manifest, separators=(",", ":")).encode())
+            self._latest[name] = manifest
+
+        uploaded = pack.tell()
+        structured_log.info("backup", f"{name}: {len(new_chunks)}/{len(entries)} new chunks, "
+                            f"{uploaded / 1024:.1f} KB uploaded for {len(data) / 1024:.1f} KB "
+                            f"({'full' if full else 'incremental'})")
+        return {"file": name, "skipped": False, "full": full, "chunks": len(entries),
+                "new_chunks": len(new_chunks), "uploaded_bytes": uploaded, "size": len(data)}
+
+    def backup(self, paths):
+        results = []
+        for path in paths:
+            if path and os.path.exists(path):
+                results.append(self.backup_file(path))
+        return results
+
+    def restore(self, name, at=None):
+        """Reassembles a file from its latest manifest (or the newest at/before stamp `at`)."""
+        manifests = self.backend.list(f"manifests/{name}")
+        if at:
+            bound = _stamp_bound(at)
+            manifests = [m for m in manifests if os.path.basename(m)[:-5] <= bound]
+        if not manifests:
+            raise FileNotFoundError(f"No backups of {name}")
+        manifest = json.loads(self.backend.get(manifests[-1]))
+
+        packs = {}
+        parts = []
+        for sha, pack_name, offset, length in manifest["chunks"]:
+            if pack_name not in packs:
+                packs[pack_name] = self.backend.get(pack_name)
+            chunk = zlib.decompress(packs[pack_name][offset:offset + length])
+            if hashlib.sha256(chunk).hexdigest() != sha:
+                raise ValueError(f"Corrupt chunk {sha[:12]} in {pack_name}")
+            parts.append(chunk)
+        data = b"".join(parts)
+        if hashlib.sha256(data).hexdigest() != manifest["sha256"]:
+            raise ValueError(f"Restored {name} does not match its manifest checksum")
+        return data, manifest
+
+
+# --- RESTORE TOOL ---
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="List or restore state backups.")
+    parser.add_argument("command", choices=["list", "restore"])
+    parser.add_argument("--file", default="campaign_state.json", help="Backed-up file name")
+    parser.add_argument("--out", help="Where to write the restored file (default: ./<file>.restored)")
+    parser.add_argument("--at", help="Restore the newest backup at or before this stamp (e.g. 20260101T000000, or 20260101 for that whole day)")
+    parser.add_argument("--backend", help="local:<dir> or drive (default: BACKUP_BACKEND / Drive env vars)")
+    args = parser.parse_args(argv)
+
+    backend = make_backend(args.backend)
+    if backend is None:
+        print("No backup backend configured (set BACKUP_BACKEND or the Google Drive variables).")
+        return 1
+
+    if args.command == "list":
+        for manifest in backend.list(f"manifests/{args.file}"):
+            print(manifest)
+        return 0
+
+    data, manifest = BackupManager(backend).restore(args.file, at=args.at)
+    out = args.out or f"{args.file}.restored"
+    with open(out, "wb") as f:
+        f.write(data)
+    print(f"Restored {args.file} from {manifest['created']} ({len(data)} bytes, "
+          f"{len(manifest['chunks'])} chunks) to {out}")
+    return 0
+
+
+if __name__ == "__main__":
+    # Needs the .env for Drive credentials when run by hand
+    from dotenv import load_dotenv
+    load_dotenv()
+    sys.exit(main())
@@ -0,0 +1,492 @@
+import argparse
+import asyncio
+import base64
+import contextlib
+import hashlib
+import json
+import os
+import random
+import resource
+import sys
+import tempfile
+import threading
+import time
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from bench_message_packer import make_reply
+
+# Offline load test: drives main.on_message end-to-end (context build, cache
+# lookup, model rounds, tools, Discord send, save) against an in-process fake
+# Gemini HTTP server and fake Discord channels. No network, no API key.
+# Run: python bench_load.py --turns 3000 --channels 8 --players 4
+# Replaying a recorded cassette (see cassette.py) instead of the fake server
+# turns a production transcript into a regression benchmark:
+#   python bench_load.py --replay cassettes/latest --replay-timing 0.1
+
+# Real SDK + pooled client talk to this server via genai_client.BASE_URL, so the
+# HTTP layer is exercised too. Tool scripts: one entry per model round, each a
+# list of function calls. Weights pick a script per turn.
+TOOL_SCRIPTS = {
+    "plain": ([], 60),
+    "dice": ([["roll_dice"]], 25),
+    "combat": ([["start_combat", "roll_dice"], ["roll_dice"]], 10),
+    "illustrate": ([["illustrate_scene"]], 5),
+}
+TOOL_ARGS = {
+    "roll_dice": {"expression": "1d20+5"},
+    "start_combat": {"monster_name": "goblin"},
+    "illustrate_scene": {"prompt": "A moonlit tavern brawl", "style": "Cinematic Fantasy"},
+}
+CHARS_PER_TOKEN = 4
+PIXEL_PNG = base64.b64encode(b"\x89PNG\r\n\x1a\n" + b"\0" * 64).decode()
+
+
+class FakeGeminiServer:
+    """
+    Minimal Gemini REST server: generateContent (scripted function calls, then a
+    DM-style reply), countTokens, cachedContents, models.get and :predict.
+    Latency is slept in the handler thread, like a slow upstream.
+    """
+
+    def __init__(self, latency=0.05, jitter=0.02, reply_chars=900, cached_tokens=6000,
+                 scripts=TOOL_SCRIPTS, seed=7):
+        self.latency = latency
+        self.jitter = jitter
+        self.reply_chars = reply_chars
+        self.cached_tokens = cached_tokens
+        self.scripts = scripts
+        self.seed = seed
+        self.requests = {}
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._httpd = None
+        self._caches = {}
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._httpd.server_port}"
+
+    def start(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"  # Keep-alive, so the client pool matters
+            disable_nagle_algorithm = True  # Else delayed ACKs add ~40ms per response
+
+            def log_message(self, *args):
+                pass
+
+            def do_GET(self):
+                server._handle(self, "GET", None)
+
+            def do_POST(self):
+                length = int(self.headers.get("Content-Length", 0))
+                body = json.loads(self.rfile.read(length) or b"{}")
+                server._handle(self, "POST", body)
+
+        self._httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self._httpd.daemon_threads = True
+        threading.Thread(target=self._httpd.serve_forever, daemon=True).start()
+        return self
+
+    def stop(self):
+        if self._httpd:
+            self._httpd.shutdown()
+            self._httpd.server_close()
+
+    # --- REQUEST HANDLING ---
+
+    def _handle(self, handler, method, body):
+        path = handler.path.split("?")[0]
+        kind = self._kind(method, path)
+        with self._lock:
+            self.requests[kind] = self.requests.get(kind, 0) + 1
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        try:
+            if kind in ("generate", "predict"):
+                time.sleep(max(0.0, self.latency + random.uniform(-self.jitter, self.jitter)))
+            reply = getattr(self, f"_{kind}")(path, body)
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+        data = json.dumps(reply).encode()
+        handler.send_response(200)
+        handler.send_header("Content-Type", "application/json")
+        handler.send_header("Content-Length", str(len(data)))
+        handler.end_headers()
+        handler.wfile.write(data)
+
+    @staticmethod
+    def _kind(method, path):
+        if path.endswith(":generateContent"):
+            return "generate"
+        if path.endswith(":countTokens"):
+            return "count_tokens"
+        if path.endswith(":predict"):
+            return "predict"
+        if "cachedContents" in path:
+            return "list_caches" if method == "GET" else "create_cache"
+        return "get_model"
+
+    def _count_tokens(self, path, body):
+        return {"totalTokens": len(json.dumps(body)) // CHARS_PER_TOKEN}
+
+    def _list_caches(self, path, body):
+        return {"cachedContents": list(self._caches.values())}
+
+    def _create_cache(self, path, body):
+        name = f"cachedContents/bench{len(self._caches)}"
+        self._caches[name] = {"name": name, "displayName": body.get("displayName"),
+                              "model": body.get("model"), "expireTime": "2099-01-01T00:00:00Z"}
+        return self._caches[name]
+
+    def _get_model(self, path, body):
+        return {"name": path.split("/v1beta/")[-1]}
+
+    def _predict(self, path, body):
+        return {"predictions": [{"bytesBase64Encoded": PIXEL_PNG, "mimeType": "image/png"}]}
+
+    def _generate(self, path, body):
+        contents = body.get("contents", [])
+        first_text = "".join(p.get("text", "") for p in contents[0].get("parts", [])) if contents else ""
+        seed = int(hashlib.md5(f"{self.seed}:{first_text}".encode()).hexdigest()[:8], 16)
+        rng = random.Random(seed)
+        script = self._pick_script(rng)
+
+        # Which round are we on? Our own call ids come back in the echoed model turn.
+        step = 0
+        for content in contents:
+            for part in content.get("parts", []):
+                call_id = part.get("functionCall", {}).get("id", "")
+                if call_id.startswith("step-"):
+                    step = max(step, int(call_id.split("-")[1]) + 1)
+
+        if step < len(script):
+            parts = [{"functionCall": {"id": f"step-{step}-{i}", "name": name, "args": TOOL_ARGS.get(name, {})}}
+                     for i, name in enumerate(script[step])]
+            output_chars = 40 * len(parts)
+        else:
+            reply = make_reply(rng, int(self.reply_chars * rng.uniform(0.5, 1.5)))
+            parts = [{"text": reply}]
+            output_chars = len(reply)
+
+        prompt_tokens = len(json.dumps(contents)) // CHARS_PER_TOKEN
+        cached = self.cached_tokens if body.get("cachedContent") else 0
+        return {
+            "candidates": [{"content": {"role": "model", "parts": parts}, "finishReason": "STOP"}],
+            "usageMetadata": {
+                "promptTokenCount": prompt_tokens + cached,
+                "cachedContentTokenCount": cached,
+                "candidatesTokenCount": output_chars // CHARS_PER_TOKEN,
+            },
+        }
+
+    def _pick_script(self, rng):
+        names = list(self.scripts)
+        weights = [self.scripts[n][1] for n in names]
+        return self.scripts[rng.choices(names, weights)[0]][0]
+
+
+# --- FAKE DISCORD ---
+
+class FakeTyping:
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        return False
+
+
+class FakeChannel:
+    """Records what the bot sends; each send costs `send_latency` like a REST call."""
+
+    def __init__(self, channel_id, send_latency=0.01):
+        self.id = channel_id
+        self.send_latency = send_latency
+        self.messages = 0
+        self.embeds = 0
+        self.files = 0
+        self.chars = 0
+
+    async def send(self, content=None, embeds=None, embed=None, file=None):
+        await asyncio.sleep(self.send_latency)
+        self.messages += 1
+        embeds = embeds or ([embed] if embed else [])
+        self.embeds += len(embeds)
+        self.files += 1 if file else 0
+        self.chars += len(content or "") + sum(len(e.description or "") for e in embeds)
+
+    def typing(self):
+        return FakeTyping()
+
+
+class FakeAuthor:
+    bot = False
+    voice = None
+
+    def __init__(self, uid, name):
+        self.id = uid
+        self.display_name = name
+
+
+class FakeMessage:
+    def __init__(self, message_id, author, channel, content):
+        self.id = message_id
+        self.author = author
+        self.channel = channel
+        self.content = content
+
+
+PLAYER_LINES = [
+    "I draw my sword and step into the vault.",
+    "I try to charm the innkeeper into a discount.",
+    "Can I search the altar for hidden runes?",
+    "I cast a light spell and look around carefully.",
+    "I attack the nearest goblin!",
+    "We rest by the fire and talk about home.",
+]
+
+
+# --- MEASUREMENT ---
+
+def rss_bytes():
+    """Current RSS on Linux, else the peak (ru_maxrss)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+
+
+async def watch_loop(samples, memory, stop, interval=0.05):
+    """Event-loop lag: how late each `interval` sleep wakes up. Also samples RSS."""
+    loop = asyncio.get_running_loop()
+    ticks = 0
+    while not stop.is_set():
+        expected = loop.time() + interval
+        await asyncio.sleep(interval)
+        samples.append(max(0.0, loop.time() - expected))
+        ticks += 1
+        if ticks % 10 == 0:
+            memory.append(rss_bytes())
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+# --- RUN ---
+
+def run(turns=2000, channels=8, players=4, latency=0.05, jitter=0.02, reply_chars=900,
+        send_latency=0.01, think_time=0.0, discord_limits=False, seed=7, verbose=False,
+        replay=None, replay_timing="original", workers=0, typing=0.0):
+    """Runs the load test and returns the results dict (also printed by report())."""
+    if replay and workers:
+        raise ValueError("Replay serves calls from this process; run it without workers.")
+    os.environ["GEMINI_API_KEY"] = "offline-bench"  # Never send a real key anywhere
+    import main
+    import worker_pool
+    import metrics
+    import usage_tracker
+    import genai_client
+    import utils
+    import cassette
+    import turn_prewarm
+    import structured_log
+
+    server = replay_client = None
+    if replay:
+        replay_client = cassette.ReplayClient(replay, timing=replay_timing)
+    else:
+        server = FakeGeminiServer(latency=latency, jitter=jitter, reply_chars=reply_chars, seed=seed).start()
+    old_base_url, old_limiter, old_workers = genai_client.BASE_URL, utils.channel_limiter, main.workers
+    old_prewarmer, old_log_dir = main.turn_prewarmer, structured_log.LOG_DIR
+    old_state_file, old_usage_path = main.STATE_FILE, usage_tracker.persist_path
+    old_session_paths = main.creation_sessions.persist_path, main.campaign_sessions.persist_path
+    tmp = tempfile.TemporaryDirectory()
+    try:
+        if replay_client:
+            genai_client.set_client(replay_client)
+        else:
+            genai_client.BASE_URL = server.base_url
+            genai_client.reset_client()
+        if not discord_limits:
+            utils.channel_limiter = utils.ChannelRateLimiter(per=0)
+
+        main.STATE_FILE = os.path.join(tmp.name, "campaign_state.json")
+        structured_log.LOG_DIR = os.path.join(tmp.name, "logs")
+        main.creation_sessions.persist_path = None
+        main.campaign_sessions.persist_path = None
+        usage_tracker.persist_path = None
+        main.load_data()
+        main.chat_history.clear()
+        main.players.clear()
+        metrics.reset()
+        usage_tracker.reset()
+        # Bench players type faster than people, so no per-channel rate limit here
+        main.turn_prewarmer = turn_prewarm.TurnPrewarmer(main.dm_turn.prepare_turn, min_interval=0)
+
+        fake_channels = [FakeChannel(1000 + c, send_latency) for c in range(channels)]
+        authors = []
+        for c in range(channels):
+            for p in range(players):
+                uid = 10_000 + c * players + p
+                authors.append((c, FakeAuthor(uid, f"Hero{uid}")))
+                main.players[str(uid)] = {"name": f"Hero{uid}", "hp": 20, "gold": 10, "inventory": []}
+
+        rng = random.Random(seed)
+        per_channel = [turns // channels + (1 if c < turns % channels else 0) for c in range(channels)]
+        lag, memory = [], []
+        errors = []
+
+        async def drive_channel(c):
+            channel = fake_channels[c]
+            mine = [a for ch, a in authors if ch == c]
+            for n in range(per_channel[c]):
+                author = mine[n % len(mine)]
+                message = FakeMessage(c * 1_000_000 + n, author, channel, rng.choice(PLAYER_LINES))
+                if typing:
+                    # The player types for a while before the message arrives
+                    await main.on_typing(channel, author, None)
+                    await asyncio.sleep(typing)
+                try:
+                    await main.on_message(message)
+                except Exception as e:
+                    errors.append(repr(e))
+                if think_time:
+                    await asyncio.sleep(think_time)
+
+        async def drive():
+            await main.build_story_index()
+            stop = asyncio.Event()
+            watcher = asyncio.create_task(watch_loop(lag, memory, stop))
+            started = time.perf_counter()
+            await asyncio.gather(*(drive_channel(c) for c in range(channels)))
+            elapsed = time.perf_counter() - started
+            stop.set()
+            await watcher
+            return elapsed
+
+        rss_start = rss_bytes()
+        sink = contextlib.nullcontext() if verbose else contextlib.redirect_stdout(open(os.devnull, "w"))
+        with sink:
+            if workers:
+                # Forked here so the workers see the fake server and the quiet stdout
+                main.workers = worker_pool.WorkerPool(workers)
+                main.workers.start()
+            elapsed = asyncio.run(drive())
+        memory.append(rss_bytes())
+
+        failed_turns = sum(1 for line in main.chat_history if line.startswith("DM: ⚠️"))
+        stages = metrics.summary()
+        result = {
+            "turns": turns,
+            "channels": channels,
+            "players": channels * players,
+            "workers": workers,
+            "elapsed_s": elapsed,
+            "turns_per_s": turns / elapsed if elapsed else 0.0,
+            "completed_turns": stages.get("turn_total", {}).get("count", 0),
+            "failed_turns": failed_turns,
+            "errors": errors[:5],
+            "stages": stages,
+            "loop_lag": {"p50": percentile(lag, 0.5), "p99": percentile(lag, 0.99), "max": max(lag, default=0.0)},
+            "memory": {"rss_start": rss_start, "rss_peak": max(memory), "rss_end": memory[-1]},
+            "history_lines": len(main.chat_history),
+            "state_file_bytes": os.path.getsize(main.STATE_FILE) if os.path.exists(main.STATE_FILE) else 0,
+            "discord": {
+                "messages": sum(ch.messages for ch in fake_channels),
+                "embeds": sum(ch.embeds for ch in fake_channels),
+                "files": sum(ch.files for ch in fake_channels),
+            },
+            "model_requests": replay_client.stats() if replay_client else dict(server.requests),
+            "peak_model_concurrency": 0 if replay_client else server.peak_in_flight,
+            "estimated_cost_usd": sum(t["cost"] for t in usage_tracker.breakdown("by_command").values()),
+            "prewarm": main.turn_prewarmer.stats(),
+            "logging": structured_log.stats(),
+        }
+        return result
+    finally:
+        if workers and main.workers:
+            main.workers.shutdown()
+        main.workers = old_workers
+        main.turn_prewarmer = old_prewarmer
+        structured_log.flush()
+        structured_log.LOG_DIR = old_log_dir
+        main.STATE_FILE, usage_tracker.persist_path = old_state_file, old_usage_path
+        main.creation_sessions.persist_path, main.campaign_sessions.persist_path = old_session_paths
+        genai_client.BASE_URL = old_base_url
+        genai_client.reset_client()
+        utils.channel_limiter = old_limiter
+        if server:
+            server.stop()
+        tmp.cleanup()
+
+
+def report(result):
+    mb = 1024 * 1024
+    print(f"Turns: {result['completed_turns']}/{result['turns']} over {result['channels']} channels, "
+          f"{result['players']} players, {result['failed_turns']} failed"
+          + (f" ({result['workers']} worker processes)" if result["workers"] else ""))
+    print(f"Throughput: {result['turns_per_s']:.1f} turns/s ({result['elapsed_s']:.1f}s)")
+    print("Stage latency (ms):")
+    for stage, s in sorted(result["stages"].items(), key=lambda kv: kv[1]["p95"], reverse=True):
+        print(f"  {stage:<24} p50 {s['p50'] * 1000:8.1f}  p95 {s['p95'] * 1000:8.1f}  "
+              f"p99 {s['p99'] * 1000:8.1f}  (n={s['count']})")
+    lag = result["loop_lag"]
+    print(f"Event-loop lag (ms): p50 {lag['p50'] * 1000:.1f}  p99 {lag['p99'] * 1000:.1f}  max {lag['max'] * 1000:.1f}")
+    mem = result["memory"]
+    print(f"Memory (RSS MB): start {mem['rss_start'] / mb:.1f}  peak {mem['rss_peak'] / mb:.1f}  end {mem['rss_end'] / mb:.1f}")
+    print(f"History: {result['history_lines']} lines, state file {result['state_file_bytes'] / mb:.1f} MB")
+    d = result["discord"]
+    print(f"Discord: {d['messages']} messages, {d['embeds']} embeds, {d['files']} files")
+    print(f"Model: {result['model_requests']} (peak {result['peak_model_concurrency']} in flight), "
+          f"~${result['estimated_cost_usd']:.2f} estimated")
+    logs = result["logging"]
+    print(f"Logging: {logs['logged']} records, {logs['dropped']} dropped, "
+          f"overhead per message p50 {logs['per_turn_p50_ms']:.3f}ms p99 {logs['per_turn_p99_ms']:.3f}ms")
+    p = result["prewarm"]
+    if p["prewarms"]:
+        print(f"Prewarm: {p['hit_rate']:.0%} hit rate, ~{p['saved_per_hit_ms']:.1f}ms saved per hit, "
+              f"{p['stale']} stale, {p['cancelled']} cancelled, {p['rate_limited']} rate-limited")
+    if result["errors"]:
+        print(f"Errors: {result['errors']}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Offline load test for the DM turn pipeline.")
+    parser.add_argument("--turns", type=int, default=2000)
+    parser.add_argument("--channels", type=int, default=8)
+    parser.add_argument("--players", type=int, default=4, help="Players per channel")
+    parser.add_argument("--latency", type=float, default=0.05, help="Fake model latency (s)")
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--reply-chars", type=int, default=900)
+    parser.add_argument("--send-latency", type=float, default=0.01, help="Fake Discord send latency (s)")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Pause between a channel's turns (s)")
+    parser.add_argument("--discord-limits", action="store_true", help="Keep the real per-channel send limiter")
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--json", help="Also write the results here")
+    parser.add_argument("--verbose", action="store_true", help="Show the bot's own logs")
+    parser.add_argument("--replay", help="Serve model calls from this cassette instead of the fake server")
+    parser.add_argument("--replay-timing", default="original", help="original, none, or a scale like 0.1")
+    parser.add_argument("--workers", type=int, default=0, help="Play turns in this many worker processes")
+    parser.add_argument("--typing", type=float, default=0.0,
+                        help="Send a typing event this long before each message (s), to exercise prewarming")
+    args = parser.parse_args()
+
+    result = run(turns=args.turns, channels=args.channels, players=args.players, latency=args.latency,
+                 jitter=args.jitter, reply_chars=args.reply_chars, send_latency=args.send_latency,
+                 think_time=args.think_time, discord_limits=args.discord_limits, seed=args.seed,
+                 verbose=args.verbose, replay=args.replay, replay_timing=args.replay_timing, workers=args.workers,
+                 typing=args.typing)
+    report(result)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(result, f, indent=2)
@@ -0,0 +1,68 @@
+import math
+import random
+
+import utils
+
+# Messages-per-reply on a corpus of long DM-style replies: the old fixed
+# 1900-char slicing vs. the markdown-aware embed packer in utils.
+# Run: python bench_message_packer.py
+
+OLD_CHUNK_SIZE = 1900
+
+PHRASES = [
+    "*The torchlight gutters as you step into the vault.*",
+    "**Roll Perception DC 15.**",
+    "The air smells of jasmine and old iron.",
+    "Lady Seraphine's gaze lingers on you a heartbeat too long.",
+    "(Tip: Type !narrate to hear this scene!)",
+    "`1d20+5 = 18`",
+    "**The goblin's blade finds only air** as you twist aside.",
+    "Somewhere below, chains rattle.",
+]
+
+def make_reply(rng, target_len):
+    paragraphs = []
+    length = 0
+    while length < target_len:
+        if rng.random() < 0.15:
+            # A long bold passage spanning many sentences (no nested markup)
+            plain = [p for p in PHRASES if "*" not in p and "`" not in p]
+            sentences = "**" + " ".join(rng.choice(plain) for _ in range(rng.randint(20, 60))) + "**"
+        else:
+            sentences = " ".join(rng.choice(PHRASES) for _ in range(rng.randint(3, 9)))
+        paragraphs.append(sentences)
+        length += len(sentences) + 2
+    if rng.random() < 0.3:
+        paragraphs.append("* Option one\n* Option two\n* Option three")
+    return "\n\n".join(paragraphs)
+
+def old_message_count(text):
+    return max(1, math.ceil(len(text) / OLD_CHUNK_SIZE))
+
+def broken_markdown(text):
+    """Pieces whose markdown spans don't close within the piece."""
+    return 1 if utils._scan_markdown(text, []) else 0
+
+def run(samples=500, seed=7):
+    rng = random.Random(seed)
+    corpus = [make_reply(rng, rng.choice([1500, 2500, 4000, 6000, 9000, 14000])) for _ in range(samples)]
+
+    old_total = old_broken = new_total = new_broken = 0
+    for reply in corpus:
+        old_pieces = [reply[i:i + OLD_CHUNK_SIZE] for i in range(0, len(reply), OLD_CHUNK_SIZE)]
+        old_total += len(old_pieces)
+        old_broken += sum(broken_markdown(p) for p in old_pieces)
+
+        packed = utils.pack_reply(reply)
+        new_total += len(packed)
+        for message in packed:
+            for piece in message.get("embeds", [message.get("content", "")]):
+                new_broken += broken_markdown(piece)
+
+    avg_len = sum(len(r) for r in corpus) / len(corpus)
+    print(f"Corpus: {samples} replies, avg {avg_len:.0f} chars")
+    print(f"Old (1900-char slices): {old_total / samples:.2f} messages/reply, {old_broken} pieces with broken markdown")
+    print(f"New (markdown packer):  {new_total / samples:.2f} messages/reply, {new_broken} pieces with broken markdown")
+
+if __name__ == "__main__":
+    run()
@@ -1,36 +1,66 @@
 import os
+import time
 import hashlib
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+from datetime import datetime, timezone
+from lazy_imports import LazyModule
+import genai_client
+import structured_log
+
+types = LazyModule("google.genai.types")
 
-load_dotenv()
 # client = genai.Client(api_key=os.getenv("GEMINI_API_KEY")) # REMOVED global init
 
 MODEL_ID = 'gemini-3-flash-preview'
 
-# Singleton Client
-_client_instance = None
+# Shared, pooled client (see genai_client.py)
+get_client = genai_client.get_client
+
+# Caches are created with a 1h TTL. Remember names we've resolved for a bit less
+# than that so the hot path doesn't list every cache on every message.
+CACHE_TTL_SECONDS = 3600
+_KNOWN_CACHE_SECONDS = 3000
+_known_caches = {}  # display_name -> (cache_name, trust_until monotonic)
+
+def _remember(display_name, cache_name, expire_time=None):
+    trust_for = _KNOWN_CACHE_SECONDS
+    if expire_time is not None:
+        # Stop trusting an existing cache a few minutes before the server drops it
+        remaining = (expire_time - datetime.now(timezone.utc)).total_seconds() - 300
+        trust_for = min(trust_for, remaining)
+    if trust_for > 0:
+        _known_caches[display_name] = (cache_name, time.monotonic() + trust_for)
 
-def get_client():
-    global _client_instance
-    if _client_instance is None:
-        _client_instance = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _client_instance
+def forget(cache_name):
+    """Stops trusting a cache name (a call using it failed); the next lookup lists or creates again."""
+    for display_name, (name, _) in list(_known_caches.items()):
+        if name == cache_name:
+            del _known_caches[display_name]
 
-def get_cache_version(text):
-    """Creates a unique hash for the prompt text."""
+def is_cache_error(error):
+    """True when a request failed because its cached_content is gone or no longer valid."""
+    return getattr(error, "code", None) in (400, 403, 404) and "cache" in str(error).lower()
+
+def get_cache_version(text, tools_list=None):
+    """Creates a unique hash for the prompt text (and the tools baked into the cache)."""
+    names = sorted(f.name for tool in tools_list or () for f in tool.function_declarations or ())
+    if names:
+        text += "\n" + ",".join(names)  # A bundle that gains a tool gets a fresh cache
     return hashlib.md5(text.encode()).hexdigest()[:8]
 
+def _find_cache(display_name):
+    client = get_client()
+    for c in client.caches.list():
+        if c.display_name == display_name:
+            _remember(display_name, c.name, c.expire_time)
+            return c
+    return None
+
 def get_active_cache(display_name):
     try:
-        client = get_client()
-        for c in client.caches.list():
-            if c.display_name == display_name:
-                return c.name
-        return None
+        c = _find_cache(display_name)
+        return c.name if c else None
     except Exception as e:
-        print(f"[CACHE] Error listing: {e}")
+        structured_log.warn("cache", f"Error listing: {e}")
         return None
 
 def create_cache(content_text, tools_list, display_name):
@@ -42,17 +72,17 @@ def create_cache(content_text, tools_list, display_name):
         try:
              count_resp = client.models.count_tokens(model=MODEL_ID, contents=content_text)
              token_count = count_resp.total_tokens
-             print(f"[CACHE] System Prompt Tokens: {token_count}")
+             structured_log.info("cache", f"System Prompt Tokens: {token_count}")
              
              if token_count < 2100:
                  # Calculate deficit
                  needed = 2200 - token_count # Aim for 2200 to be safe
-                 print(f"[CACHE] Padding with ~{needed} tokens to meet requirements...")
+                 structured_log.info("cache", f"Padding with ~{needed} tokens to meet requirements...")
                  # 1 token is roughly 4 chars, but " a " is 1 token.
                  padding = " a " * needed 
                  content_text += f"\n\n<system_padding_ignore_this>\n{padding}\n</system_padding_ignore_this>"
         except Exception as e:
-            print(f"[CACHE] Padding Check Failed (skipping padding): {e}")
+            structured_log.warn("cache", f"Padding Check Failed (skipping padding): {e}")
 
         # We include tools in the cache creation for better performance
         cache = client.caches.create(
@@ -61,22 +91,59 @@ def create_cache(content_text, tools_list, display_name):
                 display_name=display_name,
                 system_instruction=types.Part(text=content_text),
                 tools=tools_list, 
-                ttl="3600s" 
+                ttl=f"{CACHE_TTL_SECONDS}s" 
             )
         )
-        print(f"[CACHE] Created: {display_name}")
+        structured_log.info("cache", f"Created: {display_name}")
+        _remember(display_name, cache.name)
         return cache.name
     except Exception as e:
-        print(f"[CACHE] Creation failed: {e}")
+        structured_log.warn("cache", f"Creation failed: {e}")
         return None
 
-def get_or_create_cache(system_text, tools_list):
+def get_or_create_cache(system_text, tools_list, prefix="DM_Cache"):
     # Unique name based on the prompt content
-    version = get_cache_version(system_text)
-    full_display_name = f"DM_Cache_v_{version}"
+    version = get_cache_version(system_text, tools_list)
+    full_display_name = f"{prefix}_v_{version}"
+
+    known = _known_caches.get(full_display_name)
+    if known and time.monotonic() < known[1]:
+        return known[0]
     
     existing_name = get_active_cache(full_display_name)
     if existing_name:
         return existing_name
     
     return create_cache(system_text, tools_list, full_display_name)
+
+# --- KEEPING BUNDLE CACHES WARM ---
+# Each distinct tool bundle has its own cache: the bundle's tool names are part
+# of the cache version, so modes sharing a bundle share one cache. They are all
+# created at startup, and while the table is active a background task calls
+# keep_warm() so a mode switch never has to create a cache mid-turn.
+
+REFRESH_BELOW_SECONDS = 1200
+
+def keep_warm(system_text, tools_list, prefix="DM_Cache"):
+    """Makes sure the cache exists with a good while left; extends its TTL or creates it. Blocking."""
+    full_display_name = f"{prefix}_v_{get_cache_version(system_text, tools_list)}"
+    try:
+        c = _find_cache(full_display_name)
+    except Exception as e:
+        structured_log.warn("cache", f"Error listing: {e}")
+        return None
+    if c is None:
+        return create_cache(system_text, tools_list, full_display_name)
+    remaining = (c.expire_time - datetime.now(timezone.utc)).total_seconds() if c.expire_time else 0
+    if remaining >= REFRESH_BELOW_SECONDS:
+        return c.name
+    try:
+        updated = get_client().caches.update(
+            name=c.name, config=types.UpdateCachedContentConfig(ttl=f"{CACHE_TTL_SECONDS}s")
+        )
+        _remember(full_display_name, c.name, updated.expire_time)
+        structured_log.info("cache", f"Extended: {full_display_name}")
+        return c.name
+    except Exception as e:
+        structured_log.warn("cache", f"Extend failed ({e}); creating a fresh one.")
+        return create_cache(system_text, tools_list, full_display_name)
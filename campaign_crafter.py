@@ -1,8 +1,8 @@
-def get_campaign_prompt(chat_history_str):
+def get_campaign_system_prompt():
     """
-    Constructs the system prompt for the Campaign Architect AI.
+    The static World Weaver persona (cacheable).
     """
-    system_instruction = """
+    return """
 ### IDENTITY
 You are the "World Weaver," a grand and poetic architect of worlds.
 You are here to help the user design a custom D&D 5e campaign setting.
@@ -25,8 +25,14 @@ Gather the following 4 pillars to finalize the campaign:
 - Call `finalize_campaign` with a consolidated summary of the discussion.
 - Ensure the `premise` argument is a punchy, exciting paragraph the DM can use to start the game immediately.
 """
+
+def get_campaign_turn_prompt(chat_history_str):
+    """The per-message part: just the conversation so far."""
     return (
-        f"{system_instruction}\n\n"
         f"=== CONVERSATION HISTORY ===\n{chat_history_str}\n\n"
         f"=== ARCHITECT RESPONSE ==="
     )
+
+def get_campaign_prompt(chat_history_str):
+    """Backwards compatibility wrapper (Non-Cached version)."""
+    return get_campaign_system_prompt() + "\n\n" + get_campaign_turn_prompt(chat_history_str)
@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import zlib
+import enum
+import hashlib
+import datetime
+import threading
+from collections import deque
+from lazy_imports import LazyModule
+
+import structured_log
+
+types = LazyModule("google.genai.types")
+
+# Record/replay for every model call (DM text, Imagen, avatars, TTS) made through
+# the shared client. A cassette is a directory:
+#   calls.jsonl  one line per call: method, request, response (or error), duration
+#   blobs/       bytes payloads (audio, images) stored once by sha256, zlib-compressed
+# Enable with CASSETTE_MODE=record|replay and CASSETTE_DIR (see genai_client.py).
+
+# Replay timing: "original" sleeps each call's recorded duration, "none" returns
+# at once, a number scales it (0.1 = ten times faster).
+DEFAULT_TIMING = os.getenv("CASSETTE_TIMING", "original")
+
+RECORDED_METHODS = {
+    "models": ("generate_content", "generate_images", "count_tokens", "get"),
+    "caches": ("list", "create", "update"),  # update: keep_warm extending a cache's TTL
+}
+
+
+class CassetteMiss(Exception):
+    """Replay has nothing recorded for this call."""
+
+
+class ReplayedError(Exception):
+    """An API error captured while recording, raised again on replay."""
+
+    def __init__(self, message, code=None, status=None, original_type=None):
+        super().__init__(message)
+        self.code = code
+        self.status = status
+        self.original_type = original_type
+
+
+def parse_timing(timing):
+    if timing in (None, "", "original"):
+        return 1.0
+    if timing == "none":
+        return 0.0
+    return float(timing)
+
+
+class Cassette:
+    """The on-disk store shared by the recording and replaying clients."""
+
+    def __init__(self, path):
+        self.path = path
+        self.calls_path = os.path.join(path, "calls.jsonl")
+        self.blobs_path = os.path.join(path, "blobs")
+        self._lock = threading.Lock()
+
+    # --- BLOBS ---
+
+    def put_blob(self, data):
+        digest = hashlib.sha256(data).hexdigest()
+        blob_path = os.path.join(self.blobs_path, digest[:2], digest)
+        if not os.path.exists(blob_path):
+            os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+            tmp_path = f"{blob_path}.{threading.get_ident()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(zlib.compress(data, 6))
+            os.replace(tmp_path, blob_path)
+        return digest
+
+    def get_blob(self, digest):
+        with open(os.path.join(self.blobs_path, digest[:2], digest), "rb") as f:
+            return zlib.decompress(f.read())
+
+    # --- ENCODING ---
+
+    def encode(self, value):
+        """JSON-ready copy of a request/response; bytes go to the blob store."""
+        if hasattr(value, "model_dump"):
+            value = value.model_dump(exclude_none=True, exclude={"sdk_http_response"})
+        if isinstance(value, (bytes, bytearray)):
+            return {"$blob": self.put_blob(bytes(value))}
+        if isinstance(value, dict):
+            return {str(k): self.encode(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple)):
+            return [self.encode(v) for v in value]
+        if isinstance(value, enum.Enum):
+            return value.value
+        if isinstance(value, (datetime.datetime, datetime.date)):
+            return value.isoformat()
+        if value is None or isinstance(value, (str, int, float, bool)):
+            return value
+        return repr(value)
+
+    def decode(self, value):
+        if isinstance(value, dict):
+            if set(value) == {"$blob"}:
+                return self.get_blob(value["$blob"])
+            return {k: self.decode(v) for k, v in value.items()}
+        if isinstance(value, list):
+            return [self.decode(v) for v in value]
+        return value
+
+    @staticmethod
+    def request_key(method, encoded_request):
+        canonical = json.dumps([method, encoded_request], sort_keys=True, separators=(",", ":"))
+        return hashlib.sha256(canonical.encode()).hexdigest()[:16]
+
+    # --- CALL LOG ---
+
+    def append(self, entry):
+        line = json.dumps(entry, separators=(",", ":"))
+        with self._lock:
+            os.makedirs(self.path, exist_ok=True)
+            with open(self.calls_path, "a") as f:
+                f.write(line + "\n")
+
+    def entries(self):
+        if not os.path.exists(self.calls_path):
+            return []
+        with open(self.calls_path) as f:
+            return [json.loads(line) for line in f if line.strip()]
+
+
+def _response_type(response):
+    if isinstance(response, list):
+        return "list:" + (type(response[0]).__name__ if response else "")
+    return type(response).__name__
+
+
+def _build_response(response_type, data):
+    if response_type.startswith("list:"):
+        item_type = response_type[5:]
+        return [getattr(types, item_type).model_validate(item) for item in data] if item_type else []
+    return getattr(types, response_type).model_validate(data)
+
+
+class _Namespace:
+    """Stands in for client.models / client.caches, routing each call through `call`."""
+
+    def __init__(self, name, call):
+        self._name = name
+        self._call = call
+
+    def __getattr__(self, attr):
+        if attr not in RECORDED_METHODS.get(self._name, ()):
+            raise AttributeError(f"cassette client does not support {self._name}.{attr}")
+        method = f"{self._name}.{attr}"
+        return lambda **kwargs: self._call(method, kwargs)
+
+
+# --- RECORD ---
+
+class RecordingClient:
+    """Wraps a real genai.Client; every call is passed through and written to the cassette."""
+
+    def __init__(self, client, path):
+        self._client = client
+        self.cassette = Cassette(path)
+        self._started = time.monotonic()
+        self._seq = 0
+        self._seq_lock = threading.Lock()
+        self.models = _Namespace("models", self._call)
+        self.caches = _Namespace("caches", self._call)
+        structured_log.info("cassette", f"Recording to {path}")
+
+    def _call(self, method, kwargs):
+        namespace, attr = method.split(".")
+        real = getattr(getattr(self._client, namespace), attr)
+        with self._seq_lock:
+            seq = self._seq
+            self._seq += 1
+
+        started = time.monotonic()
+        entry = {"seq": seq, "method": method, "at": round(started - self._started, 4)}
+        try:
+            response = real(**kwargs)
+            if method == "caches.list":
+                response = list(response)  # Pager -> plain list; iterating it is all we do
+        except Exception as e:
+            entry["error"] = {"type": type(e).__name__, "message": str(e),
+                              "code": getattr(e, "code", None), "status": getattr(e, "status", None)}
+            response = None
+            raise
+        finally:
+            entry["duration"] = round(time.monotonic() - started, 4)
+            try:
+                entry["request"] = self.cassette.encode(kwargs)
+                entry["key"] = Cassette.request_key(method, entry["request"])
+                if "error" not in entry:
+                    entry["response_type"] = _response_type(response)
+                    entry["response"] = self.cassette.encode(response)
+                self.cassette.append(entry)
+            except Exception as record_error:
+                # Never let recording break the live call
+                structured_log.warn("cassette", f"Could not record {method}: {record_error}")
+        return response
+
+
+# --- REPLAY ---
+
+class ReplayClient:
+    """
+    Serves recorded responses without touching the network. A call gets the next
+    unused recording with the same request; if the request changed (e.g. a prompt
+    edit), it gets the next unused recording of the same method instead.
+    """
+
+    def __init__(self, path, timing=DEFAULT_TIMING, sleep=time.sleep):
+        self.cassette = Cassette(path)
+        self.time_scale = parse_timing(timing)
+        self._sleep = sleep
+        self._lock = threading.Lock()
+        self._by_key = {}
+        self._by_method = {}
+        self._used = set()
+        self._last = {}  # (method, key) -> entry served most recently
+        self.hits = 0
+        self.fallbacks = 0
+        self.misses = 0
+        for entry in sorted(self.cassette.entries(), key=lambda e: e["seq"]):
+            self._by_key.setdefault((entry["method"], entry["key"]), deque()).append(entry)
+            self._by_method.setdefault(entry["method"], deque()).append(entry)
+        self.models = _Namespace("models", self._call)
+        self.caches = _Namespace("caches", self._call)
+        structured_log.info("cassette", f"Replaying {sum(len(q) for q in self._by_method.values())} call(s) from {path}")
+
+    def _next_unused(self, queue):
+        while queue and queue[0]["seq"] in self._used:
+            queue.popleft()
+        return queue[0] if queue else None
+
+    def _pick(self, method, key):
+        with self._lock:
+            entry = self._next_unused(self._by_key.get((method, key), deque()))
+            if entry:
+                self.hits += 1
+            else:
+                entry = self._next_unused(self._by_method.get(method, deque()))
+                if entry:
+                    self.fallbacks += 1
+                elif (method, key) in self._last:
+                    # Identical repeat past the end of the recording (e.g. models.get)
+                    self.hits += 1
+                    return self._last[(method, key)]
+                else:
+                    self.misses += 1
+                    return None
+            self._used.add(entry["seq"])
+            self._last[(method, key)] = entry
+            return entry
+
+    def _call(self, method, kwargs):
+        key = Cassette.request_key(method, self.cassette.encode(kwargs))
+        entry = self._pick(method, key)
+        if entry is None:
+            raise CassetteMiss(f"No recorded {method} left to replay")
+        if self.time_scale:
+            self._sleep(entry["duration"] * self.time_scale)
+        if "error" in entry:
+            error = entry["error"]
+            raise ReplayedError(error["message"], error.get("code"), error.get("status"), error.get("type"))
+        return _build_response(entry["response_type"], self.cassette.decode(entry["response"]))
+
+    def stats(self):
+        return {"hits": self.hits, "fallbacks": self.fallbacks, "misses": self.misses}
+
+
+# --- INSPECTION ---
+
+def summarize(path):
+    """Per-method call counts, recorded latency and blob size for one cassette."""
+    cassette = Cassette(path)
+    methods = {}
+    for entry in cassette.entries():
+        m = methods.setdefault(entry["method"], {"calls": 0, "errors": 0, "durations": []})
+        m["calls"] += 1
+        m["errors"] += 1 if "error" in entry else 0
+        m["durations"].append(entry["duration"])
+    blob_bytes = 0
+    for root, _, files in os.walk(cassette.blobs_path):
+        blob_bytes += sum(os.path.getsize(os.path.join(root, f)) for f in files)
+    return methods, blob_bytes
+
+
+if __name__ == "__main__":
+    # python cassette.py <cassette_dir>
+    if len(sys.argv) != 2:
+        print("Usage: python cassette.py <cassette_dir>")
+        sys.exit(1)
+    methods, blob_bytes = summarize(sys.argv[1])
+    for method, m in sorted(methods.items()):
+        durations = sorted(m["durations"])
+        p95 = durations[min(len(durations) - 1, int(0.95 * len(durations)))]
+        print(f"{method:<26} {m['calls']:>6} calls  {m['errors']:>4} errors  "
+              f"total {sum(durations):8.1f}s  p95 {p95 * 1000:7.0f}ms")
+    print(f"Blobs: {blob_bytes / 1024:.0f} KB (compressed)")
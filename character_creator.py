@@ -1,8 +1,8 @@
 import json
 
-def get_creation_prompt(chat_history_str, rules_json_str):
+def get_creation_system_prompt(rules_json_str):
     """
-    Constructs the system prompt for the Character Creation Consultant.
+    The static Consultant persona plus the rules payload (cacheable).
     """
     system_instruction = """
 ### IDENTITY
@@ -33,9 +33,15 @@ Gather the following 5 pieces of data to finalize the character:
 
 ### AVAILABLE RULES (JSON)
 """
+    return f"{system_instruction}\n{rules_json_str}"
+
+def get_creation_turn_prompt(chat_history_str):
+    """The per-message part: just the conversation so far."""
     return (
-        f"{system_instruction}\n"
-        f"{rules_json_str}\n\n"
         f"=== CONVERSATION HISTORY ===\n{chat_history_str}\n\n"
         f"=== CONSULTANT RESPONSE ==="
     )
+
+def get_creation_prompt(chat_history_str, rules_json_str):
+    """Backwards compatibility wrapper (Non-Cached version)."""
+    return get_creation_system_prompt(rules_json_str) + "\n\n" + get_creation_turn_prompt(chat_history_str)
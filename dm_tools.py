@@ -0,0 +1,186 @@
+# dm_tools.py
+# Tool declarations and generation configs for the DM.
+# Kept out of main.py so the heavy google.genai types only load on first use.
+
+from google.genai import types
+
+# --- TOOL DEFINITIONS ---
+
+dice_tool = types.Tool(
+    function_declarations=[
+        types.FunctionDeclaration(
+            name="roll_dice",
+            description="Rolls dice. Use this for combat, checks, or random events.",
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "expression": types.Schema(type=types.Type.STRING, description="Dice expression (e.g. '1d20+5')")
+                },
+                required=["expression"]
+            )
+        )
+    ]
+)
+
+combat_tool = types.Tool(
+    function_declarations=[
+        types.FunctionDeclaration(
+            name="start_combat",
+            description="Initiates combat. Returns stats/initiatives.",
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "monster_name": types.Schema(type=types.Type.STRING, description="Name of monster")
+                },
+                required=["monster_name"]
+            )
+        )
+    ]
+)
+
+# NEW: Autonomous Illustration Tool
+illustrate_tool = types.Tool(
+    function_declarations=[
+        types.FunctionDeclaration(
+            name="illustrate_scene",
+            description="AUTONOMOUSLY generate an image of the current scene. Use ONLY when a moment is visually spectacular, dramatic, or emotional. Do not use for simple dialogue.",
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "prompt": types.Schema(type=types.Type.STRING, description="Detailed visual description (lighting, mood, subject)."),
+                    "style": types.Schema(type=types.Type.STRING, description="Art style (e.g. 'Oil Painting', 'Dark Fantasy', 'Watercolor').")
+                },
+                required=["prompt"]
+            )
+        )
+    ]
+)
+
+gameplay_tool = types.Tool(
+    function_declarations=[
+        types.FunctionDeclaration(
+            name="update_quest",
+            description="Manage quests (ADD, COMPLETE, FAIL).",
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "action": types.Schema(type=types.Type.STRING),
+                    "quest_name": types.Schema(type=types.Type.STRING),
+                    "status": types.Schema(type=types.Type.STRING)
+                },
+                required=["action", "quest_name"]
+            )
+        ),
+        types.FunctionDeclaration(
+            name="add_loot",
+            description="Add item to inventory.",
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "item_name": types.Schema(type=types.Type.STRING),
+                    "quantity": types.Schema(type=types.Type.INTEGER)
+                },
+                required=["item_name"]
+            )
+        ),
+        types.FunctionDeclaration(
+            name="update_relationship",
+            description="Update NPC affection.",
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "npc_name": types.Schema(type=types.Type.STRING),
+                    "change": types.Schema(type=types.Type.INTEGER),
+                    "reason": types.Schema(type=types.Type.STRING)
+                },
+                required=["npc_name", "change"]
+            )
+        )
+    ]
+)
+
+economy_tool = types.Tool(
+    function_declarations=[
+        types.FunctionDeclaration(
+            name="update_inventory_gold",
+            description="Manage gold/trade.",
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "items_added": types.Schema(type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)),
+                    "items_removed": types.Schema(type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)),
+                    "gold_change": types.Schema(type=types.Type.INTEGER),
+                    "reason": types.Schema(type=types.Type.STRING)
+                },
+                required=["gold_change"]
+            )
+        ),
+        types.FunctionDeclaration(
+            name="grant_xp",
+            description="Award XP.",
+            parameters=types.Schema(
+                type=types.Type.OBJECT,
+                properties={
+                    "amount": types.Schema(type=types.Type.INTEGER),
+                    "reason": types.Schema(type=types.Type.STRING)
+                },
+                required=["amount"]
+            )
+        )
+    ]
+)
+
+rest_tool = types.Tool(
+    function_declarations=[
+        types.FunctionDeclaration(
+            name="take_long_rest",
+            description="Restores HP/saves game.",
+            parameters=types.Schema(type=types.Type.OBJECT, properties={}, required=[])
+        )
+    ]
+)
+
+# --- GENERATION CONFIGS ---
+
+safety_settings = [
+    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, threshold=types.HarmBlockThreshold.BLOCK_NONE),
+    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HARASSMENT, threshold=types.HarmBlockThreshold.BLOCK_ONLY_HIGH),
+    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH, threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE),
+    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE),
+]
+
+generate_config = types.GenerateContentConfig(
+    safety_settings=safety_settings,
+    tools=[dice_tool, combat_tool, rest_tool, gameplay_tool, economy_tool, illustrate_tool], # Added illustrate_tool
+    temperature=0.9
+)
+
+text_only_config = types.GenerateContentConfig(
+    safety_settings=safety_settings,
+    temperature=0.9
+)
+
+ALL_TOOLS = [dice_tool, combat_tool, rest_tool, gameplay_tool, economy_tool, illustrate_tool]
+
+# --- MODE BUNDLES ---
+# The DM only sees the tools that fit the current game mode (see game_mode.py).
+# Dice are always there. Each distinct bundle gets its own context cache (see
+# cache_manager.get_cache_version), so these lists and configs are built once here.
+
+BUNDLES = {
+    "combat": [dice_tool, combat_tool, gameplay_tool, economy_tool, illustrate_tool],
+    "exploration": [dice_tool, combat_tool, gameplay_tool, economy_tool, illustrate_tool],
+    "downtime": [dice_tool, rest_tool, gameplay_tool, economy_tool, illustrate_tool],
+    "shopping": [dice_tool, economy_tool, gameplay_tool],
+}
+
+bundle_configs = {
+    mode: types.GenerateContentConfig(safety_settings=safety_settings, tools=tools, temperature=0.9)
+    for mode, tools in BUNDLES.items()
+}
+
+def bundle_for(mode):
+    """(tools, uncached config) for a game mode; unknown modes get every tool."""
+    if mode in BUNDLES:
+        return BUNDLES[mode], bundle_configs[mode]
+    return ALL_TOOLS, generate_config
@@ -0,0 +1,76 @@
+import re
+
+# Which kind of scene the table is in, from local state only (no model call):
+# combat, exploration, downtime or shopping. Each mode has its own tool bundle
+# (dm_tools.BUNDLES) and context cache, so the DM only sees the tools that fit.
+#
+# Combat is sticky: it starts when the DM calls start_combat (or a player clearly
+# attacks) and lasts until the DM's narration ends it, or COMBAT_MAX_QUIET_TURNS
+# pass without any fighting words. The other modes follow the player's message.
+
+MODES = ("combat", "exploration", "downtime", "shopping")
+DEFAULT_MODE = "exploration"
+COMBAT_MAX_QUIET_TURNS = 4
+
+
+def _words(*words):
+    return re.compile(r"\b(" + "|".join(words) + r")\b", re.IGNORECASE)
+
+
+COMBAT_WORDS = _words(
+    "attack", "attacks", "strike", "stab", "slash", "swing", "shoot", "fire at", "charge", "parry", "dodge",
+    "initiative", "fight", "smite", "cast \\w+ at", "grapple", "flee", "retreat",
+)
+COMBAT_OVER = _words(
+    "combat ends", "the battle is over", "falls dead", "lies dead", "slain", "victorious", "victory",
+    "flees", "surrenders", "you escape", "the fight is over",
+)
+SHOPPING_WORDS = _words(
+    "buy", "sell", "shop", "merchant", "vendor", "market", "price", "prices", "haggle", "trade",
+    "barter", "blacksmith", "wares", "how much", "purchase",
+)
+DOWNTIME_WORDS = _words(
+    "rest", "long rest", "short rest", "camp", "sleep", "inn", "tavern", "bath", "relax", "meditate",
+    "downtime", "bed", "night off", "drink",
+)
+
+
+class ModeTracker:
+    """Current game mode; observe() each finished turn, mode_for() each new message."""
+
+    def __init__(self):
+        self.in_combat = False
+        self._quiet_turns = 0
+        self.last_mode = DEFAULT_MODE
+
+    def mode_for(self, user_input):
+        if self.in_combat or COMBAT_WORDS.search(user_input):
+            mode = "combat"
+        elif SHOPPING_WORDS.search(user_input):
+            mode = "shopping"
+        elif DOWNTIME_WORDS.search(user_input):
+            mode = "downtime"
+        else:
+            mode = DEFAULT_MODE
+        self.last_mode = mode
+        return mode
+
+    def predict(self):
+        """Best guess at the next message's mode, before it is written."""
+        return "combat" if self.in_combat else self.last_mode
+
+    def observe(self, user_input, dm_text, events=()):
+        """Updates the combat flag from a finished turn (its tool events and narration)."""
+        if "combat_started" in events:
+            self.in_combat, self._quiet_turns = True, 0
+            return
+        if not self.in_combat:
+            return
+        if COMBAT_OVER.search(dm_text or "") or "rest" in events:
+            self.in_combat = False
+        elif COMBAT_WORDS.search(user_input) or COMBAT_WORDS.search(dm_text or ""):
+            self._quiet_turns = 0
+        else:
+            self._quiet_turns += 1
+            if self._quiet_turns >= COMBAT_MAX_QUIET_TURNS:
+                self.in_combat = False
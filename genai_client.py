@@ -0,0 +1,84 @@
+import os
+import time
+import threading
+from lazy_imports import LazyModule
+import structured_log
+
+genai = LazyModule("google.genai")
+types = LazyModule("google.genai.types")
+httpx = LazyModule("httpx")
+
+# One genai.Client for the whole bot (main, cache, image, speech), so there is a
+# single HTTP connection pool and one place to tune it. All knobs are env vars.
+TIMEOUT_SECONDS = float(os.getenv("GENAI_TIMEOUT_SECONDS", "120"))
+MAX_CONNECTIONS = int(os.getenv("GENAI_MAX_CONNECTIONS", "20"))
+MAX_KEEPALIVE_CONNECTIONS = int(os.getenv("GENAI_MAX_KEEPALIVE", "10"))
+KEEPALIVE_SECONDS = float(os.getenv("GENAI_KEEPALIVE_SECONDS", "120"))
+# Point at a local fake server in tests/benchmarks, e.g. http://127.0.0.1:8765
+BASE_URL = os.getenv("GENAI_BASE_URL")
+# Record every call to a cassette, or replay one offline (see cassette.py)
+CASSETTE_MODE = os.getenv("CASSETTE_MODE", "").lower()
+CASSETTE_DIR = os.getenv("CASSETTE_DIR", "cassettes/latest")
+
+_client_instance = None
+_lock = threading.Lock()
+
+def build_http_options():
+    """Connection pooling, timeouts and keep-alive for the shared client."""
+    limits = httpx.Limits(
+        max_connections=MAX_CONNECTIONS,
+        max_keepalive_connections=MAX_KEEPALIVE_CONNECTIONS,
+        keepalive_expiry=KEEPALIVE_SECONDS,
+    )
+    return types.HttpOptions(
+        base_url=BASE_URL,
+        timeout=int(TIMEOUT_SECONDS * 1000),  # SDK wants milliseconds
+        client_args={"limits": limits},
+        async_client_args={"limits": limits},
+    )
+
+def _build_client():
+    if CASSETTE_MODE == "replay":
+        import cassette
+        return cassette.ReplayClient(CASSETTE_DIR)
+    client = genai.Client(
+        api_key=os.getenv("GEMINI_API_KEY"),
+        http_options=build_http_options(),
+    )
+    if CASSETTE_MODE == "record":
+        import cassette
+        return cassette.RecordingClient(client, CASSETTE_DIR)
+    return client
+
+def get_client():
+    """The shared genai.Client, created on first use."""
+    global _client_instance
+    if _client_instance is None:
+        with _lock:
+            if _client_instance is None:
+                _client_instance = _build_client()
+    return _client_instance
+
+def set_client(client):
+    """Injection point: tests and benchmarks swap in a fake client here."""
+    global _client_instance
+    with _lock:
+        _client_instance = client
+
+def reset_client():
+    set_client(None)
+
+def prewarm(model_id):
+    """
+    Blocking: opens the pooled connection (DNS + TLS) with a cheap metadata call,
+    so the first real turn doesn't pay for the handshake. Returns seconds taken or None.
+    """
+    started = time.perf_counter()
+    try:
+        get_client().models.get(model=model_id)
+    except Exception as e:
+        structured_log.warn("client", f"Pre-warm failed: {e}")
+        return None
+    elapsed = time.perf_counter() - started
+    structured_log.info("client", f"Pre-warmed connection in {elapsed:.2f}s")
+    return elapsed
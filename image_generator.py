@@ -1,27 +1,24 @@
 import os
 import asyncio
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+from lazy_imports import LazyModule
+import genai_client
+import usage_tracker
+import structured_log
 
-load_dotenv()
+types = LazyModule("google.genai.types")
 
-# Singleton Client (Reusing logic for consistency, though user asked for fresh client here initially. 
-# Better to be safe and use Lazy/Singleton pattern we established).
-_client_instance = None
+# Shared, pooled client (see genai_client.py)
+get_client = genai_client.get_client
 
-def get_client():
-    global _client_instance
-    if _client_instance is None:
-        _client_instance = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _client_instance
+# Img2Img avatars go through the multimodal model; generate-001 is text-to-image only
+AVATAR_MODEL_ID = 'gemini-3-flash-preview'
 
 def generate_scene_image(prompt):
     """
     Generates an image using Imagen 3 via Gemini API.
     Returns: (bytes, extension_string) or (None, error_string)
     """
-    print(f"[IMAGEN] Generating: {prompt}")
+    structured_log.info("imagen", f"Generating: {prompt}")
     try:
         # Use the specific Imagen model ID
         model_id = 'imagen-3.0-generate-001' 
@@ -39,6 +36,7 @@ def generate_scene_image(prompt):
             )
         )
         
+        usage_tracker.record_image()
         if response.generated_images:
             image_bytes = response.generated_images[0].image.image_bytes
             return image_bytes, "png"
@@ -46,37 +44,36 @@ def generate_scene_image(prompt):
             return None, "No image returned from API."
 
     except Exception as e:
-        print(f"[IMAGEN ERROR] {e}")
+        structured_log.error("imagen", f"Generation failed: {e}")
         return None, str(e)
 
 def generate_avatar(instruction, input_image_bytes=None, input_mime_type=None):
     """
-    Image-to-Image transformation for avatars.
-    Note: Imagen 3.0 via API might have different support for Img2Img.
-    If 3.0 fails, fallback to 2.0 logic or return error.
+    Image-to-Image transformation for avatars (input is the normalized face
+    from avatar_pipeline). Returns: (bytes, extension_string) or (None, error_string)
     """
     try:
         client = get_client()
-        # Fallback to 3.0 flash logic for Img2Img since 3.0 generate-001 is text-to-image mostly
-        model_id = 'gemini-3-flash-preview'
-        
         contents = [types.Part(text=instruction)]
         
         if input_image_bytes and input_mime_type:
-             contents.append(types.Part.from_bytes(input_image_bytes, input_mime_type))
+            # from_bytes takes keyword-only arguments
+            contents.append(types.Part.from_bytes(data=input_image_bytes, mime_type=input_mime_type))
 
         response = client.models.generate_content(
-            model=model_id,
+            model=AVATAR_MODEL_ID,
             contents=contents,
             config=types.GenerateContentConfig(
                 temperature=0.7
             )
         )
 
+        usage_tracker.record_response(response, kind="image")
         if response.parts:
             for part in response.parts:
                 if part.inline_data:
-                    return part.inline_data.data, "jpg"
+                    ext = "png" if part.inline_data.mime_type == "image/png" else "jpg"
+                    return part.inline_data.data, ext
 
         return None, "No image data returned from API."
 
@@ -0,0 +1,32 @@
+import importlib
+import threading
+
+# google.genai alone costs ~0.9s to import. Modules hold a LazyModule instead,
+# so the bot can connect to Discord first and pay for it on first real use.
+
+class LazyModule:
+    """Stands in for a module and imports it on first attribute access."""
+
+    def __init__(self, name):
+        self._name = name
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    def __getattr__(self, attr):
+        return getattr(self._load(), attr)
+
+    def __repr__(self):
+        state = "loaded" if self._module is not None else "not loaded"
+        return f"<LazyModule {self._name} ({state})>"
+
+def preload(*lazy_modules):
+    """Blocking: imports the given lazy modules now (run it in a thread to warm up)."""
+    for module in lazy_modules:
+        module._load()
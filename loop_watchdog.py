@@ -0,0 +1,163 @@
+import os
+import sys
+import time
+import asyncio
+import threading
+import traceback
+import weakref
+
+import metrics
+import structured_log
+
+# Event-loop lag watchdog. A heartbeat task wakes every BEAT_SECONDS and records
+# how late it woke (the "loop_lag" stage in metrics). A watcher thread notices
+# when the heartbeat is overdue by more than the threshold, i.e. some callback is
+# hogging the loop right now, and grabs the loop thread's stack at that moment.
+# When the loop frees up, the stall's full length is charged to that stack,
+# grouped by the innermost frame in our own code, with the turn or command that
+# was running (see tag()). The worst offenders show in !status and the logs.
+
+THRESHOLD_SECONDS = float(os.getenv("LOOP_BLOCK_THRESHOLD_MS", "100")) / 1000
+BEAT_SECONDS = 0.05
+STACK_FRAMES = 12
+MAX_OFFENDERS = 50
+
+_REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def _own_code(filename):
+    path = os.path.abspath(filename)
+    return path.startswith(_REPO_DIR) and "site-packages" not in path
+
+
+def _where(frame):
+    return f"{os.path.basename(frame.filename)}:{frame.lineno} {frame.name}"
+
+
+class LoopWatchdog:
+    def __init__(self, threshold=THRESHOLD_SECONDS, beat=BEAT_SECONDS):
+        self.threshold = threshold
+        self.beat = beat
+        self.loop = None
+        self.stalls = 0
+        self.offenders = {}  # key -> {"where", "inner", "count", "total", "max", "label", "stack"}
+        self._labels = weakref.WeakKeyDictionary()  # task -> what it is doing (see tag)
+        self._lock = threading.Lock()
+        self._last_beat = 0.0
+        self._capture = None  # (stack, label) of the stall in progress
+        self._task = None
+        self._thread = None
+        self._stop = threading.Event()
+
+    # --- LIFECYCLE ---
+
+    def start(self):
+        """Starts watching the running loop (call from it; repeat calls are no-ops)."""
+        if self._task is not None or self.threshold <= 0:
+            return
+        self.loop = asyncio.get_running_loop()
+        self._loop_thread = threading.get_ident()
+        self._last_beat = time.monotonic()
+        self._stop.clear()
+        self._task = self.loop.create_task(self._heartbeat(), name="loop-watchdog")
+        self._thread = threading.Thread(target=self._watch, name="loop-watchdog", daemon=True)
+        self._thread.start()
+        structured_log.info("watchdog", f"Watching the event loop (stalls over {self.threshold * 1000:.0f}ms).")
+
+    def stop(self):
+        self._stop.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def tag(self, label):
+        """Names what the current task is doing (e.g. 'turn 123 (Aria)', '!snapshot by Bo')."""
+        try:
+            self._labels[asyncio.current_task()] = label
+        except (RuntimeError, TypeError):
+            pass
+
+    # --- MEASURING ---
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.beat
+            await asyncio.sleep(self.beat)
+            now = time.monotonic()
+            lag = max(0.0, now - expected)
+            metrics.observe("loop_lag", lag)
+            with self._lock:
+                self._last_beat = now
+                capture, self._capture = self._capture, None
+            if capture:
+                self._record(capture, lag)
+
+    def _watch(self):
+        while not self._stop.wait(self.threshold / 4):
+            with self._lock:
+                overdue = time.monotonic() - self._last_beat - self.beat
+                if overdue < self.threshold or self._capture is not None:
+                    continue
+            frame = sys._current_frames().get(self._loop_thread)
+            if frame is None:
+                continue
+            stack = traceback.extract_stack(frame)
+            # Drop the loop's own machinery above the callback that is running
+            for i in range(len(stack) - 1, -1, -1):
+                if stack[i].name == "_run" and stack[i].filename.endswith(os.path.join("asyncio", "events.py")):
+                    stack = stack[i + 1:]
+                    break
+            stack = stack[-STACK_FRAMES:]
+            label = self._current_label()
+            with self._lock:
+                if self._capture is None:
+                    self._capture = (stack, label)
+
+    def _current_label(self):
+        """What the loop is running right now (read from the watcher thread)."""
+        task = asyncio.tasks._current_tasks.get(self.loop)
+        if task is None:
+            return "callback"
+        label = self._labels.get(task)
+        return label or task.get_name()
+
+    def _record(self, capture, lag):
+        stack, label = capture
+        own = [frame for frame in stack if _own_code(frame.filename) and frame.filename != __file__]
+        where = _where(own[-1]) if own else _where(stack[-1])
+        inner = stack[-1].name
+        key = (where, inner)
+        self.stalls += 1
+
+        entry = self.offenders.get(key)
+        is_new = entry is None
+        if is_new:
+            if len(self.offenders) >= MAX_OFFENDERS:
+                # Forget the least costly offender to make room
+                del self.offenders[min(self.offenders, key=lambda k: self.offenders[k]["total"])]
+            entry = self.offenders[key] = {"where": where, "inner": inner, "count": 0, "total": 0.0, "max": 0.0}
+        entry["count"] += 1
+        entry["total"] += lag
+        entry["label"] = label
+        if lag >= entry["max"]:
+            entry["max"] = lag
+            entry["stack"] = "".join(traceback.format_list(stack))
+
+        structured_log.warn("watchdog", f"Loop blocked {lag * 1000:.0f}ms in {label}: {where} (in {inner})")
+        if is_new:
+            structured_log.info("watchdog", f"Stack:\n{entry['stack']}")
+
+    # --- REPORTING ---
+
+    def top(self, limit=3):
+        return sorted(self.offenders.values(), key=lambda e: e["total"], reverse=True)[:limit]
+
+    def format_status(self, limit=3):
+        lag = metrics.summary().get("loop_lag")
+        head = (f"lag p99 {lag['p99'] * 1000:.0f}ms" if lag else "lag not measured yet")
+        head += f", {self.stalls} stall(s) over {self.threshold * 1000:.0f}ms"
+        rows = [
+            f"`{e['where']}` (in {e['inner']}) {e['count']}× · max {e['max'] * 1000:.0f}ms · last during {e['label']}"
+            for e in self.top(limit)
+        ]
+        return "\n".join([head] + rows)
@@ -1,218 +1,105 @@
 import os
+import sys
 import json
-import random
+import hashlib
 import asyncio
 import io
 import discord
 from discord.ext import commands, tasks
-from collections import deque
 from datetime import datetime, timedelta
 
-from google import genai
-from google.genai import types
-from google.oauth2 import service_account
-from googleapiclient.discovery import build
-from googleapiclient.http import MediaFileUpload
 from dotenv import load_dotenv
+# Before the custom modules: several read their settings from the environment at import
+load_dotenv()
+
+from lazy_imports import LazyModule, preload
+
+# Heavy SDKs load on first use (or in the background once connected)
+types = LazyModule("google.genai.types")
+dm_tools = LazyModule("dm_tools")
 
 # --- CUSTOM MODULES ---
-from ai_persona import get_dungeon_master_prompt, get_static_system_prompt
-import dice_engine
 import character_creator
 import campaign_crafter
 import image_generator
 import speech_generator
+import voice_narrator
 import cache_manager
-from utils import retry_with_backoff, send_chunked_message
+import genai_client
+import scene_prefetch
+import metrics
+import usage_tracker
+import story_memory
+import story_summaries
+import backup_manager
+import avatar_pipeline
+import dm_turn
+import worker_pool
+import loop_watchdog
+import resilience
+import game_mode
+import turn_prewarm
+import structured_log
+from session_manager import SessionStore
+from utils import send_chunked_message
 
 # --- CONFIGURATION ---
-load_dotenv()
 intents = discord.Intents.all()
 bot = commands.Bot(command_prefix="!", intents=intents)
 
-# --- SINGLETON CLIENT SETUP ---
-_client_instance = None
-
-def get_client():
-    global _client_instance
-    if _client_instance is None:
-        _client_instance = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _client_instance
-
-# UPDATED: Using the latest Flash Experience for speed/vision
-MODEL_ID = 'gemini-3-flash-preview' 
+# --- SHARED CLIENT SETUP ---
+# One pooled client for every module; tune it via GENAI_* env vars (see genai_client.py)
+get_client = genai_client.get_client
+# Open the connection at startup so the first turn skips the TLS handshake
+PREWARM_CLIENT = os.getenv("GENAI_PREWARM", "1") == "1"
+
+MODEL_ID = dm_turn.MODEL_ID
+
+# Optional gateway/worker split (see worker_pool.py); 0 plays turns in this process
+workers = worker_pool.WorkerPool(worker_pool.WORKER_PROCESSES) if worker_pool.WORKER_PROCESSES > 0 else None
+# Replies (and their images) reach each channel in the order the messages arrived
+turn_order = worker_pool.ChannelOrder()
+# Catches whatever blocks the event loop (LOOP_BLOCK_THRESHOLD_MS, 0 disables)
+watchdog = loop_watchdog.LoopWatchdog()
+# Game mode (combat, exploration, downtime, shopping) picks the DM's tool bundle
+game_modes = game_mode.ModeTracker()
+# While anyone played within this many minutes, every bundle's cache is kept warm
+CACHE_KEEP_WARM_MINUTES = 60
 
 # --- DATA STRUCTURES ---
-creation_sessions = {}
-campaign_sessions = {}
+creation_sessions = SessionStore("creation")
+campaign_sessions = SessionStore("campaign")
 players = {}
 RULES = {}
+RULES_JSON = "{}"  # Compact serialization, rebuilt only when rules.json changes
 chat_history = [] 
 current_campaign_premise = None
 start_time = datetime.now()
 last_thought = "Waiting for the adventure to begin..."
-DEBUG_LOG = deque(maxlen=20)
+state_generation = 0  # Bumped by save_state; tells prepared turns the state moved on
 
 # IMAGE COOLDOWN LOGIC
 # Prevents the bot from painting every single turn ($$$ protection)
 last_image_gen_time = datetime.now() - timedelta(minutes=10)
 IMAGE_COOLDOWN_MINUTES = 10 
 
-# --- TOOL DEFINITIONS ---
-
-dice_tool = types.Tool(
-    function_declarations=[
-        types.FunctionDeclaration(
-            name="roll_dice",
-            description="Rolls dice. Use this for combat, checks, or random events.",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "expression": types.Schema(type=types.Type.STRING, description="Dice expression (e.g. '1d20+5')")
-                },
-                required=["expression"]
-            )
-        )
-    ]
-)
-
-combat_tool = types.Tool(
-    function_declarations=[
-        types.FunctionDeclaration(
-            name="start_combat",
-            description="Initiates combat. Returns stats/initiatives.",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "monster_name": types.Schema(type=types.Type.STRING, description="Name of monster")
-                },
-                required=["monster_name"]
-            )
-        )
-    ]
-)
-
-# NEW: Autonomous Illustration Tool
-illustrate_tool = types.Tool(
-    function_declarations=[
-        types.FunctionDeclaration(
-            name="illustrate_scene",
-            description="AUTONOMOUSLY generate an image of the current scene. Use ONLY when a moment is visually spectacular, dramatic, or emotional. Do not use for simple dialogue.",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "prompt": types.Schema(type=types.Type.STRING, description="Detailed visual description (lighting, mood, subject)."),
-                    "style": types.Schema(type=types.Type.STRING, description="Art style (e.g. 'Oil Painting', 'Dark Fantasy', 'Watercolor').")
-                },
-                required=["prompt"]
-            )
-        )
-    ]
-)
-
-gameplay_tool = types.Tool(
-    function_declarations=[
-        types.FunctionDeclaration(
-            name="update_quest",
-            description="Manage quests (ADD, COMPLETE, FAIL).",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "action": types.Schema(type=types.Type.STRING),
-                    "quest_name": types.Schema(type=types.Type.STRING),
-                    "status": types.Schema(type=types.Type.STRING)
-                },
-                required=["action", "quest_name"]
-            )
-        ),
-        types.FunctionDeclaration(
-            name="add_loot",
-            description="Add item to inventory.",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "item_name": types.Schema(type=types.Type.STRING),
-                    "quantity": types.Schema(type=types.Type.INTEGER)
-                },
-                required=["item_name"]
-            )
-        ),
-        types.FunctionDeclaration(
-            name="update_relationship",
-            description="Update NPC affection.",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "npc_name": types.Schema(type=types.Type.STRING),
-                    "change": types.Schema(type=types.Type.INTEGER),
-                    "reason": types.Schema(type=types.Type.STRING)
-                },
-                required=["npc_name", "change"]
-            )
-        )
-    ]
-)
-
-economy_tool = types.Tool(
-    function_declarations=[
-        types.FunctionDeclaration(
-            name="update_inventory_gold",
-            description="Manage gold/trade.",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "items_added": types.Schema(type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)),
-                    "items_removed": types.Schema(type=types.Type.ARRAY, items=types.Schema(type=types.Type.STRING)),
-                    "gold_change": types.Schema(type=types.Type.INTEGER),
-                    "reason": types.Schema(type=types.Type.STRING)
-                },
-                required=["gold_change"]
-            )
-        ),
-        types.FunctionDeclaration(
-            name="grant_xp",
-            description="Award XP.",
-            parameters=types.Schema(
-                type=types.Type.OBJECT,
-                properties={
-                    "amount": types.Schema(type=types.Type.INTEGER),
-                    "reason": types.Schema(type=types.Type.STRING)
-                },
-                required=["amount"]
-            )
-        )
-    ]
-)
-
-rest_tool = types.Tool(
-    function_declarations=[
-        types.FunctionDeclaration(
-            name="take_long_rest",
-            description="Restores HP/saves game.",
-            parameters=types.Schema(type=types.Type.OBJECT, properties={}, required=[])
-        )
-    ]
-)
-
-# --- GENERATION CONFIGS ---
-
-safety_settings = [
-    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT, threshold=types.HarmBlockThreshold.BLOCK_NONE),
-    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HARASSMENT, threshold=types.HarmBlockThreshold.BLOCK_ONLY_HIGH),
-    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_HATE_SPEECH, threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE),
-    types.SafetySetting(category=types.HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT, threshold=types.HarmBlockThreshold.BLOCK_MEDIUM_AND_ABOVE),
-]
-
-generate_config = types.GenerateContentConfig(
-    safety_settings=safety_settings,
-    tools=[dice_tool, combat_tool, rest_tool, gameplay_tool, economy_tool, illustrate_tool], # Added illustrate_tool
-    temperature=0.9
-)
-
-text_only_config = types.GenerateContentConfig(
-    safety_settings=safety_settings,
-    temperature=0.9
-)
+# METRICS EXPORT
+# METRICS_PORT serves Prometheus text at http://127.0.0.1:<port>/metrics,
+# METRICS_FILE rewrites it to a file every 15s (node_exporter textfile collector).
+METRICS_PORT = os.getenv("METRICS_PORT")
+METRICS_FILE = os.getenv("METRICS_FILE")
+_metrics_server = None
+
+# --- LONG-TERM MEMORY ---
+# The prompt carries the last CONTEXT_WINDOW_LINES of history verbatim; older
+# lines are recalled from the story index when the new input matches them.
+CONTEXT_WINDOW_LINES = 200
+story_index = story_memory.StoryIndex()
+story_index_ready = False
+_story_index_task = None
+# Older history is also summarized (scene -> session -> campaign) while the table is quiet
+SUMMARY_IDLE_SECONDS = 45
+last_activity = datetime.now()
 
 # --- FILE PATHS ---
 DATA_DIR = "/data" if os.path.exists("/data") else "."
@@ -222,24 +109,46 @@ RULES_FILE = "rules.json"
 
 if not os.path.exists(IMAGES_DIR):
     os.makedirs(IMAGES_DIR)
+avatar_pipeline.IMAGES_DIR = IMAGES_DIR
+
+# In-progress interviews survive redeploys
+creation_sessions.persist_path = os.path.join(DATA_DIR, "creation_sessions.json")
+campaign_sessions.persist_path = os.path.join(DATA_DIR, "campaign_sessions.json")
+usage_tracker.persist_path = os.path.join(DATA_DIR, "usage.json")
+# Structured logs: a bounded on-disk ring (LOG_SEGMENTS x LOG_SEGMENT_KB), read by !logs.
+# The writer thread starts with the bot (below), after the workers are forked.
+LOG_DIR = os.path.join(DATA_DIR, "logs")
+SUMMARIES_FILE = os.path.join(DATA_DIR, "summaries.json")
+
+# --- BACKUPS ---
+# Incremental compressed backups (see backup_manager.py) to Drive or BACKUP_BACKEND
+BACKUP_INTERVAL_HOURS = float(os.getenv("BACKUP_INTERVAL_HOURS", "168"))
+_backup_backend = backup_manager.make_backend()
+backups = backup_manager.BackupManager(_backup_backend) if _backup_backend else None
+metrics.register_exporter(usage_tracker.prometheus_lines)
 
 # --- CORE FUNCTIONS ---
 
-def log_event(message):
-    timestamp = datetime.now().strftime("%H:%M:%S")
-    entry = f"[{timestamp}] {message}"
-    print(entry)
-    DEBUG_LOG.append(entry)
+def log_event(message, level="info"):
+    structured_log.log(level, "event", message)
+
+_data_loaded = False
 
 def load_data():
-    global players, RULES, chat_history, current_campaign_premise
+    """Loads rules and saved state. Runs once, before connecting."""
+    global players, RULES, RULES_JSON, chat_history, current_campaign_premise, _data_loaded
+    if _data_loaded:
+        return
+    _data_loaded = True
     try:
         with open(RULES_FILE, "r") as f:
             RULES = json.load(f)
-        print("[OK] Rules loaded.")
+        structured_log.info("state", "Rules loaded.")
     except FileNotFoundError:
-        print("[ERROR] rules.json not found!")
+        structured_log.error("state", "rules.json not found!")
         RULES = {}
+    RULES_JSON = json.dumps(RULES, separators=(",", ":"))
+    dm_turn.RULES = RULES
 
     if os.path.exists(STATE_FILE):
         try:
@@ -248,189 +157,293 @@ def load_data():
                 players = data.get("players", {})
                 chat_history = data.get("chat_history", [])
                 current_campaign_premise = data.get("campaign_premise", None)
-            print(f"[INFO] Game State Loaded.")
+            structured_log.info("state", "Game State Loaded.")
         except Exception as e:
-            print(f"[WARN] Error loading state: {e}")
+            structured_log.warn("state", f"Error loading state: {e}")
+
+    creation_sessions.load()
+    campaign_sessions.load()
+    usage_tracker.load()
+    story_summarizer.load()
 
 def save_state():
+    global state_generation
+    state_generation += 1
     state = {
         "players": players,
         "chat_history": chat_history,
         "campaign_premise": current_campaign_premise,
         "last_updated": str(datetime.now())
     }
-    with open(STATE_FILE, "w") as f:
+    # Write-then-rename so a backup reading the file never sees half of it
+    tmp_path = STATE_FILE + ".tmp"
+    with open(tmp_path, "w") as f:
         json.dump(state, f, indent=4)
+    os.replace(tmp_path, STATE_FILE)
+
+def campaign_id():
+    """Short stable id for the current campaign (usage and budgets are kept per campaign)."""
+    if not current_campaign_premise:
+        return "default"
+    return hashlib.md5(current_campaign_premise.encode("utf-8")).hexdigest()[:8]
 
 # --- AI LOGIC ---
 
-@retry_with_backoff(retries=3, initial_delay=4, factor=2)
-async def get_ai_response(user_input, user_name, uid, channel=None):
-    global last_thought, chat_history, last_image_gen_time
-    last_thought = f"Processing input from {user_name}..."
-    
-    # 1. Prepare Context
-    temp_history = chat_history.copy()
-    temp_history.append(f"{user_name}: {user_input}")
-    
-    context_str = "\n".join(temp_history[-200:]) 
-    current_state_json = json.dumps(players, indent=2)
-    
-    static_sys = get_static_system_prompt()
-    dynamic_prompt = get_dungeon_master_prompt(context_str, current_state_json) # Fallback prompt logic
-    
-    # 2. Cache Resolution
-    all_tools = [dice_tool, combat_tool, rest_tool, gameplay_tool, economy_tool, illustrate_tool]
-    
-    try:
-        cache_name = cache_manager.get_or_create_cache(static_sys, all_tools)
-    except Exception as e:
-        print(f"[CACHE] Error: {e}")
-        cache_name = None
+generate = dm_turn.generate
+
+def image_block():
+    """Why the DM can't illustrate right now ("cooldown", "budget"), or None."""
+    if datetime.now() - last_image_gen_time < timedelta(minutes=IMAGE_COOLDOWN_MINUTES):
+        return "cooldown"
+    if usage_tracker.budget_state(campaign_id()) == "over":
+        return "budget"
+    return None
+
+async def post_image(channel, img_bytes, ext, style):
+    global last_image_gen_time
+    if channel:
+        file = discord.File(io.BytesIO(img_bytes), filename=f"scene.{ext}")
+        await channel.send(f"🎨 **{style}**", file=file)
+    # Update Cooldown
+    last_image_gen_time = datetime.now()
+
+def turn_fingerprint():
+    """What a prepared turn depends on: the latest history line and the saved state."""
+    return scene_prefetch.get_turn_id(chat_history), state_generation
+
+def turn_snapshot():
+    """Input for dm_turn.prepare_turn (runs in a thread while the player types)."""
+    return {
+        "history": chat_history[-(CONTEXT_WINDOW_LINES - 1):],
+        "players": players,
+        "mode": game_modes.predict(),
+    }
 
-    # 3. Determine Input for API
-    # If Cached: We send ONLY the dynamic part.
-    # If Not Cached: We send the HUGE full prompt (static + dynamic).
-    
-    if cache_name:
-        # Construct the "New" content.
-        # Note: 'dynamic_prompt' usually contains the history + instructions.
-        # With caching, we only want the NEWEST messages effectively, but since your prompt builder
-        # constructs a single large string, we might just have to send that string as the prompt.
-        # Ideally, you'd just send the user_input, but your persona logic relies on injecting the state JSON every turn.
-        # So we send 'dynamic_prompt' as the user message.
-        final_input_content = dynamic_prompt
-    else:
-        # Combine System + Dynamic for non-cached
-        final_input_content = static_sys + "\n\n" + dynamic_prompt
+# Prepares a channel's next turn while a registered player is typing (see turn_prewarm.py)
+turn_prewarmer = turn_prewarm.TurnPrewarmer(dm_turn.prepare_turn)
 
-    try:
-        # GENERATION CALL
-        if cache_name:
-            response = await asyncio.to_thread(
-                get_client().models.generate_content,
-                model=MODEL_ID,
-                contents=final_input_content, 
-                config=types.GenerateContentConfig(
-                    cached_content=cache_name,
-                    safety_settings=safety_settings,
-                    temperature=0.9
-                )
-            )
-        else:
-            response = await asyncio.to_thread(
-                get_client().models.generate_content,
-                model=MODEL_ID,
-                contents=final_input_content,
-                config=generate_config
-            )
+async def get_ai_response(user_input, user_name, uid, channel=None, slot=None):
+    """
+    Runs a DM turn (here, or in a worker process with WORKER_PROCESSES) and commits
+    it to the history. With a ChannelOrder slot, commits wait for earlier turns.
+    """
+    global last_thought
+    last_thought = f"Processing input from {user_name}..."
 
-        # TOOL HANDLING LOOP
-        while response.function_calls:
-            print(f"[AI] Tools called: {len(response.function_calls)}")
-            tool_response_parts = []
-            
-            for call in response.function_calls:
-                function_result = {}
-                
-                # --- ILLUSTRATION TOOL ---
-                if call.name == "illustrate_scene":
-                    # Check Cooldown
-                    time_since_last = datetime.now() - last_image_gen_time
-                    if time_since_last < timedelta(minutes=IMAGE_COOLDOWN_MINUTES):
-                        function_result = {"status": "skipped", "reason": "Cooldown active. Focus on the narrative."}
-                        print("[TOOL] Illustration skipped (Cooldown).")
-                    else:
-                        prompt = call.args.get("prompt")
-                        style = call.args.get("style", "Cinematic Fantasy")
-                        print(f"[TOOL] AI Painting: {prompt}")
-                        
-                        # Generate
-                        img_bytes, ext = await asyncio.to_thread(image_generator.generate_scene_image, f"{style}: {prompt}")
-                        
-                        if img_bytes and channel:
-                            import io
-                            # Send to Discord immediately
-                            file = discord.File(io.BytesIO(img_bytes), filename=f"scene.{ext}")
-                            await channel.send(f"🎨 **{style}**", file=file)
-                            
-                            # Update Cooldown
-                            last_image_gen_time = datetime.now()
-                            
-                            # Feedback to AI
-                            function_result = {"status": "success", "message": "Image generated and displayed to players."}
-                        else:
-                            function_result = {"status": "error", "message": "Image generation failed."}
-
-                # --- DICE TOOL ---
-                elif call.name == "roll_dice":
-                    expr = call.args.get("expression", "1d20")
-                    function_result = dice_engine.roll_dice(expr)
-
-                # --- COMBAT TOOL ---
-                elif call.name == "start_combat":
-                    m_name = call.args.get("monster_name", "").lower()
-                    monster = RULES.get('monsters', {}).get(m_name)
-                    if monster:
-                        function_result = {
-                            "event": "COMBAT_STARTED",
-                            "monster": monster['name'],
-                            "hp": monster['hp'],
-                            "init": random.randint(1,20) + monster.get('init_bonus', 0)
-                        }
-                    else:
-                        function_result = {"error": "Monster not found."}
-
-                # --- GAMEPLAY / ECONOMY TOOLS ---
-                elif call.name in ["update_quest", "add_loot", "update_relationship", "update_inventory_gold", "grant_xp", "take_long_rest"]:
-                     # (Simplified for brevity - your existing logic works here, just putting a placeholder for success)
-                     # In a real update, paste your full logic block here.
-                     function_result = {"status": "success", "message": f"{call.name} processed."}
-
-                
-                print(f"[TOOL EXEC] {call.name} -> {function_result}")
-                
-                tool_response_parts.append(
-                    types.Part(
-                        function_response=types.FunctionResponse(
-                            name=call.name,
-                            response=function_result
-                        )
-                    )
-                )
-
-            # Send Tool Results Back to AI
-            response = await asyncio.to_thread(
-                get_client().models.generate_content,
-                model=MODEL_ID,
-                contents=[
-                    types.Content(role="user", parts=[types.Part(text=final_input_content)]), # Corrected Variable
-                    response.candidates[0].content,
-                    types.Content(role="user", parts=tool_response_parts)
-                ],
-                config=generate_config
-            )
+    # Cache, state JSON and history window, if prepared while the player typed
+    prepared = await turn_prewarmer.take(channel.id, turn_fingerprint()) if channel else None
+
+    # Older turns the new input refers to (NPC names, promises...) from the story index
+    recalled = ""
+    if story_index_ready:
+        with metrics.span("memory_recall"):
+            recalled = story_memory.recall(story_index, chat_history, user_input, CONTEXT_WINDOW_LINES - 1)
+    request = {
+        "user_name": user_name,
+        "user_input": user_input,
+        "history": chat_history[-(CONTEXT_WINDOW_LINES - 1):],
+        "players": players,
+        "recalled": recalled,
+        "story_so_far": story_summarizer.story_so_far(chat_history, CONTEXT_WINDOW_LINES - 1),
+        "image_block": image_block(),
+        "mode": game_modes.mode_for(user_input),
+        "prepared": prepared,
+    }
 
-        text_response = response.text
-        
+    result = None
+    if workers:
+        try:
+            with metrics.span("worker_turn"):
+                result = await workers.run(dm_turn.run_turn, request)
+            worker_pool.apply_report(result)
+        except worker_pool.BrokenProcessPool:
+            result = None
+    if result is None:
+        # Pass 'channel' so the tool can send images!
+        result = await dm_turn.run_turn(request, post_image=lambda *image: post_image(channel, *image))
+
+    if slot:
+        with metrics.span("delivery_wait"):
+            await slot.wait()
+    for img_bytes, ext, style in result["images"]:
+        await post_image(channel, img_bytes, ext, style)
+
+    text_response = result["text"]
+    if result["ok"]:
         # Commit to History
         chat_history.append(f"{user_name}: {user_input}")
         chat_history.append(f"DM: {text_response}")
-        return text_response
+        game_modes.observe(user_input, text_response, result.get("events", ()))
+        if story_index_ready:
+            story_index.sync(chat_history)
+    return text_response
+
+async def build_story_index():
+    """Indexes the saved history off the loop, then catches up with turns played meanwhile."""
+    global story_index_ready
+    started = datetime.now()
+    await asyncio.to_thread(story_index.sync, list(chat_history))
+    story_index.sync(chat_history)
+    story_index_ready = True
+    structured_log.info("memory", f"Indexed {len(story_index)} history lines in {(datetime.now() - started).total_seconds():.1f}s")
+
+# --- STORY SUMMARIES ---
+
+def summarize_story(prompt):
+    """Blocking summary call for the background summarizer."""
+    with usage_tracker.attribute("summary", campaign=campaign_id()):
+        resp = resilience.call_blocking(lambda: get_client().models.generate_content(
+            model=MODEL_ID,
+            contents=prompt,
+            config=dm_tools.text_only_config
+        ), model=MODEL_ID)
+        usage_tracker.record_response(resp)
+    return resp.text
 
-    except Exception as e:
-        print(f"[ERROR] AI Gen Failed: {e}")
-        return "⚠️ *The DM is meditating (Error).* Check console."
+story_summarizer = story_summaries.StorySummarizer(summarize_story, persist_path=SUMMARIES_FILE)
+
+# --- SCENE PREFETCH ---
+
+def describe_scene(last_message):
+    """Blocking text call that turns the latest turn into an image prompt."""
+    resp = resilience.call_blocking(lambda: get_client().models.generate_content(
+        model=MODEL_ID,
+        contents=scene_prefetch.build_scene_prompt(last_message),
+        config=dm_tools.text_only_config
+    ), model=MODEL_ID)
+    usage_tracker.record_response(resp)
+    return resp.text, resp.usage_metadata
+
+def prefetch_scene(last_message):
+    """describe_scene, billed as speculative prefetch work."""
+    with usage_tracker.attribute("prefetch", campaign=campaign_id()):
+        return describe_scene(last_message)
+
+scene_prefetcher = scene_prefetch.ScenePrefetcher(prefetch_scene)
 
 # --- DISCORD EVENTS ---
 
+@tasks.loop(seconds=60)
+async def sweep_sessions():
+    """Expires abandoned interviews and persists the rest, off the hot path."""
+    for store in (creation_sessions, campaign_sessions):
+        removed = await store.sweep()
+        if removed:
+            structured_log.info("sessions", f"Expired {removed} idle {store.name} session(s).")
+        write = store.save_if_dirty()
+        if write:
+            try:
+                await asyncio.to_thread(write)
+            except Exception as e:
+                structured_log.warn("sessions", f"Save failed: {e}")
+    write = usage_tracker.save_if_dirty()
+    if write:
+        try:
+            await asyncio.to_thread(write)
+        except Exception as e:
+            structured_log.warn("usage", f"Save failed: {e}")
+
+@tasks.loop(seconds=30)
+async def summarize_history():
+    """Low priority: only when nobody has played for a while and the budget has headroom."""
+    if (datetime.now() - last_activity).total_seconds() < SUMMARY_IDLE_SECONDS:
+        return
+    if usage_tracker.budget_state(campaign_id()) != "ok":
+        return
+    try:
+        await story_summarizer.step(chat_history, CONTEXT_WINDOW_LINES - 1)
+    except Exception as e:
+        structured_log.warn("summary", f"Failed: {e}")
+    write = story_summarizer.save_if_dirty()
+    if write:
+        try:
+            await asyncio.to_thread(write)
+        except Exception as e:
+            structured_log.warn("summary", f"Save failed: {e}")
+
+async def run_backup():
+    """Backs up the state files off the loop. Returns per-file stats."""
+    paths = [STATE_FILE, SUMMARIES_FILE, usage_tracker.persist_path]
+    return await asyncio.to_thread(backups.backup, paths)
+
+@tasks.loop(hours=BACKUP_INTERVAL_HOURS)
+async def scheduled_backup():
+    try:
+        await run_backup()
+    except Exception as e:
+        structured_log.warn("backup", f"Scheduled backup failed: {e}")
+
+def warm_up():
+    """Blocking start-up warm-up, run in a worker thread once connected."""
+    preload(types, dm_tools)
+    if PREWARM_CLIENT:
+        genai_client.prewarm(MODEL_ID)
+
+@tasks.loop(minutes=10)
+async def keep_caches_warm():
+    """
+    One cache per game mode's tool bundle, so switching modes never creates one
+    mid-turn: created on the first run (at startup), then extended while the
+    table is active. Idle caches expire.
+    """
+    if (datetime.now() - last_activity).total_seconds() > CACHE_KEEP_WARM_MINUTES * 60:
+        return
+    try:
+        await asyncio.to_thread(dm_turn.prewarm_caches)
+    except Exception as e:
+        structured_log.warn("cache", f"Keep-warm failed: {e}")
+
+@tasks.loop(seconds=15)
+async def write_metrics_file():
+    try:
+        await asyncio.to_thread(metrics.write_file, METRICS_FILE)
+    except Exception as e:
+        structured_log.warn("metrics", f"Write failed: {e}")
+
 @bot.event
 async def on_ready():
-    load_data()
-    print(f'Logged in as {bot.user}')
+    global _metrics_server, _story_index_task
+    # Fires again on every gateway reconnect, so nothing here may reset state
+    watchdog.start()
+    if not sweep_sessions.is_running():
+        sweep_sessions.start()
+    if not summarize_history.is_running():
+        summarize_history.start()
+    if backups and not scheduled_backup.is_running():
+        scheduled_backup.start()
+    if METRICS_PORT and _metrics_server is None:
+        _metrics_server = await metrics.serve(int(METRICS_PORT))
+    if METRICS_FILE and not write_metrics_file.is_running():
+        write_metrics_file.start()
+    # Connected: warm the heavy SDK imports (and the connection pool) off the loop
+    # so the first turn doesn't pay for them
+    asyncio.create_task(asyncio.to_thread(warm_up))
+    if not keep_caches_warm.is_running():
+        keep_caches_warm.start()
+    if _story_index_task is None:
+        _story_index_task = asyncio.create_task(build_story_index())
+    structured_log.info("bot", f"Logged in as {bot.user}")
+
+@bot.before_invoke
+async def tag_command(ctx):
+    watchdog.tag(f"!{ctx.command} by {ctx.author.display_name}")
+
+@bot.event
+async def on_typing(channel, user, when):
+    """A player started typing: get their channel's next turn ready (cheap, local, rate-limited)."""
+    uid = str(user.id)
+    if user.bot or uid not in players or uid in creation_sessions or uid in campaign_sessions:
+        return
+    turn_prewarmer.on_typing(channel.id, turn_fingerprint(), turn_snapshot())
 
 @bot.event
 async def on_message(message):
+    # Everything logged while handling the message carries its channel and turn id
+    with structured_log.bind(channel=message.channel.id, turn=message.id):
+        await handle_message(message)
+
+async def handle_message(message):
+    global last_activity
     if message.author.bot: return
     if message.content.startswith("//"): return
 
@@ -444,9 +457,11 @@ async def on_message(message):
         # But for now we obey the structure user provided.
         # Actually, let's restore the helpers:
         if uid in creation_sessions: 
+             watchdog.tag(f"creation step ({message.author.display_name})")
              await run_creation_step(message)
              return
         if uid in campaign_sessions:
+             watchdog.tag(f"campaign step ({message.author.display_name})")
              await run_campaign_step(message)
              return
         return
@@ -465,38 +480,75 @@ async def on_message(message):
 
     # Main Chat Logic
     if uid in players:
-        async with message.channel.typing():
-            # Pass 'channel' so the tool can send images!
-            response = await get_ai_response(message.content, message.author.display_name, uid, channel=message.channel)
-            await send_chunked_message(message.channel, response)
-            save_state()
+        last_activity = datetime.now()
+        watchdog.tag(f"turn {message.id} ({message.author.display_name})")
+        with metrics.turn(message.id), usage_tracker.attribute("turn", player=uid, campaign=campaign_id()) as usage:
+            async with message.channel.typing(), turn_order.slot(message.channel.id) as slot:
+                response = await get_ai_response(message.content, message.author.display_name, uid,
+                                                 channel=message.channel, slot=slot)
+                with metrics.span("discord_send"):
+                    await send_chunked_message(message.channel, response)
+                with metrics.span("save"):
+                    save_state()
+        structured_log.info("usage", f"Turn: {usage.describe()}")
+        # Guess the !snapshot description while the players read (speculative, so only with budget headroom)
+        if usage_tracker.budget_state(campaign_id()) == "ok":
+            scene_prefetcher.schedule(scene_prefetch.get_turn_id(chat_history), chat_history[-1] if chat_history else "")
 
 # --- COMMANDS RESTORED ---
 
+async def run_persona_turn(system_text, cache_prefix, turn_prompt, label):
+    """
+    One interview turn. The persona (and rules) live in a context cache, so each
+    message only sends the conversation; falls back to the full prompt uncached.
+    """
+    cache_name = await asyncio.to_thread(cache_manager.get_or_create_cache, system_text, None, cache_prefix)
+
+    uncached = (system_text + "\n\n" + turn_prompt, dm_tools.text_only_config)
+    if cache_name:
+        contents = turn_prompt
+        config = types.GenerateContentConfig(
+            cached_content=cache_name,
+            safety_settings=dm_tools.safety_settings,
+            temperature=0.9
+        )
+    else:
+        contents, config = uncached
+
+    try:
+        response = await generate(stage="persona_round", model=MODEL_ID, contents=contents, config=config)
+    except Exception as e:
+        if not (cache_name and cache_manager.is_cache_error(e)):
+            raise
+        # The cache went away early (or was replaced): stop trusting it, retry once uncached
+        structured_log.warn("cache", f"{cache_name} rejected ({e}); retrying without the cache.")
+        cache_manager.forget(cache_name)
+        contents, config = uncached
+        response = await generate(stage="persona_round", model=MODEL_ID, contents=contents, config=config)
+
+    usage = response.usage_metadata
+    if usage:
+        cached = usage.cached_content_token_count or 0
+        structured_log.info(label.lower(), f"Input tokens: {(usage.prompt_token_count or 0) - cached} new + {cached} cached")
+    return response.text
+
 async def run_creation_step(message):
     uid = str(message.author.id)
     session = creation_sessions[uid]
     
     # User Input
     user_text = message.content
-    session['history'].append(f"User: {user_text}")
+    creation_sessions.append(uid, f"User: {user_text}")
     
-    # Build Prompt
-    # We grab rules once
-    rules_json = json.dumps(RULES)
-    
-    hist_str = "\\n".join(session['history'])
-    prompt = character_creator.get_creation_prompt(hist_str, rules_json)
+    # Build Prompt (RULES_JSON is serialized once at load)
+    hist_str = "\n".join(session['history'])
+    system_text = character_creator.get_creation_system_prompt(RULES_JSON)
+    turn_prompt = character_creator.get_creation_turn_prompt(hist_str)
     
     try:
         # Using Gemini 3 Flash for speed
-        response = await asyncio.to_thread(
-            get_client().models.generate_content,
-            model=MODEL_ID,
-            contents=prompt,
-            config=text_only_config
-        )
-        ai_reply = response.text
+        with usage_tracker.attribute("creation", player=uid):
+            ai_reply = await run_persona_turn(system_text, "Consultant_Cache", turn_prompt, "CREATION")
         
         # Check if AI wants to finalize
         # Logic: We might ask AI to output a JSON block or specific keyword.
@@ -507,7 +559,7 @@ async def run_creation_step(message):
         # For now, let's keep it text-based until user complains or we fix it properly.
         # We'll just echo the AI.
         
-        session['history'].append(f"Consultant: {ai_reply}")
+        creation_sessions.append(uid, f"Consultant: {ai_reply}")
         await send_chunked_message(message.channel, ai_reply)
         
     except Exception as e:
@@ -518,20 +570,16 @@ async def run_campaign_step(message):
     session = campaign_sessions[uid]
     
     user_text = message.content
-    session['history'].append(f"User: {user_text}")
+    campaign_sessions.append(uid, f"User: {user_text}")
     
-    hist_str = "\\n".join(session['history'])
-    prompt = campaign_crafter.get_campaign_prompt(hist_str)
+    hist_str = "\n".join(session['history'])
+    system_text = campaign_crafter.get_campaign_system_prompt()
+    turn_prompt = campaign_crafter.get_campaign_turn_prompt(hist_str)
     
     try:
-        response = await asyncio.to_thread(
-            get_client().models.generate_content,
-            model=MODEL_ID,
-            contents=prompt,
-            config=text_only_config
-        )
-        ai_reply = response.text
-        session['history'].append(f"Architect: {ai_reply}")
+        with usage_tracker.attribute("campaign", player=uid):
+            ai_reply = await run_persona_turn(system_text, "Architect_Cache", turn_prompt, "CAMPAIGN")
+        campaign_sessions.append(uid, f"Architect: {ai_reply}")
         await send_chunked_message(message.channel, ai_reply)
         
     except Exception as e:
@@ -564,11 +612,12 @@ async def start(ctx):
 
     await ctx.send("⚔️ **The Adventure Begins!**")
     # Trigger first narration
-    await get_ai_response("The adventure begins. Describe the opening scene.", "System", uid, channel=ctx.channel)
+    with usage_tracker.attribute("turn", player=uid, campaign=campaign_id()):
+        await get_ai_response("The adventure begins. Describe the opening scene.", "System", uid, channel=ctx.channel)
 
 @bot.command()
-async def narrate(ctx):
-    """Narrate the last message."""
+async def narrate(ctx, mode: str = None):
+    """Narrate the last message. Use '!narrate voice' to hear it in your voice channel."""
     if not chat_history:
         await ctx.send("Silence.")
         return
@@ -579,38 +628,57 @@ async def narrate(ctx):
         text = last_msg[4:]
     else:
         text = last_msg
-        
-    wav_data, err = await asyncio.to_thread(speech_generator.generate_speech, text)
-    if wav_data:
-        with io.BytesIO(wav_data) as f:
-            await ctx.send(file=discord.File(f, filename="narration.wav"))
+
+    with usage_tracker.attribute("narrate", player=str(ctx.author.id), campaign=campaign_id()):
+        if mode and mode.lower() == "voice":
+            await narrate_in_voice(ctx, text)
+            return
+
+        audio_data, ext = await asyncio.to_thread(speech_generator.generate_narration, text)
+    if audio_data:
+        with io.BytesIO(audio_data) as f:
+            await ctx.send(file=discord.File(f, filename=f"narration.{ext}"))
     else:
-        await ctx.send(f"⚠️ Voice Error: {err}")
+        await ctx.send(f"⚠️ Voice Error: {ext}")
+
+async def narrate_in_voice(ctx, text):
+    """Streams narration into the caller's voice channel, starting after the first sentence."""
+    voice_state = ctx.author.voice
+    if not voice_state or not voice_state.channel:
+        await ctx.send("🔇 Join a voice channel first.")
+        return
+
+    try:
+        vc = ctx.voice_client
+        if vc is None:
+            vc = await voice_state.channel.connect()
+        elif vc.channel != voice_state.channel:
+            await vc.move_to(voice_state.channel)
+
+        source = await voice_narrator.play_narration(vc, text)
+        if source.time_to_first_audio is not None:
+            structured_log.info("voice", f"Time to first audio: {source.time_to_first_audio:.2f}s")
+    except Exception as e:
+        await ctx.send(f"⚠️ Voice Error: {e}")
 
 @bot.command()
 async def snapshot(ctx):
     """Generate a picture of the current scene."""
+    if usage_tracker.budget_state(campaign_id()) == "over":
+        await ctx.send("💸 This campaign has spent its budget. Snapshots are paused (`!usage budget <usd>` to raise it).")
+        return
+    with usage_tracker.attribute("snapshot", player=str(ctx.author.id), campaign=campaign_id()):
+        await paint_snapshot(ctx)
+
+async def paint_snapshot(ctx):
     async with ctx.typing():
-        # Step 1: Get a SFW description from the Text Model
-        # We explicitly ask for an 'Oil Painting' style to avoid photorealistic NSFW triggers
-        prompt = (
-            f"Based on the last message: '{chat_history[-1] if chat_history else ''}', "
-            "describe the scene for an image generator. "
-            "Focus on lighting, atmosphere, and fantasy armor. "
-            "Avoid explicit anatomy; focus on the romantic tension and facial expressions. "
-            "Style: Digital Fantasy Art, Painterly, Cinematic Lighting."
-        )
+        last_message = chat_history[-1] if chat_history else ''
         
         try:
-            # 1. Get Scene Description (Text)
-            client = get_client() # Singleton
-            desc_resp = await asyncio.to_thread(
-                client.models.generate_content, 
-                model=MODEL_ID, 
-                contents=prompt, 
-                config=text_only_config
-            )
-            scene_description = desc_resp.text
+            # 1. Get Scene Description (Text) - prefetched during idle time if we're lucky
+            scene_description = await scene_prefetcher.get(scene_prefetch.get_turn_id(chat_history))
+            if scene_description is None:
+                scene_description, _ = await asyncio.to_thread(describe_scene, last_message)
             await ctx.send(f"🎨 **Painting the scene:** _{scene_description[:150]}..._")
             
             # 2. Generate Image (Visual)
@@ -626,13 +694,194 @@ async def snapshot(ctx):
             await ctx.send(f"⚠️ Snapshot Error: {e}")
             return
 
+@bot.command()
+async def save_face(ctx):
+    """Saves the attached photo (normalized once) as your face for !avatar."""
+    if not ctx.message.attachments:
+        await ctx.send("📸 Attach a photo to `!save_face`.")
+        return
+    try:
+        raw = await ctx.message.attachments[0].read()
+        face = await avatar_pipeline.save_face(str(ctx.author.id), raw)
+    except ValueError as e:
+        await ctx.send(f"⚠️ {e}")
+        return
+    await ctx.send(f"✅ Face saved ({face['raw_bytes'] / 1024:.0f} KB → {face['bytes'] / 1024:.0f} KB). "
+                   "Try `!avatar [style]`.")
+
+@bot.command()
+async def avatar(ctx, *, style: str = "High Fantasy"):
+    """Turns the attached photo, or your saved face, into a character portrait."""
+    if usage_tracker.budget_state(campaign_id()) == "over":
+        await ctx.send("💸 This campaign has spent its budget. Avatars are paused (`!usage budget <usd>` to raise it).")
+        return
+    with usage_tracker.attribute("avatar", player=str(ctx.author.id), campaign=campaign_id()):
+        await paint_avatar(ctx, style)
+
+async def paint_avatar(ctx, style):
+    async with ctx.typing():
+        try:
+            if ctx.message.attachments:
+                face = await avatar_pipeline.prepare(await ctx.message.attachments[0].read())
+            else:
+                face = await avatar_pipeline.load_face(str(ctx.author.id))
+            if face is None:
+                await ctx.send("📸 Attach a photo, or save one first with `!save_face`.")
+                return
+
+            img_bytes, ext, cached = await avatar_pipeline.render(
+                face, style, image_generator.generate_avatar, image_generator.AVATAR_MODEL_ID
+            )
+            if img_bytes:
+                with io.BytesIO(img_bytes) as image_binary:
+                    await ctx.send(f"🧝 **{style}**" + (" *(cached)*" if cached else ""),
+                                   file=discord.File(fp=image_binary, filename=f"avatar.{ext}"))
+            else:
+                await ctx.send(f"⚠️ Avatar Failed: {ext}")
+        except ValueError as e:
+            await ctx.send(f"⚠️ {e}")
+        except Exception as e:
+            await ctx.send(f"⚠️ Avatar Error: {e}")
+
 @bot.command()
 async def fix(ctx):
     chat_history.clear()
+    if story_index_ready:
+        story_index.sync(chat_history)
     await ctx.send("🧹 Memory Wiped.")
 
 @bot.command()
-async def logs(ctx):
-    await ctx.send(f"Log Size: {len(DEBUG_LOG)}")
+async def catchup(ctx):
+    """Recap: the latest scene summaries plus the last few turns."""
+    parts = []
+    scenes = story_summarizer.recent_scenes(3)
+    if scenes:
+        parts.append("📜 **Previously...**\n" + "\n\n".join(scenes))
+    if chat_history:
+        parts.append("🕯️ **Most recently:**\n" + "\n".join(chat_history[-4:]))
+    await send_chunked_message(ctx, "\n\n".join(parts) or "Nothing has happened yet.")
 
-bot.run(os.getenv("DISCORD_TOKEN"))
+@bot.command()
+async def legend(ctx):
+    """The tale so far, from the campaign and session summaries."""
+    parts = story_summarizer.legend()
+    if not parts:
+        await ctx.send("📖 The legend is still being written. Play on!")
+        return
+    await send_chunked_message(ctx, "📖 **The Legend So Far**\n\n" + "\n\n".join(parts))
+
+@bot.command()
+async def backup(ctx):
+    """Back up the campaign now (only changed chunks are uploaded)."""
+    if backups is None:
+        await ctx.send("☁️ Backups aren't configured (set the Google Drive variables or `BACKUP_BACKEND`).")
+        return
+    async with ctx.typing():
+        try:
+            results = await run_backup()
+        except Exception as e:
+            await ctx.send(f"⚠️ Backup Error: {e}")
+            return
+    lines = []
+    for r in results:
+        if r["skipped"]:
+            lines.append(f"`{r['file']}` unchanged")
+        else:
+            kind = "full snapshot" if r["full"] else "incremental"
+            lines.append(f"`{r['file']}` {kind}: {r['new_chunks']}/{r['chunks']} chunks, "
+                         f"{r['uploaded_bytes'] / 1024:.1f} KB of {r['size'] / 1024:.1f} KB")
+    await ctx.send(f"☁️ **Backed up to {backups.backend.describe()}**\n" + "\n".join(lines))
+
+LOG_FILTERS = ("level", "module", "channel", "turn", "page")
+
+@bot.command()
+async def logs(ctx, *filters):
+    """Recent log records, newest first. Filters: level=warn module=cache channel=here turn=<id> page=<n>."""
+    query = {}
+    for f in filters:
+        key, _, value = f.partition("=")
+        if not value and key.isdigit():
+            key, value = "page", key
+        if key not in LOG_FILTERS or not value:
+            await ctx.send(f"Unknown filter `{f}`. Use " + " ".join(f"`{k}=`" for k in LOG_FILTERS))
+            return
+        query[key] = value.lower() if key in ("level", "module") else value
+    if query.get("channel") == "here":
+        query["channel"] = ctx.channel.id
+    try:
+        page = max(1, int(query.pop("page", 1)))
+    except ValueError:
+        await ctx.send("`page=` takes a number.")
+        return
+
+    records, total = await asyncio.to_thread(structured_log.search, page=page, **query)
+    if not records:
+        await ctx.send("No matching log records." if total == 0 else f"Only {total} matching records.")
+        return
+    pages = -(-total // structured_log.PAGE_SIZE)
+    lines = "\n".join(structured_log.format_record(r, width=120) for r in records).replace("`", "'")
+    await ctx.send(f"📜 **Logs** (page {page}/{pages}, {total} records)\n```\n{lines[:1700]}\n```"
+                   f"-# {structured_log.format_stats()}")
+
+@bot.command()
+async def status(ctx):
+    """Uptime, the DM's current thought, prefetch stats, model-call health, loop stalls and per-stage latency."""
+    uptime = str(datetime.now() - start_time).split(".")[0]
+    worker_line = (f"🧵 **Workers:** {workers.processes} processes, {workers.in_flight()} turns in flight, "
+                   f"{workers.turns} played\n" if workers else "")
+    await ctx.send(
+        f"⏱️ **Uptime:** {uptime}\n"
+        f"🧠 **Thinking:** {last_thought} · mode {game_modes.last_mode}\n"
+        f"🎨 {scene_prefetcher.format_stats()} · {avatar_pipeline.format_stats()}\n"
+        f"🔥 {turn_prewarmer.format_stats()}\n"
+        f"🛡️ **Model calls:** {resilience.format_status()}\n"
+        f"{worker_line}"
+        f"🐢 **Event loop:** {watchdog.format_status()}\n"
+        f"📊 **Turn latency (slowest stages):**\n{metrics.format_status()}"
+    )
+
+@bot.command()
+async def usage(ctx, action: str = None, amount: float = None):
+    """Token usage and estimated cost. '!usage budget <usd>' caps this campaign (0 removes the cap)."""
+    campaign = campaign_id()
+    if action and action.lower() == "budget":
+        if amount is None:
+            await ctx.send("Usage: `!usage budget <usd>` (0 removes the cap)")
+            return
+        usage_tracker.set_budget(campaign, amount)
+        await ctx.send(f"💰 Campaign budget set to ${amount:.2f}." if amount else "💰 Campaign budget removed.")
+        return
+
+    def line(label, t):
+        return (f"**{label}:** ${t['cost']:.4f} · {t['calls']} text / {t['images']} image / {t['tts']} TTS calls · "
+                f"{t['prompt']:,} prompt ({t['cached']:,} cached) + {t['output']:,} out tokens")
+
+    spent = usage_tracker.totals("by_campaign", campaign)
+    budget = usage_tracker.get_budget(campaign)
+    budget_text = f" of ${budget:.2f} ({usage_tracker.budget_state(campaign)})" if budget else ""
+    rows = [
+        f"📈 **Usage** (campaign `{campaign}`){budget_text}",
+        line("This campaign", spent),
+        line("You, today", usage_tracker.totals("by_player", str(ctx.author.id), days=1)),
+        "**By command (lifetime):** " + (", ".join(
+            f"`{command}` ${t['cost']:.4f}" for command, t in usage_tracker.breakdown("by_command").items()
+        ) or "nothing yet"),
+    ]
+    top_players = list(usage_tracker.breakdown("by_player").items())[:5]
+    if top_players:
+        rows.append("**Top players:** " + ", ".join(f"<@{uid}> ${t['cost']:.4f}" for uid, t in top_players))
+    await send_chunked_message(ctx, "\n".join(rows))
+
+if __name__ == "__main__":
+    if "--profile-startup" in sys.argv:
+        import startup_profile
+        startup_profile.report("main")
+        sys.exit(0)
+
+    load_data()
+    if workers:
+        # Fork while this process is still idle: rules and state loaded, no threads, gateway not connected
+        workers.start()
+    structured_log.LOG_DIR = LOG_DIR
+    structured_log.start()
+    bot.run(os.getenv("DISCORD_TOKEN"))
@@ -0,0 +1,186 @@
+import asyncio
+import contextvars
+import os
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import structured_log
+
+# Per-stage latency for DM turns: context build, cache lookup, each model round,
+# each tool call, Discord send, save. Percentiles come from a rolling window of
+# recent samples; the Prometheus histogram buckets are cumulative since start.
+WINDOW = 1000
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+QUANTILES = (0.5, 0.95, 0.99)
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+_stages = {}
+_exporters = []  # Extra Prometheus text providers (see register_exporter)
+
+
+class StageStats:
+    def __init__(self):
+        self.samples = deque(maxlen=WINDOW)
+        self.bucket_counts = [0] * len(BUCKETS)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+        self.count += 1
+        self.total += seconds
+        for i, bound in enumerate(BUCKETS):
+            if seconds <= bound:
+                self.bucket_counts[i] += 1
+
+    def percentile(self, q):
+        if not self.samples:
+            return 0.0
+        ordered = sorted(self.samples)
+        index = min(len(ordered) - 1, int(q * len(ordered)))
+        return ordered[index]
+
+
+class Turn:
+    """Spans recorded during one DM turn, in the order they finished."""
+
+    def __init__(self, turn_id):
+        self.turn_id = turn_id
+        self.spans = []
+
+    def __repr__(self):
+        parts = ", ".join(f"{stage}={seconds * 1000:.0f}ms" for stage, seconds in self.spans)
+        return f"<Turn {self.turn_id}: {parts}>"
+
+
+def observe(stage, seconds):
+    stats = _stages.get(stage)
+    if stats is None:
+        stats = _stages[stage] = StageStats()
+    stats.observe(seconds)
+    turn = _current_turn.get()
+    if turn is not None:
+        turn.spans.append((stage, seconds))
+
+
+@contextmanager
+def span(stage):
+    """Times the enclosed block. Works around awaits and inside asyncio.to_thread."""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(stage, time.perf_counter() - started)
+
+
+@contextmanager
+def turn(turn_id):
+    """Groups every span inside the block under one turn; also records 'turn_total'."""
+    current = Turn(turn_id)
+    token = _current_turn.set(current)
+    started = time.perf_counter()
+    try:
+        yield current
+    finally:
+        _current_turn.reset(token)
+        elapsed = time.perf_counter() - started
+        observe("turn_total", elapsed)
+        current.spans.append(("turn_total", elapsed))
+
+
+def current_turn():
+    return _current_turn.get()
+
+
+def summary():
+    """{stage: {"count", "p50", "p95", "p99"}} over the rolling window."""
+    return {
+        stage: {
+            "count": stats.count,
+            **{f"p{int(q * 100)}": stats.percentile(q) for q in QUANTILES},
+        }
+        for stage, stats in sorted(_stages.items())
+    }
+
+
+def format_status(limit=8):
+    """Short text block for !status, slowest stages (by p95) first."""
+    rows = sorted(summary().items(), key=lambda kv: kv[1]["p95"], reverse=True)[:limit]
+    if not rows:
+        return "No turns measured yet."
+    return "\n".join(
+        f"`{stage}` p50 {s['p50'] * 1000:.0f}ms · p95 {s['p95'] * 1000:.0f}ms · p99 {s['p99'] * 1000:.0f}ms ({s['count']})"
+        for stage, s in rows
+    )
+
+
+def reset():
+    _stages.clear()
+
+
+# --- PROMETHEUS EXPORT ---
+
+def register_exporter(fn):
+    """fn() -> Prometheus text lines appended to every export (e.g. token usage)."""
+    _exporters.append(fn)
+
+
+def render_prometheus():
+    lines = [
+        "# HELP dm_stage_latency_seconds Latency of each DM turn stage.",
+        "# TYPE dm_stage_latency_seconds histogram",
+    ]
+    for stage, stats in sorted(_stages.items()):
+        for bound, count in zip(BUCKETS, stats.bucket_counts):
+            lines.append(f'dm_stage_latency_seconds_bucket{{stage="{stage}",le="{bound}"}} {count}')
+        lines.append(f'dm_stage_latency_seconds_bucket{{stage="{stage}",le="+Inf"}} {stats.count}')
+        lines.append(f'dm_stage_latency_seconds_sum{{stage="{stage}"}} {stats.total:.6f}')
+        lines.append(f'dm_stage_latency_seconds_count{{stage="{stage}"}} {stats.count}')
+
+    lines.append("# HELP dm_stage_latency_window_seconds Rolling-window latency quantiles per stage.")
+    lines.append("# TYPE dm_stage_latency_window_seconds gauge")
+    for stage, stats in sorted(_stages.items()):
+        for q in QUANTILES:
+            lines.append(f'dm_stage_latency_window_seconds{{stage="{stage}",quantile="{q}"}} {stats.percentile(q):.6f}')
+
+    for exporter in _exporters:
+        try:
+            lines.extend(exporter())
+        except Exception as e:
+            structured_log.warn("metrics", f"Exporter failed: {e}")
+    return "\n".join(lines) + "\n"
+
+
+def write_file(path):
+    """Blocking atomic write of the Prometheus text (for node_exporter's textfile collector)."""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(render_prometheus())
+    os.replace(tmp_path, path)
+
+
+async def serve(port, host="127.0.0.1"):
+    """Tiny HTTP endpoint: GET /metrics returns the Prometheus text."""
+
+    async def handle(reader, writer):
+        try:
+            request_line = await reader.readline()
+            while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass  # Skip headers
+            path = request_line.split()[1].decode() if len(request_line.split()) > 1 else "/"
+            if path.startswith("/metrics"):
+                status, body = "200 OK", render_prometheus().encode()
+            else:
+                status, body = "404 Not Found", b"not found\n"
+            writer.write(
+                f"HTTP/1.1 {status}\r\nContent-Type: text/plain; version=0.0.4\r\n"
+                f"Content-Length: {len(body)}\r\nConnection: close\r\n\r\n".encode() + body
+            )
+            await writer.drain()
+        finally:
+            writer.close()
+
+    server = await asyncio.start_server(handle, host, port)
+    structured_log.info("metrics", f"Serving /metrics on {host}:{port}")
+    return server
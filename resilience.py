@@ -0,0 +1,270 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+from lazy_imports import LazyModule
+import structured_log
+
+httpx = LazyModule("httpx")
+
+# Model-call resilience, applied per call instead of per turn:
+# - errors are classified by status code / exception type (not by message text);
+#   rate limits, timeouts and 5xx are retried with jittered backoff, 4xx are not
+# - a circuit breaker per model fails fast while the API is unhealthy
+# - optional hedging: if a call is slower than that model's recent p95, a second
+#   identical request is fired and whichever answers first wins
+# Retrying one model call never replays tools: tools run only from the single
+# response each call returns, so a retried or hedged round can't act twice
+# (see dm_turn.run_turn).
+
+MAX_ATTEMPTS = int(os.getenv("MODEL_MAX_ATTEMPTS", "3"))
+BASE_DELAY_SECONDS = 1.0
+MAX_DELAY_SECONDS = 20.0
+# Per-attempt cap; the HTTP timeout (GENAI_TIMEOUT_SECONDS) is the hard backstop
+ATTEMPT_TIMEOUT_SECONDS = float(os.getenv("MODEL_ATTEMPT_TIMEOUT_SECONDS", "60"))
+
+BREAKER_FAILURES = 5          # Consecutive retryable failures that open the circuit
+BREAKER_RESET_SECONDS = 30.0  # Then one trial call is let through
+
+HEDGE_ENABLED = os.getenv("HEDGE_REQUESTS", "0") == "1"
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MIN_DELAY_SECONDS = 0.5
+LATENCY_WINDOW = 200
+
+RETRYABLE = {"rate_limit", "timeout", "unavailable", "server"}
+
+
+class CircuitOpenError(Exception):
+    """The model's circuit is open; the call was not attempted."""
+
+
+def classify(error):
+    """rate_limit, timeout, unavailable, server, client or unknown."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        if code == 429:
+            return "rate_limit"
+        if code in (408, 504):
+            return "timeout"
+        if code == 503:
+            return "unavailable"
+        if code >= 500:
+            return "server"
+        if code >= 400:
+            return "client"
+    if isinstance(error, (TimeoutError, asyncio.TimeoutError)):
+        return "timeout"
+    if isinstance(error, httpx.TimeoutException):
+        return "timeout"
+    if isinstance(error, (httpx.TransportError, ConnectionError)):
+        return "unavailable"
+    return "unknown"
+
+
+class CircuitBreaker:
+    """closed -> open after BREAKER_FAILURES in a row -> half_open after the reset time -> closed on success."""
+
+    def __init__(self, name, failures=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS, clock=time.monotonic):
+        self.name = name
+        self.failures_to_open = failures
+        self.reset_seconds = reset_seconds
+        self._clock = clock
+        self._lock = threading.Lock()
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trips = 0
+
+    def before_call(self):
+        with self._lock:
+            if self.state == "open":
+                if self._clock() - self.opened_at < self.reset_seconds:
+                    raise CircuitOpenError(f"{self.name} circuit open")
+                self.state = "half_open"  # Let one trial through
+            elif self.state == "half_open":
+                raise CircuitOpenError(f"{self.name} circuit half-open, trial in progress")
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.state == "half_open" or self.failures >= self.failures_to_open:
+                if self.state != "open":
+                    self.trips += 1
+                    structured_log.warn("resilience", f"Circuit for {self.name} opened after {self.failures} failure(s).")
+                self.state = "open"
+                self.opened_at = self._clock()
+
+    def release_trial(self):
+        """A half-open trial ended with a non-health error (e.g. 400); allow another trial."""
+        with self._lock:
+            if self.state == "half_open":
+                self.state = "open"
+                self.opened_at = self._clock() - self.reset_seconds
+
+
+class LatencyTracker:
+    def __init__(self, window=LATENCY_WINDOW):
+        self.samples = deque(maxlen=window)
+
+    def observe(self, seconds):
+        self.samples.append(seconds)
+
+    def p95(self):
+        if len(self.samples) < HEDGE_MIN_SAMPLES:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(0.95 * len(ordered)))]
+
+
+_breakers = {}
+_latency = {}
+_registry_lock = threading.Lock()
+stats = {"calls": 0, "retries": 0, "failures": 0, "fast_fails": 0, "hedges": 0, "hedge_wins": 0}
+
+
+def breaker_for(model):
+    with _registry_lock:
+        if model not in _breakers:
+            _breakers[model] = CircuitBreaker(model)
+        return _breakers[model]
+
+
+def latency_for(model):
+    with _registry_lock:
+        if model not in _latency:
+            _latency[model] = LatencyTracker()
+        return _latency[model]
+
+
+def backoff_delay(attempt):
+    """Full jitter: uniform(0, BASE_DELAY_SECONDS * 2^attempt), capped."""
+    return random.uniform(0, min(MAX_DELAY_SECONDS, BASE_DELAY_SECONDS * (2 ** attempt)))
+
+
+def reset():
+    """Forgets breakers, latency history and counters (tests)."""
+    with _registry_lock:
+        _breakers.clear()
+        _latency.clear()
+    for key in stats:
+        stats[key] = 0
+
+
+# --- ASYNC CALLS ---
+
+async def _attempt(fn, model, hedge, timeout):
+    """One logical attempt: the call, plus a hedge if it's slower than recent p95."""
+    tracker = latency_for(model)
+    started = time.monotonic()
+    primary = asyncio.ensure_future(asyncio.to_thread(fn))
+    hedge_delay = tracker.p95() if hedge else None
+    tasks = [primary]
+    try:
+        if hedge_delay is not None:
+            hedge_delay = max(hedge_delay, HEDGE_MIN_DELAY_SECONDS)
+            done, _ = await asyncio.wait([primary], timeout=min(hedge_delay, timeout))
+            if not done and time.monotonic() - started < timeout:
+                stats["hedges"] += 1
+                tasks.append(asyncio.ensure_future(asyncio.to_thread(fn)))
+
+        deadline = started + timeout
+        errors = []
+        pending = set(tasks)
+        while pending:
+            done, pending = await asyncio.wait(pending, timeout=max(0.0, deadline - time.monotonic()),
+                                               return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"{model} call exceeded {timeout:.0f}s")
+            for task in done:
+                if task.exception() is None:
+                    if task is not primary:
+                        stats["hedge_wins"] += 1
+                    tracker.observe(time.monotonic() - started)
+                    return task.result()
+                errors.append(task.exception())
+        raise errors[0]
+    finally:
+        for task in tasks:
+            if not task.done():
+                # The worker thread finishes on its own; we just stop waiting for it
+                task.cancel()
+
+
+async def call(fn, model, hedge=False, attempts=MAX_ATTEMPTS, timeout=ATTEMPT_TIMEOUT_SECONDS):
+    """
+    Runs blocking fn() in a worker thread with per-call retries, the model's
+    circuit breaker and optional hedging. fn must be safe to run twice.
+    """
+    breaker = breaker_for(model)
+    stats["calls"] += 1
+    for attempt in range(attempts):
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            stats["fast_fails"] += 1
+            raise
+        try:
+            result = await _attempt(fn, model, hedge, timeout)
+        except Exception as e:
+            kind = classify(e)
+            if kind not in RETRYABLE:
+                breaker.release_trial()
+                stats["failures"] += 1
+                raise
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                stats["failures"] += 1
+                raise
+            delay = backoff_delay(attempt)
+            stats["retries"] += 1
+            structured_log.info("resilience", f"{model}: {kind} ({e}); retry {attempt + 1}/{attempts - 1} in {delay:.1f}s")
+            await asyncio.sleep(delay)
+            continue
+        breaker.record_success()
+        return result
+
+
+def call_blocking(fn, model, attempts=MAX_ATTEMPTS):
+    """call() for code already running in a worker thread (no hedging, no per-attempt timeout)."""
+    breaker = breaker_for(model)
+    stats["calls"] += 1
+    for attempt in range(attempts):
+        try:
+            breaker.before_call()
+        except CircuitOpenError:
+            stats["fast_fails"] += 1
+            raise
+        try:
+            result = fn()
+        except Exception as e:
+            kind = classify(e)
+            if kind not in RETRYABLE:
+                breaker.release_trial()
+                stats["failures"] += 1
+                raise
+            breaker.record_failure()
+            if attempt == attempts - 1:
+                stats["failures"] += 1
+                raise
+            stats["retries"] += 1
+            time.sleep(backoff_delay(attempt))
+            continue
+        breaker.record_success()
+        return result
+
+
+def format_status():
+    """One line for !status."""
+    open_circuits = [b.name for b in _breakers.values() if b.state != "closed"]
+    return (
+        f"{stats['calls']} calls, {stats['retries']} retries, {stats['failures']} failed, "
+        f"{stats['fast_fails']} fast-failed, hedges {stats['hedge_wins']}/{stats['hedges']} won"
+        + (f" · ⚠️ open: {', '.join(open_circuits)}" if open_circuits else "")
+    )
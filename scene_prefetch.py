@@ -0,0 +1,172 @@
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict, deque
+
+from usage_tracker import estimate_cost
+import structured_log
+
+# --- TUNING ---
+# Wait this long after a DM reply before spending tokens on a guess.
+# If the players keep chatting, the pending prefetch is cancelled for free.
+PREFETCH_IDLE_SECONDS = 20
+# Low-priority budget: max speculative description calls per rolling hour.
+PREFETCH_HOURLY_BUDGET = 20
+# Only the latest few turns are worth keeping around.
+PREFETCH_CACHE_SIZE = 4
+
+
+def build_scene_prompt(last_message):
+    """Prompt used to turn the latest story beat into an image-generator description."""
+    # We explicitly ask for an 'Oil Painting' style to avoid photorealistic NSFW triggers
+    return (
+        f"Based on the last message: '{last_message}', "
+        "describe the scene for an image generator. "
+        "Focus on lighting, atmosphere, and fantasy armor. "
+        "Avoid explicit anatomy; focus on the romantic tension and facial expressions. "
+        "Style: Digital Fantasy Art, Painterly, Cinematic Lighting."
+    )
+
+
+def get_turn_id(history):
+    """Identifies the latest turn. Length alone collides after !fix, so mix in a content hash."""
+    if not history:
+        return None
+    digest = hashlib.md5(history[-1].encode()).hexdigest()[:8]
+    return f"{len(history)}:{digest}"
+
+
+class ScenePrefetcher:
+    """
+    Speculatively describes the latest turn so !snapshot can skip straight to Imagen.
+
+    describe_fn(last_message) is a blocking call returning (description, usage_metadata);
+    it runs in a worker thread so the event loop never waits on it.
+    """
+
+    def __init__(self, describe_fn, idle_seconds=PREFETCH_IDLE_SECONDS,
+                 hourly_budget=PREFETCH_HOURLY_BUDGET, max_entries=PREFETCH_CACHE_SIZE):
+        self.describe_fn = describe_fn
+        self.idle_seconds = idle_seconds
+        self.hourly_budget = hourly_budget
+        self.max_entries = max_entries
+
+        self._entries = OrderedDict()  # turn_id -> (description, cost)
+        self._pending = None           # (turn_id, task)
+        self._in_flight = None         # task whose API call has already been paid for
+        self._recent_calls = deque()   # monotonic timestamps of spent prefetches
+
+        self.hits = 0
+        self.misses = 0
+        self.prefetches = 0
+        self.skipped_budget = 0
+        self.wasted = 0
+        self.wasted_cost = 0.0
+
+    def schedule(self, turn_id, last_message):
+        """Queue a low-priority prefetch for this turn, superseding any older one."""
+        if turn_id is None or turn_id in self._entries:
+            return
+        # !snapshot only ever asks for the newest turn, so older guesses are dead weight.
+        for stale_id in list(self._entries):
+            self._discard(stale_id)
+        self._cancel_pending()
+        task = asyncio.create_task(self._run(turn_id, last_message))
+        self._pending = (turn_id, task)
+
+    async def get(self, turn_id):
+        """Returns the description for this turn, or None on a miss."""
+        if turn_id in self._entries:
+            description, _ = self._entries.pop(turn_id)
+            self.hits += 1
+            return description
+
+        if self._pending and self._pending[0] == turn_id:
+            task = self._pending[1]
+            if task is self._in_flight:
+                # The call is already paid for; waiting beats starting a duplicate.
+                description = await asyncio.shield(task)
+                if description is not None and turn_id in self._entries:
+                    self._entries.pop(turn_id)
+                    self.hits += 1
+                    return description
+            else:
+                self._cancel_pending()
+
+        self.misses += 1
+        return None
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "prefetches": self.prefetches,
+            "skipped_budget": self.skipped_budget,
+            "wasted": self.wasted,
+            "wasted_cost_usd": round(self.wasted_cost, 6),
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return (
+            f"Prefetch: {s['hit_rate']:.0%} hit rate ({s['hits']}/{s['hits'] + s['misses']}), "
+            f"{s['prefetches']} calls, {s['wasted']} wasted (~${s['wasted_cost_usd']:.4f}), "
+            f"{s['skipped_budget']} skipped by budget"
+        )
+
+    # --- INTERNALS ---
+
+    def _cancel_pending(self):
+        if self._pending:
+            _, task = self._pending
+            if not task.done() and task is not self._in_flight:
+                task.cancel()
+            self._pending = None
+
+    def _within_budget(self):
+        cutoff = time.monotonic() - 3600
+        while self._recent_calls and self._recent_calls[0] < cutoff:
+            self._recent_calls.popleft()
+        return len(self._recent_calls) < self.hourly_budget
+
+    def _discard(self, turn_id):
+        _, cost = self._entries.pop(turn_id)
+        self.wasted += 1
+        self.wasted_cost += cost
+
+    def _store(self, turn_id, description, cost):
+        self._entries[turn_id] = (description, cost)
+        while len(self._entries) > self.max_entries:
+            self._discard(next(iter(self._entries)))
+
+    async def _run(self, turn_id, last_message):
+        try:
+            await asyncio.sleep(self.idle_seconds)
+        except asyncio.CancelledError:
+            return None
+
+        if not self._within_budget():
+            self.skipped_budget += 1
+            return None
+
+        task = asyncio.current_task()
+        self._in_flight = task
+        self._recent_calls.append(time.monotonic())
+        self.prefetches += 1
+        try:
+            description, usage = await asyncio.to_thread(self.describe_fn, last_message)
+        except Exception as e:
+            structured_log.warn("prefetch", f"Scene description failed: {e}")
+            return None
+        finally:
+            if self._in_flight is task:
+                self._in_flight = None
+            if self._pending and self._pending[1] is task:
+                self._pending = None
+
+        if not description:
+            return None
+        self._store(turn_id, description, estimate_cost(usage))
+        return description
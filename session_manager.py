@@ -0,0 +1,133 @@
+import os
+import json
+import time
+import asyncio
+
+import structured_log
+
+# Interview sessions (!create, !world) used to live in plain dicts forever.
+# Abandoned ones now expire after SESSION_TTL_HOURS of silence.
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_HOURS", "6")) * 3600
+# Only the recent conversation matters to the persona; older lines are dropped.
+MAX_SESSION_HISTORY = 60
+# Sweep in slices so thousands of stale sessions never stall the event loop.
+SWEEP_BATCH = 500
+
+
+class SessionStore:
+    """
+    uid -> {"history": [...]} with idle expiry, a capped history and optional
+    JSON persistence so in-progress interviews survive a redeploy.
+
+    Behaves like the dict it replaces for `in`, `[]`, `[] =` and `pop`.
+    """
+
+    def __init__(self, name, ttl_seconds=SESSION_TTL_SECONDS, max_history=MAX_SESSION_HISTORY,
+                 persist_path=None, clock=time.time):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.max_history = max_history
+        self.persist_path = persist_path
+        self._clock = clock  # Wall clock, so persisted timestamps stay meaningful
+        self._sessions = {}
+        self._last_seen = {}
+        self._dirty = False
+
+    # --- DICT-LIKE ACCESS ---
+
+    def __contains__(self, uid):
+        if uid not in self._sessions:
+            return False
+        if self._is_expired(uid):
+            self._drop(uid)
+            return False
+        return True
+
+    def __getitem__(self, uid):
+        if uid not in self:
+            raise KeyError(uid)
+        self._last_seen[uid] = self._clock()
+        return self._sessions[uid]
+
+    def __setitem__(self, uid, session):
+        session.setdefault("history", [])
+        self._sessions[uid] = session
+        self._last_seen[uid] = self._clock()
+        self._dirty = True
+
+    def __len__(self):
+        return len(self._sessions)
+
+    def pop(self, uid, default=None):
+        if uid not in self._sessions:
+            return default
+        session = self._sessions[uid]
+        self._drop(uid)
+        return session
+
+    def append(self, uid, line):
+        """Adds a line to the session history, keeping only the newest max_history."""
+        history = self[uid]["history"]
+        history.append(line)
+        if len(history) > self.max_history:
+            del history[:-self.max_history]
+        self._dirty = True
+
+    # --- EXPIRY ---
+
+    def _is_expired(self, uid):
+        return self._clock() - self._last_seen.get(uid, 0) > self.ttl_seconds
+
+    def _drop(self, uid):
+        self._sessions.pop(uid, None)
+        self._last_seen.pop(uid, None)
+        self._dirty = True
+
+    async def sweep(self, batch=SWEEP_BATCH):
+        """Removes expired sessions, yielding to the event loop every `batch` checks."""
+        removed = 0
+        for i, uid in enumerate(list(self._sessions)):
+            if i and i % batch == 0:
+                await asyncio.sleep(0)
+            if uid in self._sessions and self._is_expired(uid):
+                self._drop(uid)
+                removed += 1
+        return removed
+
+    # --- PERSISTENCE ---
+
+    def snapshot(self):
+        """JSON-ready copy; cheap enough to take on the loop, dump it off the loop."""
+        return {
+            uid: {"session": {**s, "history": list(s["history"])}, "last_seen": self._last_seen[uid]}
+            for uid, s in self._sessions.items()
+        }
+
+    def save_if_dirty(self):
+        """Returns a blocking save callable (for asyncio.to_thread) or None if nothing changed."""
+        if not self.persist_path or not self._dirty:
+            return None
+        data = self.snapshot()
+        self._dirty = False
+        path = self.persist_path
+
+        def write():
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f, separators=(",", ":"))
+            os.replace(tmp_path, path)
+        return write
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            structured_log.warn("sessions", f"Could not load {self.name} sessions: {e}")
+            return
+        for uid, entry in data.items():
+            self._sessions[uid] = entry["session"]
+            self._last_seen[uid] = entry["last_seen"]
+        structured_log.info("sessions", f"Restored {len(data)} {self.name} session(s).")
@@ -1,73 +1,228 @@
 import os
+import re
 import wave
 import io
-from google import genai
-from google.genai import types
-from dotenv import load_dotenv
+import shutil
+import subprocess
+import contextvars
+from concurrent.futures import ThreadPoolExecutor
+from lazy_imports import LazyModule
+import genai_client
+import audio_cache
+import usage_tracker
+import structured_log
+
+types = LazyModule("google.genai.types")
 
-load_dotenv()
 # Initialize Client
 # LAZY LOADING: Moved inside functions to prevent startup crashes.
 SPEECH_MODEL_ID = 'gemini-3-flash-preview'
 
-# Singleton Client
-_client_instance = None
+# Shared, pooled client (see genai_client.py)
+get_client = genai_client.get_client
+
+# --- CHUNKING ---
+# Each chunk is one TTS request. Smaller chunks start playing sooner and
+# parallelize better; too small and the voice loses its phrasing.
+MAX_CHUNK_CHARS = 600
+MAX_PARALLEL_CHUNKS = 4
+
+# Gemini TTS returns raw 24 kHz 16-bit mono PCM
+SAMPLE_RATE = 24000
+SAMPLE_WIDTH = 2
+CHANNELS = 1
+
+# Upload format for !narrate: 'ogg' (Opus) is ~1/20th the size of WAV and plays inline in Discord.
+# Needs ffmpeg on PATH; falls back to WAV without it.
+NARRATION_FORMAT = os.getenv("NARRATION_FORMAT", "ogg").lower()
+
+_ENCODER_ARGS = {
+    "ogg": ["-c:a", "libopus", "-b:a", "32k", "-f", "ogg"],
+    "mp3": ["-c:a", "libmp3lame", "-b:a", "48k", "-f", "mp3"],
+}
+
+_SENTENCE_END = re.compile(r'(?:(?<=[.!?…])|(?<=[.!?…]["\'’”)*]))\s+')
+
+def split_into_chunks(text, max_chars=MAX_CHUNK_CHARS):
+    """
+    Splits narration on paragraph, then sentence, then word boundaries
+    so no chunk exceeds max_chars. Short neighbours are merged back together.
+    """
+    pieces = []
+    for para in re.split(r'\n\s*\n', text):
+        para = para.strip()
+        if not para:
+            continue
+        for sentence in _SENTENCE_END.split(para):
+            sentence = sentence.strip()
+            while len(sentence) > max_chars:
+                # Run-on sentence: fall back to the last space before the limit
+                cut = sentence.rfind(" ", 0, max_chars)
+                if cut <= 0:
+                    cut = max_chars
+                pieces.append(sentence[:cut].strip())
+                sentence = sentence[cut:].strip()
+            if sentence:
+                pieces.append(sentence)
+        pieces.append(None)  # paragraph break marker
+
+    chunks = []
+    current = ""
+    for piece in pieces:
+        if piece is None:
+            # Prefer to end a chunk at a paragraph break once it has some body
+            if len(current) >= max_chars // 2:
+                chunks.append(current)
+                current = ""
+            continue
+        candidate = f"{current} {piece}" if current else piece
+        if len(candidate) > max_chars:
+            chunks.append(current)
+            current = piece
+        else:
+            current = candidate
+    if current:
+        chunks.append(current)
+    return chunks
+
+def pcm_to_wav(pcm_data):
+    """Wraps raw PCM in a WAV header."""
+    with io.BytesIO() as wav_io:
+        with wave.open(wav_io, "wb") as wf:
+            wf.setnchannels(CHANNELS)
+            wf.setsampwidth(SAMPLE_WIDTH)
+            wf.setframerate(SAMPLE_RATE)
+            wf.writeframes(pcm_data)
+        return wav_io.getvalue()
 
-def get_client():
-    global _client_instance
-    if _client_instance is None:
-        _client_instance = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
-    return _client_instance
+def resolve_format(fmt=None):
+    """The format we can actually produce here ('wav' if the encoder is missing)."""
+    fmt = (fmt or NARRATION_FORMAT).lower()
+    if fmt not in _ENCODER_ARGS or not shutil.which("ffmpeg"):
+        return "wav"
+    return fmt
 
-def generate_speech(text, voice_name='Kore'):
+def encode_audio(pcm_data, fmt=None):
+    """
+    Encodes raw PCM for upload.
+    Returns: (audio_bytes, extension_string)
+    """
+    fmt = resolve_format(fmt)
+    if fmt == "wav":
+        return pcm_to_wav(pcm_data), "wav"
+
+    cmd = [
+        "ffmpeg", "-loglevel", "error",
+        "-f", "s16le", "-ar", str(SAMPLE_RATE), "-ac", str(CHANNELS), "-i", "pipe:0",
+        *_ENCODER_ARGS[fmt], "pipe:1",
+    ]
+    try:
+        proc = subprocess.run(cmd, input=pcm_data, capture_output=True, timeout=60)
+        if proc.returncode == 0 and proc.stdout:
+            return proc.stdout, fmt
+        structured_log.warn("tts", f"{fmt} encode failed, sending WAV: {proc.stderr.decode(errors='ignore')[:200]}")
+    except (OSError, subprocess.TimeoutExpired) as e:
+        structured_log.warn("tts", f"{fmt} encode failed, sending WAV: {e}")
+    return pcm_to_wav(pcm_data), "wav"
+
+# --- SYNTHESIS ---
+
+def synthesize_pcm(text, voice_name='Kore'):
+    """
+    One blocking TTS request. Returns raw PCM bytes or raises.
+    Swappable in tests via the synth_fn arguments below.
+    """
+    client = get_client()
+    response = client.models.generate_content(
+        model=SPEECH_MODEL_ID,
+        contents=[types.Part(text=text)], # Wrapped for SDK consistency
+        config=types.GenerateContentConfig(
+            response_modalities=["AUDIO"],
+            speech_config=types.SpeechConfig(
+                voice_config=types.VoiceConfig(
+                    prebuilt_voice_config=types.PrebuiltVoiceConfig(
+                        voice_name=voice_name,
+                    )
+                )
+            ),
+        )
+    )
+
+    usage_tracker.record_response(response, kind="tts")
+
+    # Verify response structure
+    if not response.candidates or not response.candidates[0].content.parts:
+        raise RuntimeError("API returned successfully but contained no content.")
+
+    part = response.candidates[0].content.parts[0]
+    if not part.inline_data:
+        raise RuntimeError("No inline_data (audio) found in the response parts.")
+    return part.inline_data.data
+
+def iter_speech_pcm(text, voice_name='Kore', synth_fn=None, max_workers=MAX_PARALLEL_CHUNKS,
+                    max_chars=MAX_CHUNK_CHARS):
+    """
+    Synthesizes chunks concurrently (bounded) and yields their PCM in story order
+    as soon as each one (and everything before it) is ready.
+    """
+    synth_fn = synth_fn or synthesize_pcm
+    chunks = split_into_chunks(text, max_chars)
+    if not chunks:
+        return
+
+    with ThreadPoolExecutor(max_workers=max_workers) as pool:
+        # Each worker gets a copy of our context so usage is billed to the caller
+        futures = [pool.submit(contextvars.copy_context().run, synth_fn, chunk, voice_name) for chunk in chunks]
+        try:
+            for future in futures:
+                yield future.result()
+        finally:
+            # Consumer bailed out early (or a chunk failed): don't pay for the rest
+            for future in futures:
+                future.cancel()
+
+def generate_speech(text, voice_name='Kore', synth_fn=None, max_workers=MAX_PARALLEL_CHUNKS):
     """
     Generates speech audio from text using Gemini TTS.
+    Long narrations are split into sentence chunks synthesized in parallel,
+    so latency tracks the slowest chunk rather than the whole text.
     Returns: (wav_bytes, error_message)
     """
     if not text:
         return None, "Empty text provided."
 
-    # Prevent potential API crashes on massive narrations
-    safe_text = text[:3000] 
-
     try:
-        client = get_client()
-        response = client.models.generate_content(
-            model=SPEECH_MODEL_ID,
-            contents=[types.Part(text=safe_text)], # Wrapped for SDK consistency
-            config=types.GenerateContentConfig(
-                response_modalities=["AUDIO"],
-                speech_config=types.SpeechConfig(
-                    voice_config=types.VoiceConfig(
-                        prebuilt_voice_config=types.PrebuiltVoiceConfig(
-                            voice_name=voice_name,
-                        )
-                    )
-                ),
-            )
-        )
-        
-        # Verify response structure
-        if not response.candidates or not response.candidates[0].content.parts:
-            return None, "API returned successfully but contained no content."
-
-        part = response.candidates[0].content.parts[0]
-        
-        if part.inline_data:
-            pcm_data = part.inline_data.data
-            
-            # Convert PCM to WAV
-            with io.BytesIO() as wav_io:
-                with wave.open(wav_io, "wb") as wf:
-                    wf.setnchannels(1)
-                    wf.setsampwidth(2) 
-                    wf.setframerate(24000)
-                    wf.writeframes(pcm_data)
-                
-                return wav_io.getvalue(), None
-                    
-        return None, "No inline_data (audio) found in the response parts."
+        pcm_data = b"".join(iter_speech_pcm(text, voice_name, synth_fn=synth_fn, max_workers=max_workers))
+        if not pcm_data:
+            return None, "No audio produced."
+        return pcm_to_wav(pcm_data), None
 
     except Exception as e:
-        print(f"[TTS ERROR] {e}") # Log it for !logs
+        structured_log.error("tts", f"Narration failed: {e}")
         return None, str(e)
+
+def generate_narration(text, voice_name='Kore', fmt=None, synth_fn=None):
+    """
+    Upload-ready narration for !narrate, served from the disk cache when possible.
+    Returns: (audio_bytes, extension_string) or (None, error_string)
+    """
+    if not text:
+        return None, "Empty text provided."
+
+    fmt = resolve_format(fmt)
+    key = audio_cache.make_key(text, voice_name, SPEECH_MODEL_ID)
+    cached = audio_cache.get(key, fmt)
+    if cached:
+        return cached, fmt
+
+    try:
+        pcm_data = b"".join(iter_speech_pcm(text, voice_name, synth_fn=synth_fn))
+        if not pcm_data:
+            return None, "No audio produced."
+    except Exception as e:
+        structured_log.error("tts", f"Narration failed: {e}")
+        return None, str(e)
+
+    audio_bytes, ext = encode_audio(pcm_data, fmt)
+    audio_cache.put(key, ext, audio_bytes)
+    return audio_bytes, ext
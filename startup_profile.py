@@ -0,0 +1,47 @@
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+# Startup profiling: `python main.py --profile-startup`
+# Imports the bot in a fresh interpreter with -X importtime and groups the
+# cost by top-level package, so we can see what a redeploy spends before connecting.
+
+_LINE = re.compile(r"import time:\s+(\d+)\s+\|\s+(\d+)\s+\|(\s*)(\S+)")
+
+def profile_imports(module="main"):
+    """Returns ({top_level_package: seconds}, total_seconds) for importing `module` cold."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr else "import failed")
+
+    by_package = defaultdict(float)
+    children = []  # -X importtime lists a module's imports right before the module itself
+    total = 0.0
+    for line in proc.stderr.splitlines():
+        match = _LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, name = match.groups()
+        depth = (len(indent) - 1) // 2
+        if depth == 1:
+            children.append((name, int(cumulative_us)))
+        elif depth == 0:
+            total += int(cumulative_us) / 1_000_000
+            if name == module:
+                for child, child_us in children:
+                    by_package[child.split(".")[0]] += child_us / 1_000_000
+                by_package[f"{name} (own code)"] += int(self_us) / 1_000_000
+            else:
+                by_package[name.split(".")[0]] += int(cumulative_us) / 1_000_000
+            children = []
+    return dict(by_package), total
+
+def report(module="main", top=12):
+    by_package, total = profile_imports(module)
+    print(f"[STARTUP] Importing '{module}' took {total:.3f}s")
+    for name, seconds in sorted(by_package.items(), key=lambda kv: kv[1], reverse=True)[:top]:
+        print(f"  {seconds:7.3f}s  {seconds / total:5.1%}  {name}")
@@ -0,0 +1,164 @@
+import math
+import re
+import heapq
+from array import array
+from bisect import bisect_left
+
+# Long-term memory for the DM: a BM25 inverted index over every line of
+# chat_history, so an NPC named in session 3 can be recalled in session 30
+# without sending the whole history. Updates only index the new lines.
+
+K1 = 1.2
+B = 0.75
+# Terms in more than this share of turns say little and cost a lot to scan;
+# they're skipped unless the query has nothing rarer.
+MAX_DF_RATIO = 0.05
+# Names, places and @mentions count extra when the query mentions them.
+ENTITY_BOOST = 2.0
+# Per-term scan cap: for very common terms only the most recent matches are scored,
+# which keeps queries in low milliseconds at 100k turns.
+MAX_POSTINGS_SCAN = 4000
+DEFAULT_RESULTS = 4
+SNIPPET_CHARS = 280
+MIN_SCORE = 1.0
+
+_WORD = re.compile(r"[a-z0-9]+")
+_CAPITALIZED = re.compile(r"(?<![.!?:]\s)(?<!^)\b([A-Z][a-z]{2,})\b")
+_MENTION = re.compile(r"<@!?(\d+)>")
+
+STOPWORDS = frozenset("""
+a an and are as at be but by can could did do does for from had has have he her
+him his i if in into is it its just me my no not of on or our she so than that the
+their them then there they this to too up was we were what when where which who
+will with would you your dm yes ok okay let lets
+""".split())
+# Capitalized words that are almost never names
+NOT_ENTITIES = frozenset("""
+the a an and but or you your yours my we our they their he she his her it its this that
+what when where who why how yes no roll dm tip type perception dc somewhere
+""".split())
+
+
+def tokenize(text):
+    return [w for w in _WORD.findall(text.lower()) if len(w) > 1 and w not in STOPWORDS]
+
+
+def extract_entities(text):
+    """Likely NPC/place names (capitalized mid-sentence words) and Discord mentions."""
+    names = {m.group(1).lower() for m in _CAPITALIZED.finditer(text)}
+    names -= NOT_ENTITIES
+    names.update(f"user{uid}" for uid in _MENTION.findall(text))
+    return names
+
+
+class StoryIndex:
+    """
+    BM25 over chat_history lines; a line's doc id is its index in the history.
+    Postings are compact arrays, appended in doc order, so adding a turn is
+    O(its length) and queries can skip the recent window with a bisect.
+    """
+
+    def __init__(self, max_df_ratio=MAX_DF_RATIO):
+        self.max_df_ratio = max_df_ratio
+        self.reset()
+
+    def reset(self):
+        self._postings = {}  # term -> (doc ids, term frequencies)
+        self._doc_len = array("I")
+        self._total_len = 0
+
+    def __len__(self):
+        return len(self._doc_len)
+
+    def add(self, text):
+        """Indexes one more line; returns its doc id."""
+        doc_id = len(self._doc_len)
+        counts = {}
+        for term in tokenize(text):
+            counts[term] = counts.get(term, 0) + 1
+        for entity in extract_entities(text):
+            key = "@" + entity
+            counts[key] = counts.get(key, 0) + 1
+        for term, tf in counts.items():
+            postings = self._postings.get(term)
+            if postings is None:
+                postings = self._postings[term] = (array("I"), array("H"))
+            postings[0].append(doc_id)
+            postings[1].append(min(tf, 65535))
+        length = sum(counts.values())
+        self._doc_len.append(length)
+        self._total_len += length
+        return doc_id
+
+    def sync(self, history):
+        """Brings the index up to date with `history` (append-only; a shorter one means !fix)."""
+        if len(history) < len(self):
+            self.reset()
+        for i in range(len(self), len(history)):
+            self.add(history[i])
+
+    def search(self, query, limit=DEFAULT_RESULTS, before=None):
+        """[(doc_id, score)] best first, only among doc ids < `before` (None = all)."""
+        n = len(self)
+        if n == 0:
+            return []
+        before = n if before is None else min(before, n)
+        avgdl = self._total_len / n
+
+        weighted = {}
+        for term in tokenize(query):
+            weighted[term] = 1.0
+            if "@" + term in self._postings:
+                weighted["@" + term] = ENTITY_BOOST
+        for entity in extract_entities(query):
+            weighted["@" + entity] = ENTITY_BOOST
+
+        terms = [(t, w, self._postings[t]) for t, w in weighted.items() if t in self._postings]
+        if not terms:
+            return []
+        max_df = max(1, int(n * self.max_df_ratio))
+        selective = [t for t in terms if len(t[2][0]) <= max_df]
+        if not selective:
+            # Only common words: use the rarest one so the query still answers
+            selective = [min(terms, key=lambda t: len(t[2][0]))]
+
+        scores = {}
+        doc_len = self._doc_len
+        for term, weight, (doc_ids, tfs) in selective:
+            df = len(doc_ids)
+            idf = weight * math.log(1 + (n - df + 0.5) / (df + 0.5))
+            norm = K1 * (1 - B)
+            scale = K1 * B / avgdl
+            end = bisect_left(doc_ids, before)
+            for i in range(max(0, end - MAX_POSTINGS_SCAN), end):
+                doc_id = doc_ids[i]
+                tf = tfs[i]
+                score = idf * tf * (K1 + 1) / (tf + norm + scale * doc_len[doc_id])
+                scores[doc_id] = scores.get(doc_id, 0.0) + score
+        return heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+
+
+def snippet(text, query, max_chars=SNIPPET_CHARS):
+    """The part of a line around its first query word, trimmed to max_chars."""
+    if len(text) <= max_chars:
+        return text
+    lowered = text.lower()
+    hits = [lowered.find(t) for t in tokenize(query)]
+    first = min((h for h in hits if h >= 0), default=0)
+    start = max(0, min(first - max_chars // 3, len(text) - max_chars))
+    piece = text[start:start + max_chars].strip()
+    return ("…" if start else "") + piece + ("…" if start + max_chars < len(text) else "")
+
+
+def recall(index, history, query, exclude_recent, limit=DEFAULT_RESULTS, min_score=MIN_SCORE):
+    """Relevant lines from before the recent window, formatted for the DM prompt ('' if none)."""
+    hits = index.search(query, limit=limit, before=len(history) - exclude_recent)
+    lines = []
+    for doc_id, score in sorted(hits):  # Chronological reads better than by score
+        if score < min_score:
+            continue
+        text = history[doc_id]
+        tags = sorted(extract_entities(text))[:4]
+        tag_text = f" · {', '.join(t.title() for t in tags)}" if tags else ""
+        lines.append(f"[Turn {doc_id}{tag_text}] {snippet(text, query)}")
+    return "\n".join(lines)
@@ -0,0 +1,215 @@
+import os
+import json
+import asyncio
+import hashlib
+
+import structured_log
+
+# Hierarchical recap of the history that has scrolled out of the DM's verbatim
+# window: every SCENE_LINES lines become a scene summary, every SCENES_PER_SESSION
+# scenes a session summary, and all sessions one campaign summary. Each summary
+# is keyed by a hash of what it covers, so it's only recomputed when that changes.
+SCENE_LINES = 40
+SCENES_PER_SESSION = 8
+SCENE_WORDS = 120
+SESSION_WORDS = 200
+CAMPAIGN_WORDS = 300
+
+
+def _digest(parts):
+    h = hashlib.md5()
+    for part in parts:
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()[:12]
+
+
+def scene_prompt(lines):
+    return (
+        f"Summarize this stretch of a D&D campaign in at most {SCENE_WORDS} words. "
+        "Keep NPC and place names, promises, debts, loot, injuries and unresolved threads. "
+        "Past tense, no commentary.\n\n" + "\n".join(lines)
+    )
+
+
+def session_prompt(scene_texts):
+    return (
+        f"Combine these consecutive scene summaries into one session summary of at most {SESSION_WORDS} words. "
+        "Keep names and open plot threads; drop minor beats.\n\n" + "\n\n".join(scene_texts)
+    )
+
+
+def campaign_prompt(session_texts):
+    return (
+        f"Write 'the story so far' for this campaign in at most {CAMPAIGN_WORDS} words from these session "
+        "summaries, oldest first. Keep the main characters, factions, goals and open threads.\n\n"
+        + "\n\n".join(session_texts)
+    )
+
+
+class StorySummarizer:
+    """
+    Materialized scene/session/campaign summaries over chat_history.
+
+    summarize_fn(prompt) is a blocking model call returning text; step() runs it
+    in a worker thread, a few calls at a time, when the caller decides it's idle.
+    """
+
+    def __init__(self, summarize_fn, scene_lines=SCENE_LINES, scenes_per_session=SCENES_PER_SESSION,
+                 persist_path=None):
+        self.summarize_fn = summarize_fn
+        self.scene_lines = scene_lines
+        self.scenes_per_session = scenes_per_session
+        self.persist_path = persist_path
+        self.scenes = []     # [{"start", "end", "key", "text"}] in order, contiguous from line 0
+        self.sessions = []   # [{"scenes": n, "key", "text"}] each over scenes_per_session scenes
+        self.campaign = None  # {"sessions": n, "key", "text"} over the first n sessions
+        self.calls = 0
+        self._dirty = False
+
+    # --- PLANNING ---
+
+    def _validate(self, history):
+        """History is append-only except !fix; drop whatever no longer matches it."""
+        before = (len(self.scenes), len(self.sessions), self.campaign is not None)
+        while self.scenes and self.scenes[-1]["end"] > len(history):
+            self.scenes.pop()
+        if self.scenes:
+            last = self.scenes[-1]
+            if _digest(history[last["start"]:last["end"]]) != last["key"]:
+                self.scenes.clear()
+        complete = len(self.scenes) // self.scenes_per_session
+        while len(self.sessions) > complete:
+            self.sessions.pop()
+        for i, session in enumerate(self.sessions):
+            if session["key"] != self._session_key(i):
+                del self.sessions[i:]
+                break
+        if self.campaign and not self._campaign_valid():
+            self.campaign = None
+        if (len(self.scenes), len(self.sessions), self.campaign is not None) != before:
+            self._dirty = True
+
+    def _session_key(self, i):
+        group = self.scenes[i * self.scenes_per_session:(i + 1) * self.scenes_per_session]
+        return _digest(s["key"] for s in group)
+
+    def _campaign_key(self, sessions):
+        return _digest(s["key"] for s in self.sessions[:sessions])
+
+    def _campaign_valid(self):
+        n = self.campaign["sessions"]
+        return n <= len(self.sessions) and self.campaign["key"] == self._campaign_key(n)
+
+    def pending(self, history, window):
+        """Next piece of work as (tier, prompt, meta), or None when up to date."""
+        self._validate(history)
+        summarizable_end = max(0, len(history) - window)
+        start = self.scenes[-1]["end"] if self.scenes else 0
+        if start + self.scene_lines <= summarizable_end:
+            lines = history[start:start + self.scene_lines]
+            return "scene", scene_prompt(lines), {"start": start, "end": start + self.scene_lines,
+                                                  "key": _digest(lines)}
+
+        i = len(self.sessions)
+        if (i + 1) * self.scenes_per_session <= len(self.scenes):
+            group = self.scenes[i * self.scenes_per_session:(i + 1) * self.scenes_per_session]
+            return "session", session_prompt([s["text"] for s in group]), {
+                "scenes": len(group), "key": self._session_key(i)}
+
+        if self.sessions and (not self.campaign or self.campaign["sessions"] < len(self.sessions)):
+            n = len(self.sessions)
+            return "campaign", campaign_prompt([s["text"] for s in self.sessions]), {
+                "sessions": n, "key": self._campaign_key(n)}
+        return None
+
+    # --- WORK ---
+
+    async def step(self, history, window, max_calls=2):
+        """Summarizes up to max_calls pending pieces (oldest, lowest tier first). Returns calls made."""
+        made = 0
+        while made < max_calls:
+            work = self.pending(history, window)
+            if work is None:
+                break
+            tier, prompt, meta = work
+            text = await asyncio.to_thread(self.summarize_fn, prompt)
+            made += 1
+            self.calls += 1
+            if not text:
+                break
+            # The history may have changed (e.g. !fix) while we waited; re-plan before storing.
+            if self.pending(history, window) != work:
+                continue
+            text = text.strip()
+            if tier == "scene":
+                self.scenes.append({**meta, "text": text})
+            elif tier == "session":
+                self.sessions.append({**meta, "text": text})
+            else:
+                self.campaign = {**meta, "text": text}
+            self._dirty = True
+            structured_log.info("summary", f"Materialized {tier} summary ({len(text)} chars)")
+        return made
+
+    # --- READING ---
+
+    def story_so_far(self, history, window):
+        """Summary tiers covering the history before the verbatim window, for the DM prompt."""
+        self._validate(history)
+        parts = []
+        covered_sessions = 0
+        if self.campaign:
+            covered_sessions = self.campaign["sessions"]
+            parts.append(f"[Campaign so far]\n{self.campaign['text']}")
+        # Sessions the campaign summary doesn't cover yet, then scenes not yet in a session
+        for i, session in enumerate(self.sessions[covered_sessions:], start=covered_sessions + 1):
+            parts.append(f"[Session {i}]\n{session['text']}")
+        cutoff = max(0, len(history) - window)
+        for scene in self.scenes[len(self.sessions) * self.scenes_per_session:]:
+            if scene["end"] <= cutoff:
+                parts.append(f"[Recent scene]\n{scene['text']}")
+        return "\n\n".join(parts)
+
+    def recent_scenes(self, count=3):
+        return [s["text"] for s in self.scenes[-count:]]
+
+    def legend(self):
+        """Campaign summary plus every session summary, oldest first."""
+        parts = []
+        if self.campaign:
+            parts.append(self.campaign["text"])
+        parts += [f"**Session {i}.** {s['text']}" for i, s in enumerate(self.sessions, start=1)]
+        return parts
+
+    # --- PERSISTENCE ---
+
+    def save_if_dirty(self):
+        """Returns a blocking save callable (for asyncio.to_thread) or None if nothing changed."""
+        if not self.persist_path or not self._dirty:
+            return None
+        data = json.dumps({"scenes": self.scenes, "sessions": self.sessions, "campaign": self.campaign},
+                          separators=(",", ":"))
+        self._dirty = False
+        path = self.persist_path
+
+        def write():
+            tmp_path = path + ".tmp"
+            with open(tmp_path, "w") as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        return write
+
+    def load(self):
+        if not self.persist_path or not os.path.exists(self.persist_path):
+            return
+        try:
+            with open(self.persist_path, "r") as f:
+                data = json.load(f)
+        except Exception as e:
+            structured_log.warn("summary", f"Could not load summaries: {e}")
+            return
+        self.scenes = data.get("scenes", [])
+        self.sessions = data.get("sessions", [])
+        self.campaign = data.get("campaign")
+        structured_log.info("summary", f"Restored {len(self.scenes)} scene / {len(self.sessions)} session summaries.")
@@ -0,0 +1,303 @@
+import os
+import sys
+import json
+import time
+import queue
+import threading
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime
+
+import metrics
+
+# Structured, non-blocking logging. info("cache", "Created: ...") builds a record
+#   {"ts", "level", "module", "msg", "channel", "turn", ...extra fields}
+# and only appends it to a queue; a background writer thread echoes it to the
+# console and appends it to an on-disk ring of LOG_SEGMENTS files of at most
+# LOG_SEGMENT_KB each (the oldest segment is overwritten when the ring wraps).
+# bind() tags everything logged inside (awaits and to_thread included) with the
+# channel and turn id, and times what logging cost that turn ("log_overhead").
+# !logs reads the ring back with search().
+#
+# Worker processes (see worker_pool.py) don't write the ring: their records are
+# captured per turn and shipped back with the result, like usage.
+
+LEVELS = {"debug": 10, "info": 20, "warn": 30, "error": 40}
+LOG_DIR = None  # Set by main (DATA_DIR/logs); None keeps records in memory only
+SEGMENT_BYTES = int(os.getenv("LOG_SEGMENT_KB", "512")) * 1024
+SEGMENTS = int(os.getenv("LOG_SEGMENTS", "8"))
+ECHO_LEVEL = os.getenv("LOG_ECHO_LEVEL", "info")  # Console shows this level and up
+RECENT_RECORDS = 2000  # In memory, for search() without a LOG_DIR
+MAX_PENDING = 20000  # Past this the writer is stuck; drop rather than grow
+PAGE_SIZE = 15  # Records per !logs page
+
+_scope = contextvars.ContextVar("log_scope", default=None)
+_queue = queue.SimpleQueue()
+_recent = deque(maxlen=RECENT_RECORDS)
+_writer = None
+_worker = False
+_stats = {"logged": 0, "dropped": 0, "written": 0, "written_bytes": 0}
+
+
+class _Scope:
+    def __init__(self, channel, turn, capture):
+        self.channel = channel
+        self.turn = turn
+        self.captured = [] if capture else None
+        self.seconds = 0.0  # Time spent in log() calls inside the scope
+        self.count = 0
+
+
+@contextmanager
+def bind(channel=None, turn=None, capture=False):
+    """
+    Tags records logged inside the block with the channel and turn (inherited
+    when not given). capture=True keeps them in scope.captured instead (workers).
+    """
+    outer = _scope.get()
+    if outer is not None:
+        channel = outer.channel if channel is None else channel
+        turn = outer.turn if turn is None else turn
+    scope = _Scope(channel, turn, capture)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+        if outer is not None:
+            outer.seconds += scope.seconds
+            outer.count += scope.count
+            if outer.captured is not None and scope.captured:
+                outer.captured.extend(scope.captured)
+        elif not capture:
+            metrics.observe("log_overhead", scope.seconds)
+
+
+# --- LOGGING ---
+
+def log(level, module, message, **fields):
+    """Queues one record; never blocks on the console or the disk."""
+    started = time.perf_counter()
+    scope = _scope.get()
+    record = {"ts": time.time(), "level": level, "module": module, "msg": str(message)}
+    if scope is not None:
+        if scope.channel is not None:
+            record["channel"] = scope.channel
+        if scope.turn is not None:
+            record["turn"] = scope.turn
+    if fields:
+        record.update(fields)
+    _emit(record, scope)
+    if scope is not None:
+        scope.seconds += time.perf_counter() - started
+        scope.count += 1
+
+
+def debug(module, message, **fields):
+    log("debug", module, message, **fields)
+
+
+def info(module, message, **fields):
+    log("info", module, message, **fields)
+
+
+def warn(module, message, **fields):
+    log("warn", module, message, **fields)
+
+
+def error(module, message, **fields):
+    log("error", module, message, **fields)
+
+
+def ingest(records, seconds=0.0):
+    """Gateway side: logs records captured in a worker under the current channel and turn."""
+    scope = _scope.get()
+    for record in records:
+        if scope is not None:
+            if scope.channel is not None:
+                record.setdefault("channel", scope.channel)
+            if scope.turn is not None:
+                record.setdefault("turn", scope.turn)
+        _emit(record, scope)
+    if scope is not None:
+        scope.seconds += seconds
+
+
+def _emit(record, scope):
+    if scope is not None and scope.captured is not None:
+        scope.captured.append(record)
+        return
+    _stats["logged"] += 1
+    _recent.append(record)
+    if _writer is None:
+        _echo([record])  # Not started (tests, tools, workers between turns): print in place
+    elif _queue.qsize() >= MAX_PENDING:
+        _stats["dropped"] += 1
+    else:
+        _queue.put(record)
+
+
+def format_record(record, width=None):
+    when = datetime.fromtimestamp(record["ts"]).strftime("%H:%M:%S")
+    tag = record["module"].upper()
+    if record["level"] in ("warn", "error"):
+        tag += " " + record["level"].upper()
+    turn = f" #{record['turn']}" if record.get("turn") is not None else ""
+    line = f"[{when}] [{tag}]{turn} {record['msg']}"
+    if width and len(line) > width:
+        line = line[:width - 1] + "…"
+    return line
+
+
+def _echo(records):
+    threshold = LEVELS.get(ECHO_LEVEL, 20)
+    for record in records:
+        if LEVELS.get(record["level"], 20) >= threshold:
+            print(format_record(record))
+
+
+# --- WRITER ---
+
+class RingWriter:
+    """JSON lines over SEGMENTS files of at most SEGMENT_BYTES; the oldest is reused when full."""
+
+    def __init__(self, directory, segment_bytes=SEGMENT_BYTES, segments=SEGMENTS):
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.segments = segments
+        os.makedirs(directory, exist_ok=True)
+        existing = [i for i in range(segments) if os.path.exists(self._path(i))]
+        # Carry on in the newest segment after a restart
+        self.index = max(existing, key=lambda i: os.path.getmtime(self._path(i))) if existing else 0
+        self._file = open(self._path(self.index), "ab")
+        self.size = self._file.tell()
+
+    def _path(self, i):
+        return os.path.join(self.directory, f"log.{i}.jsonl")
+
+    def write(self, data):
+        if self.size and self.size + len(data) > self.segment_bytes:
+            self._file.close()
+            self.index = (self.index + 1) % self.segments
+            self._file = open(self._path(self.index), "wb")
+            self.size = 0
+        self._file.write(data)
+        self._file.flush()
+        self.size += len(data)
+
+    def read(self):
+        """Every record in the ring, oldest first."""
+        records = []
+        for step in range(1, self.segments + 1):
+            path = self._path((self.index + step) % self.segments)
+            if not os.path.exists(path):
+                continue
+            with open(path, "rb") as f:
+                for line in f:
+                    try:
+                        records.append(json.loads(line))
+                    except ValueError:
+                        pass  # A line cut short by a crash
+        return records
+
+    def close(self):
+        self._file.close()
+
+
+class _Writer:
+    def __init__(self):
+        self.ring = None
+        self.ring_dir = None
+        self.thread = threading.Thread(target=self._run, name="log-writer", daemon=True)
+        self.thread.start()
+
+    def _ring(self):
+        if LOG_DIR != self.ring_dir:
+            if self.ring:
+                self.ring.close()
+            self.ring = RingWriter(LOG_DIR) if LOG_DIR else None
+            self.ring_dir = LOG_DIR
+        return self.ring
+
+    def _run(self):
+        while True:
+            batch = [_queue.get()]
+            while len(batch) < 500:
+                try:
+                    batch.append(_queue.get_nowait())
+                except queue.Empty:
+                    break
+            records = [r for r in batch if isinstance(r, dict)]
+            try:
+                _echo(records)
+                ring = self._ring()
+                if ring and records:
+                    data = "".join(json.dumps(r, default=str) + "\n" for r in records).encode()
+                    ring.write(data)
+                    _stats["written"] += len(records)
+                    _stats["written_bytes"] += len(data)
+            except Exception as e:
+                print(f"[LOG] Writer failed: {e}", file=sys.stderr)
+            for item in batch:
+                if isinstance(item, threading.Event):
+                    item.set()  # flush() is waiting for this batch
+
+
+def start():
+    """Starts the background writer (records logged before this were printed in place)."""
+    global _writer
+    if _writer is None and not _worker:
+        _writer = _Writer()
+
+
+def flush(timeout=2.0):
+    """Blocks until everything queued so far is written."""
+    if _writer is None:
+        return True
+    done = threading.Event()
+    _queue.put(done)
+    return done.wait(timeout)
+
+
+def configure_worker():
+    """In a forked worker: no writer (the gateway's didn't survive the fork); turns capture their records."""
+    global _writer, _queue, _worker
+    _writer = None
+    _queue = queue.SimpleQueue()
+    _worker = True
+
+
+# --- READING ---
+
+def search(level=None, module=None, channel=None, turn=None, page=1, per_page=PAGE_SIZE):
+    """Newest-first records matching the filters, one page of them: (records, total). Blocking."""
+    flush()
+    ring = _writer.ring if _writer and LOG_DIR and _writer.ring_dir == LOG_DIR else None
+    records = ring.read() if ring else list(_recent)
+    floor = LEVELS.get(level, 0)
+    matches = [
+        r for r in reversed(records)
+        if LEVELS.get(r.get("level"), 20) >= floor
+        and (module is None or r.get("module") == module)
+        and (channel is None or str(r.get("channel")) == str(channel))
+        and (turn is None or str(r.get("turn")) == str(turn))
+    ]
+    start_at = (max(1, page) - 1) * per_page
+    return matches[start_at:start_at + per_page], len(matches)
+
+
+def stats():
+    overhead = metrics.summary().get("log_overhead")
+    return {
+        **_stats,
+        "pending": _queue.qsize(),
+        "per_turn_p50_ms": round(overhead["p50"] * 1000, 3) if overhead else 0.0,
+        "per_turn_p99_ms": round(overhead["p99"] * 1000, 3) if overhead else 0.0,
+    }
+
+
+def format_stats():
+    s = stats()
+    return (f"{s['logged']} logged, {s['dropped']} dropped, {s['written_bytes'] / 1024:.0f} KB written · "
+            f"overhead per message p50 {s['per_turn_p50_ms']:.2f}ms, p99 {s['per_turn_p99_ms']:.2f}ms")
@@ -0,0 +1,108 @@
+import os
+import shutil
+import subprocess
+import tempfile
+
+import audio_cache
+import speech_generator
+
+# Offline: narration is served from the disk cache, evicted by size and falls back to WAV without ffmpeg.
+
+
+class CacheDir:
+    """Points audio_cache at a fresh directory with the given byte cap, restoring it afterwards."""
+
+    def __init__(self, max_bytes=10 * 1024 * 1024):
+        self.max_bytes = max_bytes
+
+    def __enter__(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.saved = audio_cache.CACHE_DIR, audio_cache.MAX_BYTES, audio_cache._total_bytes
+        audio_cache.CACHE_DIR = os.path.join(self.tmp.name, "tts_cache")
+        audio_cache.MAX_BYTES = self.max_bytes
+        audio_cache._total_bytes = None
+        return audio_cache.CACHE_DIR
+
+    def __exit__(self, *exc):
+        audio_cache.CACHE_DIR, audio_cache.MAX_BYTES, audio_cache._total_bytes = self.saved
+        self.tmp.cleanup()
+
+
+def fake_synth(calls):
+    def synth(text, voice_name):
+        calls.append((text, voice_name))
+        return b"\1\0" * len(text)
+    return synth
+
+
+def test_cache_hit_skips_synthesis():
+    calls = []
+    with CacheDir():
+        first = speech_generator.generate_narration("The door creaks open.", "Kore", fmt="wav", synth_fn=fake_synth(calls))
+        again = speech_generator.generate_narration("The door creaks open.", "Kore", fmt="wav", synth_fn=fake_synth(calls))
+    assert first == again and first[1] == "wav"
+    assert first[0].startswith(b"RIFF")
+    assert len(calls) == 1
+
+
+def test_key_changes_with_voice_and_model():
+    key = audio_cache.make_key("Hello, traveller.", "Kore", "tts-model-a")
+    assert key == audio_cache.make_key("Hello, traveller.", "Kore", "tts-model-a")
+    assert key != audio_cache.make_key("Hello, traveller.", "Puck", "tts-model-a")
+    assert key != audio_cache.make_key("Hello, traveller.", "Kore", "tts-model-b")
+    assert key != audio_cache.make_key("Hello, traveler.", "Kore", "tts-model-a")
+    assert "/" not in audio_cache.make_key("x", "Kore", "models/tts")
+
+    calls = []
+    with CacheDir():
+        for voice in ("Kore", "Puck", "Kore"):
+            speech_generator.generate_narration("Hello, traveller.", voice, fmt="wav", synth_fn=fake_synth(calls))
+    assert [voice for _, voice in calls] == ["Kore", "Puck"]
+
+
+def test_lru_eviction_by_byte_cap():
+    with CacheDir(max_bytes=250) as cache_dir:
+        for age, key in ((1000, "a"), (2000, "b"), (3000, "c")):
+            audio_cache.put(key, "ogg", b"x" * 100)  # Over the cap after "c": the oldest, "a", goes
+            if os.path.exists(os.path.join(cache_dir, f"{key}.ogg")):
+                os.utime(os.path.join(cache_dir, f"{key}.ogg"), (age, age))
+        assert audio_cache.get("a", "ogg") is None
+        assert audio_cache.get("b", "ogg") == b"x" * 100  # A hit makes "b" the most recent
+
+        audio_cache.put("d", "ogg", b"y" * 100)
+        assert audio_cache.get("c", "ogg") is None
+        assert audio_cache.get("b", "ogg") and audio_cache.get("d", "ogg")
+        assert sum(os.path.getsize(os.path.join(cache_dir, f)) for f in os.listdir(cache_dir)) <= 250
+
+
+def test_wav_fallback_without_working_ffmpeg():
+    pcm = b"\1\0" * 2400
+    real_which, real_run = shutil.which, subprocess.run
+    try:
+        shutil.which = lambda name: None  # Not installed
+        assert speech_generator.resolve_format("ogg") == "wav"
+        audio, ext = speech_generator.encode_audio(pcm, "ogg")
+        assert ext == "wav" and audio == speech_generator.pcm_to_wav(pcm)
+
+        shutil.which = lambda name: "/usr/bin/ffmpeg"
+        subprocess.run = lambda cmd, **kwargs: subprocess.CompletedProcess(cmd, 1, b"", b"Unknown encoder 'libopus'")
+        audio, ext = speech_generator.encode_audio(pcm, "ogg")
+        assert ext == "wav" and audio == speech_generator.pcm_to_wav(pcm)
+
+        def timeout(cmd, **kwargs):
+            raise subprocess.TimeoutExpired(cmd, 60)
+        subprocess.run = timeout
+        assert speech_generator.encode_audio(pcm, "mp3")[1] == "wav"
+
+        subprocess.run = lambda cmd, **kwargs: subprocess.CompletedProcess(cmd, 0, b"OggS...", b"")
+        assert speech_generator.encode_audio(pcm, "ogg") == (b"OggS...", "ogg")
+    finally:
+        shutil.which, subprocess.run = real_which, real_run
+
+
+if __name__ == "__main__":
+    test_cache_hit_skips_synthesis()
+    test_key_changes_with_voice_and_model()
+    test_lru_eviction_by_byte_cap()
+    test_wav_fallback_without_working_ffmpeg()
+    print("SUCCESS! Narration caches and encodes offline.")
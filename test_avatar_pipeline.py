@@ -0,0 +1,86 @@
+import asyncio
+import io
+import os
+import tempfile
+
+from PIL import Image
+
+import avatar_pipeline
+
+# Offline: selfies are normalized once and avatars are cached per (face, style).
+
+
+def phone_photo(width=4032, height=3024, orientation=6):
+    """A big noisy landscape JPEG whose EXIF says 'rotate 90°' (how phones store portraits)."""
+    img = Image.effect_noise((width, height), 64).convert("RGB")
+    img.paste((200, 40, 40), (0, 0, width // 8, height))  # Red band on the sensor's left = top once rotated
+    exif = Image.Exif()
+    exif[0x0112] = orientation
+    out = io.BytesIO()
+    img.save(out, format="JPEG", quality=95, exif=exif)
+    return out.getvalue()
+
+
+def test_normalize_orients_crops_and_shrinks():
+    raw = phone_photo()
+    face = avatar_pipeline.normalize_image(raw)
+    img = Image.open(io.BytesIO(face))
+    assert img.size == (avatar_pipeline.FACE_SIZE, avatar_pipeline.FACE_SIZE)
+    assert len(face) < len(raw) / 4
+    assert not img.getexif()  # Metadata stripped
+    # Rotated to portrait: the red band is now along the top, inside the upper-middle crop
+    r, g, b = img.getpixel((avatar_pipeline.FACE_SIZE // 2, 5))
+    assert r > 150 and g < 100
+
+
+def test_saved_face_and_avatar_cache():
+    with tempfile.TemporaryDirectory() as tmp:
+        avatar_pipeline.IMAGES_DIR = tmp
+        for key in avatar_pipeline.stats:
+            avatar_pipeline.stats[key] = 0
+        sent = []
+
+        def fake_generate(instruction, image_bytes, mime_type):
+            sent.append(len(image_bytes))
+            assert mime_type == "image/jpeg"
+            return b"avatar-bytes", "png"
+
+        async def flow():
+            # A raw upload from before normalization existed is migrated on first use
+            with open(os.path.join(tmp, "42.png"), "wb") as f:
+                Image.new("RGB", (1200, 1600), (10, 120, 200)).save(f, format="PNG")
+            face = await avatar_pipeline.load_face("42")
+            assert face["bytes"] < face["raw_bytes"]
+            assert (await avatar_pipeline.load_face("42"))["sha256"] == face["sha256"]
+
+            first = await avatar_pipeline.render(face, "Elven Ranger", fake_generate, "m")
+            again = await avatar_pipeline.render(face, "Elven Ranger", fake_generate, "m")
+            other = await avatar_pipeline.render(face, "Dwarven Smith", fake_generate, "m")
+            return face, first, again, other
+
+        face, first, again, other = asyncio.run(flow())
+        assert first == (b"avatar-bytes", "png", False)
+        assert again == (b"avatar-bytes", "png", True)
+        assert other[2] is False
+        assert sent == [face["bytes"], face["bytes"]]
+        assert avatar_pipeline.stats["cache_hits"] == 1
+        assert avatar_pipeline.stats["sent_bytes"] < avatar_pipeline.stats["raw_bytes"]
+        # The normalizing process never comes from forking the (threaded) bot
+        assert avatar_pipeline._get_pool()._mp_context.get_start_method() == "forkserver"
+
+
+def test_rejects_non_images():
+    try:
+        asyncio.run(avatar_pipeline.prepare(b"definitely not a photo"))
+        assert False, "expected ValueError"
+    except ValueError:
+        pass
+
+
+if __name__ == "__main__":
+    test_normalize_orients_crops_and_shrinks()
+    test_saved_face_and_avatar_cache()
+    test_rejects_non_images()
+    raw = phone_photo()
+    print(f"Phone photo {len(raw) / 1024:.0f} KB -> {len(avatar_pipeline.normalize_image(raw)) / 1024:.0f} KB")
+    print("SUCCESS! Avatars are normalized and cached.")
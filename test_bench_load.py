@@ -0,0 +1,34 @@
+import bench_load
+import main
+import structured_log
+import usage_tracker
+
+# Small offline run of the load harness (no network): every turn goes through
+# on_message -> model rounds -> tools -> Discord send -> save.
+
+
+def test_load_harness_small_run():
+    patched = lambda: (main.STATE_FILE, main.creation_sessions.persist_path, main.campaign_sessions.persist_path,
+                       usage_tracker.persist_path, structured_log.LOG_DIR, main.workers, main.turn_prewarmer)
+    before = patched()
+    result = bench_load.run(turns=60, channels=3, players=2, latency=0.005, jitter=0.002,
+                            reply_chars=600, send_latency=0.001)
+
+    assert result["completed_turns"] == 60
+    assert result["failed_turns"] == 0 and not result["errors"]
+    assert result["history_lines"] == 120
+    for stage in ("turn_total", "context_build", "cache_lookup", "model_round", "discord_send", "save"):
+        assert result["stages"][stage]["count"] > 0
+    # Scripted tool calls took the follow-up round
+    assert result["model_requests"]["generate"] > 60
+    assert result["stages"]["tool.roll_dice"]["count"] > 0
+    assert result["discord"]["messages"] >= 60
+    assert result["turns_per_s"] > 0
+    assert result["memory"]["rss_peak"] > 0
+    # Every module global the run patched points back where it did
+    assert patched() == before
+
+
+if __name__ == "__main__":
+    test_load_harness_small_run()
+    print("SUCCESS! Load harness runs offline.")
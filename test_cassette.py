@@ -0,0 +1,100 @@
+import tempfile
+import time
+
+from google.genai import types
+
+import cassette
+
+# Offline: record calls from a fake client, then replay them without it.
+
+AUDIO = bytes(range(256)) * 40
+
+
+class FakeModels:
+    def __init__(self):
+        self.calls = 0
+
+    def generate_content(self, model, contents, config=None):
+        self.calls += 1
+        time.sleep(0.02)
+        if contents == "boom":
+            raise RuntimeError("429 RESOURCE_EXHAUSTED")
+        if model.endswith("-tts"):
+            part = {"inline_data": {"data": AUDIO, "mime_type": "audio/L16;rate=24000"}}
+        else:
+            part = {"text": f"Reply #{self.calls} to {contents}"}
+        return types.GenerateContentResponse.model_validate({
+            "candidates": [{"content": {"role": "model", "parts": [part]}}],
+            "usage_metadata": {"prompt_token_count": 10, "candidates_token_count": 5},
+        })
+
+
+class FakeCaches:
+    def update(self, name, config):
+        return types.CachedContent(name=name, display_name="DM_Cache_combat_v_1", expire_time="2026-01-01T01:00:00Z")
+
+
+class FakeClient:
+    def __init__(self):
+        self.models = FakeModels()
+        self.caches = FakeCaches()
+
+
+def record(path):
+    client = cassette.RecordingClient(FakeClient(), path)
+    texts = [client.models.generate_content(model="m", contents=prompt).text for prompt in ("hello", "again")]
+    audio = client.models.generate_content(model="m-tts", contents="Speak").candidates[0].content.parts[0].inline_data.data
+    try:
+        client.models.generate_content(model="m", contents="boom")
+    except RuntimeError:
+        pass
+    return texts, audio
+
+
+def test_record_then_replay_is_identical():
+    with tempfile.TemporaryDirectory() as tmp:
+        texts, audio = record(tmp)
+        replay = cassette.ReplayClient(tmp, timing="none")
+
+        assert [replay.models.generate_content(model="m", contents=p).text for p in ("hello", "again")] == texts
+        tts = replay.models.generate_content(model="m-tts", contents="Speak")
+        assert tts.candidates[0].content.parts[0].inline_data.data == audio == AUDIO
+        assert tts.usage_metadata.prompt_token_count == 10
+        try:
+            replay.models.generate_content(model="m", contents="boom")
+            assert False, "recorded error should be raised again"
+        except cassette.ReplayedError as e:
+            assert "429" in str(e)
+        assert replay.stats() == {"hits": 4, "fallbacks": 0, "misses": 0}
+
+        # Blobs are stored once, compressed; the call log stays small
+        summary, blob_bytes = cassette.summarize(tmp)
+        assert summary["models.generate_content"]["calls"] == 4
+        assert 0 < blob_bytes < len(AUDIO)
+
+
+def test_changed_prompt_falls_back_in_order_and_timing_scales():
+    with tempfile.TemporaryDirectory() as tmp:
+        texts, _ = record(tmp)
+        slept = []
+        replay = cassette.ReplayClient(tmp, timing="0.5", sleep=slept.append)
+
+        assert replay.models.generate_content(model="m", contents="edited prompt").text == texts[0]
+        assert replay.stats()["fallbacks"] == 1
+        assert 0.005 < slept[0] < 0.05  # Half of the ~20ms recorded
+
+
+def test_cache_ttl_updates_replay():
+    with tempfile.TemporaryDirectory() as tmp:
+        config = types.UpdateCachedContentConfig(ttl="3600s")
+        recorded = cassette.RecordingClient(FakeClient(), tmp).caches.update(name="cachedContents/1", config=config)
+        replayed = cassette.ReplayClient(tmp, timing="none").caches.update(name="cachedContents/1", config=config)
+        assert replayed.name == recorded.name == "cachedContents/1"
+        assert replayed.expire_time == recorded.expire_time
+
+
+if __name__ == "__main__":
+    test_record_then_replay_is_identical()
+    test_changed_prompt_falls_back_in_order_and_timing_scales()
+    test_cache_ttl_updates_replay()
+    print("SUCCESS! Cassettes replay.")
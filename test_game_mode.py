@@ -0,0 +1,141 @@
+from datetime import datetime, timedelta, timezone
+from types import SimpleNamespace
+
+import cache_manager
+import dm_tools
+import dm_turn
+import game_mode
+
+# Offline: the mode follows the table, each mode has its own bundle and its cache stays warm.
+
+
+def tool_names(tools):
+    return {f.name for tool in tools for f in tool.function_declarations}
+
+
+def test_mode_follows_the_table():
+    modes = game_mode.ModeTracker()
+    assert modes.mode_for("We follow the river north") == "exploration"
+    assert modes.mode_for("I want to buy a rope from the merchant") == "shopping"
+    assert modes.mode_for("Let's make camp and sleep") == "downtime"
+
+    # The DM starts a fight: combat sticks until the narration ends it
+    modes.observe("I open the crypt door", "A ghoul lurches out!", events=["combat_started"])
+    assert modes.mode_for("I ask it what it wants") == "combat"
+    modes.observe("I ask it what it wants", "It snarls and claws at you.")
+    assert modes.mode_for("I look around") == "combat"
+    modes.observe("I swing my axe", "The ghoul falls dead at your feet.")
+    assert modes.mode_for("I look around") == "exploration"
+
+    # ...or after a few quiet turns
+    modes.observe("", "", events=["combat_started"])
+    for _ in range(game_mode.COMBAT_MAX_QUIET_TURNS):
+        modes.observe("I hum a tune", "The wind howls.")
+    assert not modes.in_combat
+
+
+# What the DM must be able to do in each mode
+NEEDED = {
+    "combat": {"roll_dice", "start_combat", "add_loot", "grant_xp", "update_inventory_gold"},
+    # Looting a chest or paying a ferryman happens between fights too
+    "exploration": {"roll_dice", "start_combat", "update_quest", "add_loot", "update_relationship",
+                    "update_inventory_gold", "grant_xp", "illustrate_scene"},
+    "downtime": {"roll_dice", "take_long_rest", "update_quest", "update_relationship",
+                 "update_inventory_gold", "grant_xp"},
+    "shopping": {"roll_dice", "update_inventory_gold", "add_loot", "update_relationship"},
+}
+
+
+def test_bundles_fit_their_mode():
+    assert set(dm_tools.BUNDLES) == set(game_mode.MODES) == set(NEEDED)
+    for mode in game_mode.MODES:
+        tools, config = dm_tools.bundle_for(mode)
+        assert tool_names(tools) >= NEEDED[mode], mode
+        assert config.tools == tools
+    assert "start_combat" in tool_names(dm_tools.BUNDLES["combat"])
+    assert "take_long_rest" not in tool_names(dm_tools.BUNDLES["combat"])
+    assert "illustrate_scene" not in tool_names(dm_tools.BUNDLES["shopping"])
+    assert dm_tools.bundle_for(None)[0] is dm_tools.ALL_TOOLS
+    # A bundle that changes gets a new cache instead of reusing the old one's tools
+    assert (cache_manager.get_cache_version("rules", dm_tools.BUNDLES["exploration"])
+            != cache_manager.get_cache_version("rules", dm_tools.BUNDLES["exploration"][:-1]))
+
+
+class ApiError(Exception):
+    def __init__(self, code, message):
+        super().__init__(f"{code} {message}")
+        self.code = code
+
+
+class FakeCaches:
+    def __init__(self):
+        self.items = []
+        self.created = self.updated = 0
+
+    def list(self):
+        return list(self.items)
+
+    def create(self, model, config):
+        self.created += 1
+        cache = SimpleNamespace(name=f"cachedContents/{self.created}", display_name=config.display_name,
+                                expire_time=datetime.now(timezone.utc) + timedelta(hours=1))
+        self.items.append(cache)
+        return cache
+
+    def update(self, name, config):
+        self.updated += 1
+        cache = next(c for c in self.items if c.name == name)
+        cache.expire_time = datetime.now(timezone.utc) + timedelta(hours=1)
+        return cache
+
+
+def test_keep_warm_creates_then_extends():
+    caches = FakeCaches()
+    client = SimpleNamespace(caches=caches, models=SimpleNamespace(
+        count_tokens=lambda **_: SimpleNamespace(total_tokens=5000)))
+    real_client = cache_manager.get_client
+    cache_manager.get_client = lambda: client
+    cache_manager._known_caches.clear()
+    try:
+        check_keep_warm(caches)
+    finally:
+        cache_manager.get_client = real_client
+        cache_manager._known_caches.clear()
+
+
+def check_keep_warm(caches):
+    names = {mode: cache_manager.keep_warm("rules", dm_tools.BUNDLES[mode]) for mode in game_mode.MODES}
+    distinct = len({tuple(sorted(tool_names(tools))) for tools in dm_tools.BUNDLES.values()})
+    # Modes with the same tools (combat and exploration) share one cache instead of paying twice
+    assert names["combat"] == names["exploration"]
+    assert len(set(names.values())) == distinct and caches.created == distinct
+
+    # Fresh caches are left alone; one close to expiry gets its TTL extended
+    caches.items[0].expire_time = datetime.now(timezone.utc) + timedelta(minutes=5)
+    for mode in game_mode.MODES:
+        cache_manager.keep_warm("rules", dm_tools.BUNDLES[mode])
+    assert caches.created == distinct and caches.updated == 1
+
+    # The hot path then finds every mode's cache without creating one
+    for mode in game_mode.MODES:
+        assert cache_manager.get_or_create_cache("rules", dm_tools.BUNDLES[mode]) == names[mode]
+    assert caches.created == distinct
+
+    # Startup prewarm creates one cache per distinct bundle
+    assert dm_turn.prewarm_caches() == distinct and caches.created == 2 * distinct
+
+    # A cache the API rejected is no longer trusted: the next lookup recreates it
+    assert cache_manager.is_cache_error(ApiError(404, "CachedContent not found"))
+    assert not cache_manager.is_cache_error(ApiError(400, "Invalid argument: contents"))
+    assert not cache_manager.is_cache_error(TimeoutError("model call exceeded 60s"))
+    caches.items.pop(0)
+    cache_manager.forget(names["combat"])
+    assert cache_manager.get_or_create_cache("rules", dm_tools.BUNDLES["combat"]) not in names.values()
+    assert caches.created == 2 * distinct + 1
+
+
+if __name__ == "__main__":
+    test_mode_follows_the_table()
+    test_bundles_fit_their_mode()
+    test_keep_warm_creates_then_extends()
+    print("SUCCESS! Tool bundles follow the game mode.")
@@ -0,0 +1,82 @@
+import json
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+
+import genai_client
+import image_generator
+import speech_generator
+import cache_manager
+
+# Offline: every module shares one client, and that client can be pointed
+# at a local fake server (or replaced outright) for tests.
+
+
+class FakeGeminiHandler(BaseHTTPRequestHandler):
+    paths = []
+
+    def _reply(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers["Content-Length"]))
+        self.paths.append(self.path)
+        self._reply({
+            "candidates": [{"content": {"role": "model", "parts": [{"text": "The fake DM speaks."}]}}],
+            "usageMetadata": {"promptTokenCount": 12, "candidatesTokenCount": 4},
+        })
+
+    def do_GET(self):
+        self.paths.append(self.path)
+        self._reply({"name": self.path.rsplit("/", 1)[-1]})
+
+    def log_message(self, *args):
+        pass
+
+
+def test_modules_share_one_client():
+    genai_client.reset_client()
+    sentinel = object()
+    genai_client.set_client(sentinel)
+    try:
+        assert image_generator.get_client() is sentinel
+        assert speech_generator.get_client() is sentinel
+        assert cache_manager.get_client() is sentinel
+    finally:
+        genai_client.reset_client()
+
+
+def test_client_talks_to_local_fake_server():
+    server = HTTPServer(("127.0.0.1", 0), FakeGeminiHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    old_base, old_key = genai_client.BASE_URL, os.environ.get("GEMINI_API_KEY")
+    genai_client.BASE_URL = f"http://127.0.0.1:{server.server_port}"
+    os.environ["GEMINI_API_KEY"] = "fake-key"
+    genai_client.reset_client()
+    try:
+        assert genai_client.prewarm("gemini-3-flash-preview") is not None
+        response = genai_client.get_client().models.generate_content(
+            model="gemini-3-flash-preview", contents="Hello"
+        )
+        assert response.text == "The fake DM speaks."
+        assert response.usage_metadata.prompt_token_count == 12
+        assert any(p.endswith(":generateContent") for p in FakeGeminiHandler.paths)
+    finally:
+        server.shutdown()
+        genai_client.BASE_URL = old_base
+        if old_key is None:
+            os.environ.pop("GEMINI_API_KEY", None)
+        else:
+            os.environ["GEMINI_API_KEY"] = old_key
+        genai_client.reset_client()
+
+
+if __name__ == "__main__":
+    test_modules_share_one_client()
+    test_client_talks_to_local_fake_server()
+    print("SUCCESS! Shared client behaves.")
@@ -0,0 +1,45 @@
+import asyncio
+import json
+import time
+
+import loop_watchdog
+
+# Offline: a callback that blocks the loop is caught with its stack and its turn.
+
+
+def save_everything(state):
+    """Stands in for save_state(): synchronous work on the event loop."""
+    time.sleep(0.25)
+    return json.dumps(state)
+
+
+def test_blocking_call_is_captured_with_its_turn():
+    watchdog = loop_watchdog.LoopWatchdog(threshold=0.08, beat=0.02)
+
+    async def turn():
+        watchdog.tag("turn 7 (Aria)")
+        await asyncio.sleep(0.05)
+        save_everything({"players": {}})
+
+    async def main():
+        watchdog.start()
+        await asyncio.sleep(0.1)  # Healthy loop: nothing recorded
+        assert watchdog.stalls == 0
+        await asyncio.create_task(turn())
+        await asyncio.sleep(0.1)
+        watchdog.stop()
+
+    asyncio.run(main())
+    assert watchdog.stalls == 1
+    [offender] = watchdog.top()
+    assert offender["where"].startswith("test_loop_watchdog.py:") and "save_everything" in offender["where"]
+    assert offender["inner"] == "save_everything"
+    assert offender["label"] == "turn 7 (Aria)"
+    assert offender["max"] >= 0.15
+    assert "save_everything" in offender["stack"] and "turn" in offender["stack"]
+    assert "save_everything" in watchdog.format_status()
+
+
+if __name__ == "__main__":
+    test_blocking_call_is_captured_with_its_turn()
+    print("SUCCESS! Loop stalls are caught.")
@@ -0,0 +1,65 @@
+import random
+import re
+
+import bench_message_packer
+import utils
+
+# Offline: long replies split on natural boundaries, keep markdown balanced and fit Discord's limits.
+
+
+def words(text):
+    """The reply's words with markdown markers stripped, for comparing before/after a split."""
+    return re.sub(r"[*`~|]", "", text).split()
+
+
+def test_split_keeps_markdown_balanced():
+    text = ("**" + "The goblin's blade finds only air as you twist aside. " * 60 + "**\n\n"
+            "*The torchlight gutters.* " * 20 + "\n\n```\n" + "roll 1d20+5\n" * 80 + "```")
+    chunks = utils.split_markdown(text, 500)
+    assert len(chunks) > 5
+    for chunk in chunks:
+        assert len(chunk) <= 500
+        assert utils._scan_markdown(chunk, []) == []  # Every chunk opens and closes its own spans
+    assert words(" ".join(chunks)) == words(text)
+    # A bold passage cut in the middle is reopened in the next chunk
+    assert chunks[1].startswith("**")
+
+
+def test_bullets_are_not_italics():
+    text = "* Option one\n* Option two\n\n" + "Somewhere below, chains rattle. " * 100
+    for chunk in utils.split_markdown(text, 300):
+        assert not chunk.endswith("*") or chunk.endswith("**")
+
+
+def test_pack_reply_respects_discord_limits():
+    rng = random.Random(3)
+    assert utils.pack_reply("") == []
+    assert utils.pack_reply("Short reply.") == [{"content": "Short reply."}]
+
+    for target in (1500, 2500, 9000, 30000, 80000):
+        text = bench_message_packer.make_reply(rng, target)
+        messages = utils.pack_reply(text)
+        sent = []
+        for message in messages:
+            if "content" in message:
+                assert len(message["content"]) <= utils.MESSAGE_LIMIT
+                sent.append(message["content"])
+                continue
+            embeds = message["embeds"]
+            assert 1 <= len(embeds) <= utils.MAX_EMBEDS_PER_MESSAGE
+            assert sum(len(e) for e in embeds) <= utils.EMBED_TOTAL_LIMIT
+            for description in embeds:
+                assert len(description) <= utils.EMBED_DESCRIPTION_LIMIT
+                assert utils._scan_markdown(description, []) == []
+            sent.extend(embeds)
+        assert words(" ".join(sent)) == words(text)
+        if len(text) > utils.MESSAGE_LIMIT:
+            # Packing beats the old fixed 1900-char slicing
+            assert len(messages) <= bench_message_packer.old_message_count(text)
+
+
+if __name__ == "__main__":
+    test_split_keeps_markdown_balanced()
+    test_bullets_are_not_italics()
+    test_pack_reply_respects_discord_limits()
+    print("SUCCESS! Replies pack within Discord's limits.")
@@ -0,0 +1,81 @@
+import asyncio
+import time
+
+import dm_turn
+import metrics
+
+# Offline: stage spans are grouped per turn, summarized as percentiles and exported for Prometheus.
+
+
+def test_spans_group_under_their_turn():
+    metrics.reset()
+
+    async def play(turn_id, delay):
+        with metrics.turn(turn_id) as current:
+            with metrics.span("context_build"):
+                await asyncio.sleep(delay)
+            # Threads inherit the turn, so blocking stages land in it too
+            await asyncio.to_thread(lambda: metrics.observe("model_round", delay))
+        return current
+
+    async def main():
+        return await asyncio.gather(play("a", 0.01), play("b", 0.03))
+
+    a, b = asyncio.run(main())
+    assert [stage for stage, _ in a.spans] == ["context_build", "model_round", "turn_total"]
+    assert [stage for stage, _ in b.spans] == ["context_build", "model_round", "turn_total"]
+    assert dict(b.spans)["model_round"] == 0.03
+    assert dict(a.spans)["turn_total"] >= 0.01 and dict(a.spans)["turn_total"] < dict(b.spans)["turn_total"]
+    assert metrics.current_turn() is None
+    assert metrics.summary()["turn_total"]["count"] == 2
+
+
+def test_percentiles_over_the_window():
+    metrics.reset()
+    for ms in range(1, 101):
+        metrics.observe("tool.roll_dice", ms / 1000)
+    s = metrics.summary()["tool.roll_dice"]
+    assert s["count"] == 100
+    assert (s["p50"], s["p95"], s["p99"]) == (0.051, 0.096, 0.1)
+
+    # Percentiles follow the rolling window; the count keeps every sample
+    for _ in range(metrics.WINDOW):
+        metrics.observe("tool.roll_dice", 2.0)
+    s = metrics.summary()["tool.roll_dice"]
+    assert s["count"] == 100 + metrics.WINDOW and s["p50"] == 2.0
+    assert "`tool.roll_dice` p50 2000ms" in metrics.format_status()
+
+
+def test_render_prometheus():
+    metrics.reset()
+    for seconds in (0.003, 0.2, 0.2, 90.0):
+        metrics.observe("send", seconds)
+    metrics.register_exporter(lambda: ["dm_tokens_total 42"])
+    metrics.register_exporter(lambda: 1 / 0)  # A broken exporter doesn't break the export
+    try:
+        text = metrics.render_prometheus()
+    finally:
+        del metrics._exporters[-2:]
+    assert 'dm_stage_latency_seconds_bucket{stage="send",le="0.005"} 1' in text
+    assert 'dm_stage_latency_seconds_bucket{stage="send",le="0.25"} 3' in text
+    assert 'dm_stage_latency_seconds_bucket{stage="send",le="60.0"} 3' in text
+    assert 'dm_stage_latency_seconds_bucket{stage="send",le="+Inf"} 4' in text
+    assert 'dm_stage_latency_seconds_sum{stage="send"} 90.403000' in text
+    assert 'dm_stage_latency_seconds_count{stage="send"} 4' in text
+    assert 'dm_stage_latency_window_seconds{stage="send",quantile="0.5"} 0.200000' in text
+    assert "dm_tokens_total 42\n" in text and text.endswith("\n")
+
+
+def test_tool_labels_stay_bounded():
+    assert dm_turn.tool_stage("roll_dice") == "tool.roll_dice"
+    assert dm_turn.tool_stage("illustrate_scene") == "tool.illustrate_scene"
+    # Whatever name the model invents, it can't add a new label
+    assert dm_turn.tool_stage("summon_" + str(time.time())) == "tool.other"
+
+
+if __name__ == "__main__":
+    test_spans_group_under_their_turn()
+    test_percentiles_over_the_window()
+    test_render_prometheus()
+    test_tool_labels_stay_bounded()
+    print("SUCCESS! Stage metrics group, summarize and export.")
@@ -0,0 +1,162 @@
+import asyncio
+import threading
+import time
+from types import SimpleNamespace
+
+from google.genai import errors, types
+
+import dm_turn
+import resilience
+
+# Offline: a fake client injects 429s, timeouts, 5xx and slow responses.
+
+
+def api_error(code, status):
+    cls = errors.ClientError if code < 500 else errors.ServerError
+    return cls(code, {"error": {"code": code, "message": status.lower(), "status": status}})
+
+
+class FakeModels:
+    """generate_content follows a script of 'ok', 'slow', 429, 503, 400 or 'timeout' per call."""
+
+    def __init__(self, script, slow_seconds=0.4):
+        self.script = list(script)
+        self.slow_seconds = slow_seconds
+        self.calls = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, **kwargs):
+        with self._lock:
+            step = self.script.pop(0) if self.script else "ok"
+            self.calls += 1
+            n = self.calls
+        if step == "slow":
+            time.sleep(self.slow_seconds)
+        elif step == "timeout":
+            raise TimeoutError("read timed out")
+        elif isinstance(step, int):
+            raise api_error(step, {429: "RESOURCE_EXHAUSTED", 503: "UNAVAILABLE", 400: "INVALID_ARGUMENT"}[step])
+        return SimpleNamespace(text=f"reply {n}")
+
+
+def make_client(script, **kw):
+    return SimpleNamespace(models=FakeModels(script, **kw))
+
+
+def run(client, model="m", **kw):
+    return timed(client, model, **kw)[0]
+
+
+def timed(client, model="m", **kw):
+    """(result, seconds until the caller got it); asyncio.run itself also waits for abandoned threads."""
+    async def go():
+        started = time.monotonic()
+        result = await resilience.call(lambda: client.models.generate_content(model=model), model=model, **kw)
+        return result, time.monotonic() - started
+    return asyncio.run(go())
+
+
+def setup_function():
+    resilience.reset()
+    resilience.BASE_DELAY_SECONDS, resilience.MAX_DELAY_SECONDS = 0.01, 0.02
+    resilience.HEDGE_MIN_DELAY_SECONDS = 0.05
+
+
+def test_retries_rate_limits_and_timeouts_only():
+    client = make_client([429, "timeout", "ok"])
+    assert run(client).text == "reply 3"
+    assert resilience.stats["retries"] == 2
+
+    client = make_client([400])
+    try:
+        run(client)
+        assert False, "400 must not be retried"
+    except errors.ClientError as e:
+        assert e.code == 400
+    assert client.models.calls == 1
+
+
+def test_slow_attempt_times_out_and_retries():
+    client = make_client(["slow", "ok"], slow_seconds=0.5)
+    result, seconds = timed(client, timeout=0.1)
+    assert result.text == "reply 2" and seconds < 0.4
+
+
+def test_circuit_opens_fails_fast_and_recovers():
+    clock = [0.0]
+    breaker = resilience.CircuitBreaker("m", failures=3, reset_seconds=30, clock=lambda: clock[0])
+    resilience._breakers["m"] = breaker
+
+    client = make_client([503] * 10)
+    try:
+        run(client, attempts=3)
+    except errors.ServerError:
+        pass
+    assert breaker.state == "open" and client.models.calls == 3
+
+    try:
+        run(client)
+        assert False, "open circuit must fail fast"
+    except resilience.CircuitOpenError:
+        pass
+    assert client.models.calls == 3  # No request was made
+
+    clock[0] = 31  # Cooldown over: one trial goes through and closes the circuit
+    client.models.script.clear()
+    assert run(client).text == "reply 4"
+    assert breaker.state == "closed"
+
+
+def test_hedge_takes_the_faster_response():
+    tracker = resilience.latency_for("m")
+    for _ in range(resilience.HEDGE_MIN_SAMPLES):
+        tracker.observe(0.05)
+
+    client = make_client(["slow"], slow_seconds=1.0)
+    result, seconds = timed(client, hedge=True)
+    assert result.text == "reply 2" and seconds < 0.5
+    assert resilience.stats["hedges"] == 1 and resilience.stats["hedge_wins"] == 1
+
+
+def test_retried_follow_up_round_does_not_replay_tools():
+    def response(part):
+        return types.GenerateContentResponse.model_validate(
+            {"candidates": [{"content": {"role": "model", "parts": [part]}}]})
+
+    # Round 1 asks for loot, the follow-up hits a 429 and is retried on its own
+    script = [response({"function_call": {"name": "add_loot", "args": {"item": "Potion"}}}),
+              api_error(429, "RESOURCE_EXHAUSTED"), response({"text": "You pocket the potion."})]
+
+    def generate_content(**kwargs):
+        step = script.pop(0)
+        if isinstance(step, Exception):
+            raise step
+        return step
+
+    executed = []
+    real_execute, real_resolve, real_client = dm_turn.execute_tool, dm_turn.resolve_cache, dm_turn.get_client
+
+    async def execute_tool(call, tools):
+        executed.append(call.name)
+        return await real_execute(call, tools)
+
+    dm_turn.execute_tool = execute_tool
+    dm_turn.resolve_cache = lambda *args: None
+    dm_turn.get_client = lambda: SimpleNamespace(models=SimpleNamespace(generate_content=generate_content))
+    try:
+        result = asyncio.run(dm_turn.run_turn({"user_name": "Ana", "user_input": "I search the chest",
+                                               "history": [], "players": {}}))
+    finally:
+        dm_turn.execute_tool, dm_turn.resolve_cache, dm_turn.get_client = real_execute, real_resolve, real_client
+    assert result["ok"] and result["text"] == "You pocket the potion."
+    assert executed == ["add_loot"]
+    assert resilience.stats["retries"] == 1
+
+
+if __name__ == "__main__":
+    for test in (test_retries_rate_limits_and_timeouts_only, test_slow_attempt_times_out_and_retries,
+                 test_circuit_opens_fails_fast_and_recovers, test_hedge_takes_the_faster_response,
+                 test_retried_follow_up_round_does_not_replay_tools):
+        setup_function()
+        test()
+    print("SUCCESS! Model calls are resilient.")
@@ -0,0 +1,98 @@
+import asyncio
+import threading
+from types import SimpleNamespace
+
+import scene_prefetch
+from usage_tracker import estimate_cost
+
+# Offline: speculative scene descriptions are hit, missed, budgeted and charged as waste.
+
+USAGE = SimpleNamespace(prompt_token_count=1000, cached_content_token_count=0, candidates_token_count=200)
+
+
+def make_prefetcher(gate=None, **kwargs):
+    """A prefetcher whose describe call holds until `gate` is set (no wall-clock races)."""
+    calls = []
+    started = threading.Event()
+
+    def describe(last_message):
+        """Stands in for main.describe_scene (blocking, returns description and usage)."""
+        calls.append(last_message)
+        started.set()
+        if gate is not None:
+            gate.wait(5)
+        return f"A painting of: {last_message}", USAGE
+
+    options = {"idle_seconds": 0, "hourly_budget": 10}
+    options.update(kwargs)
+    return scene_prefetch.ScenePrefetcher(describe, **options), calls, started
+
+
+async def settle(prefetcher):
+    """Waits for the scheduled prefetch to finish (stored, skipped or failed)."""
+    if prefetcher._pending:
+        await prefetcher._pending[1]
+
+
+def test_turn_id_changes_with_content():
+    assert scene_prefetch.get_turn_id([]) is None
+    assert scene_prefetch.get_turn_id(["a", "DM: x"]) != scene_prefetch.get_turn_id(["a", "DM: y"])
+    assert scene_prefetch.get_turn_id(["DM: x"]).startswith("1:")
+
+
+def test_hit_miss_and_join_in_flight():
+    gate = threading.Event()
+    prefetcher, calls, started = make_prefetcher(gate)
+
+    async def main():
+        gate.set()
+        prefetcher.schedule("1:aa", "The dragon lands")
+        await settle(prefetcher)
+        assert await prefetcher.get("1:aa") == "A painting of: The dragon lands"
+        assert await prefetcher.get("1:aa") is None  # Used up
+
+        # Asked while the paid call is still running: wait for it instead of paying twice
+        gate.clear()
+        started.clear()
+        prefetcher.schedule("2:bb", "The tavern burns")
+        await asyncio.to_thread(started.wait, 5)
+        lookup = asyncio.create_task(prefetcher.get("2:bb"))
+        await asyncio.sleep(0)
+        assert not lookup.done()  # Joined the running call
+        gate.set()
+        assert await lookup == "A painting of: The tavern burns"
+
+        # Asked before the idle wait ends: the guess is cancelled for free
+        prefetcher.idle_seconds = 3600
+        prefetcher.schedule("3:cc", "Quiet night")
+        assert await prefetcher.get("3:cc") is None
+
+    asyncio.run(main())
+    s = prefetcher.stats()
+    assert (s["hits"], s["misses"], s["prefetches"]) == (2, 2, 2)
+    assert calls == ["The dragon lands", "The tavern burns"]
+    assert "50% hit rate (2/4)" in prefetcher.format_stats()
+
+
+def test_budget_and_wasted_cost():
+    prefetcher, calls, _ = make_prefetcher(hourly_budget=2)
+
+    async def main():
+        for n in range(3):
+            prefetcher.schedule(f"{n}:id", f"turn {n}")
+            await settle(prefetcher)
+
+    asyncio.run(main())
+    s = prefetcher.stats()
+    assert s["prefetches"] == 2 and s["skipped_budget"] == 1
+    # Each guess was superseded unused by the next turn: its cost counts as waste
+    assert s["wasted"] == 2
+    assert abs(s["wasted_cost_usd"] - round(2 * estimate_cost(USAGE), 6)) < 1e-9
+    assert len(calls) == 2
+
+
+if __name__ == "__main__":
+    test_turn_id_changes_with_content()
+    test_hit_miss_and_join_in_flight()
+    test_budget_and_wasted_cost()
+    print("SUCCESS! Scene prefetch accounting holds.")
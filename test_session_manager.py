@@ -0,0 +1,114 @@
+import asyncio
+import os
+import tempfile
+import tracemalloc
+
+from session_manager import SessionStore
+
+# Offline load test: thousands of abandoned interviews must not pin memory.
+
+ABANDONED = 3000
+LINES_PER_SESSION = 200
+MAX_HISTORY = 40
+LINE = "User: I want to be a scary demon lady with horns and a tail."
+# Rough per-line cost of a distinct str plus its list slot
+LINE_BYTES = len(LINE) + 64
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1_000_000.0
+
+    def __call__(self):
+        return self.now
+
+
+def fill(store, count, lines):
+    for i in range(count):
+        uid = str(i)
+        store[uid] = {"history": []}
+        for n in range(lines):
+            store.append(uid, f"{LINE} #{n}")
+
+
+def test_history_cap_bounds_memory_per_session():
+    tracemalloc.start()
+    try:
+        capped = SessionStore("creation", max_history=MAX_HISTORY, clock=FakeClock())
+        base = tracemalloc.take_snapshot()
+        fill(capped, ABANDONED, LINES_PER_SESSION)
+        grown = tracemalloc.take_snapshot()
+    finally:
+        tracemalloc.stop()
+
+    growth = sum(stat.size_diff for stat in grown.compare_to(base, "filename"))
+    assert all(len(capped[str(i)]["history"]) == MAX_HISTORY for i in range(0, ABANDONED, 97))
+    # Bounded by the cap, not by how long each abandoned interview ran (5x more lines)
+    assert growth < ABANDONED * MAX_HISTORY * LINE_BYTES * 1.5
+    assert growth < ABANDONED * LINES_PER_SESSION * LINE_BYTES / 3
+
+
+def test_sweep_expires_abandoned_sessions_without_blocking():
+    clock = FakeClock()
+    store = SessionStore("campaign", ttl_seconds=3600, clock=clock)
+    fill(store, ABANDONED, 5)
+    store["active"] = {"history": []}
+
+    clock.now += 1800
+    store.append("active", "User: still here")
+    clock.now += 2000  # Abandoned ones are now 3800s idle, "active" only 2000s
+
+    ticks = 0
+
+    async def ticker(stop):
+        nonlocal ticks
+        while not stop.is_set():
+            ticks += 1
+            await asyncio.sleep(0)
+
+    async def run():
+        stop = asyncio.Event()
+        tick_task = asyncio.create_task(ticker(stop))
+        await asyncio.sleep(0)
+        removed = await store.sweep(batch=500)
+        stop.set()
+        await tick_task
+        return removed
+
+    removed = asyncio.run(run())
+    assert removed == ABANDONED
+    assert len(store) == 1 and "active" in store
+    # The loop got to run other work while the sweep was in progress
+    assert ticks >= ABANDONED // 500 - 1
+
+
+def test_lazy_expiry_on_lookup():
+    clock = FakeClock()
+    store = SessionStore("creation", ttl_seconds=60, clock=clock)
+    store["42"] = {"history": []}
+    clock.now += 61
+    assert "42" not in store
+    assert len(store) == 0
+
+
+def test_persistence_round_trip():
+    clock = FakeClock()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "creation_sessions.json")
+        store = SessionStore("creation", persist_path=path, clock=clock)
+        store["7"] = {"history": []}
+        store.append("7", "User: hello")
+        store.save_if_dirty()()
+        assert store.save_if_dirty() is None  # Nothing changed since
+
+        restored = SessionStore("creation", persist_path=path, clock=clock)
+        restored.load()
+        assert restored["7"]["history"] == ["User: hello"]
+
+
+if __name__ == "__main__":
+    test_history_cap_bounds_memory_per_session()
+    test_sweep_expires_abandoned_sessions_without_blocking()
+    test_lazy_expiry_on_lookup()
+    test_persistence_round_trip()
+    print("SUCCESS! Sessions stay bounded.")
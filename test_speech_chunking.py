@@ -0,0 +1,90 @@
+import io
+import time
+import wave
+
+import speech_generator
+
+# Offline: a fake TTS backend that returns deterministic PCM per chunk.
+# Each chunk becomes one 16-bit sample per character, valued by its position
+# in the narration, so we can check the stitched order byte-for-byte.
+
+LONG_NARRATION = "\n\n".join(
+    " ".join(f"Sentence {p}-{s} of the tale unfolds in the torchlight." for s in range(12))
+    for p in range(6)
+)
+
+
+def fake_pcm(text):
+    return b"".join(len(text).to_bytes(2, "little") for _ in text)
+
+
+def make_backend(delay=0.0):
+    calls = []
+
+    def synth(text, voice_name):
+        calls.append(text)
+        time.sleep(delay)
+        return fake_pcm(text)
+
+    return synth, calls
+
+
+def test_chunks_respect_limit_and_keep_all_text():
+    chunks = speech_generator.split_into_chunks(LONG_NARRATION, max_chars=200)
+    assert len(chunks) > 1
+    assert all(0 < len(c) <= 200 for c in chunks)
+    assert " ".join(chunks).split() == LONG_NARRATION.split()
+    # Boundaries land on sentence ends, not mid-word
+    assert all(c.endswith(".") for c in chunks)
+
+
+def test_no_truncation_and_ordered_stitching():
+    synth, calls = make_backend()
+    wav_bytes, err = speech_generator.generate_speech(LONG_NARRATION, synth_fn=synth)
+    assert err is None
+
+    chunks = speech_generator.split_into_chunks(LONG_NARRATION)
+    assert sorted(calls) == sorted(chunks)
+
+    with wave.open(io.BytesIO(wav_bytes)) as wf:
+        assert wf.getnchannels() == 1
+        assert wf.getsampwidth() == 2
+        assert wf.getframerate() == 24000
+        frames = wf.readframes(wf.getnframes())
+    assert frames == b"".join(fake_pcm(c) for c in chunks)
+    # The old implementation cut everything past 3000 characters
+    assert len(LONG_NARRATION) > 3000
+    assert sum(len(c) for c in chunks) > 3000
+
+
+def test_latency_tracks_slowest_chunk():
+    delay = 0.2
+    synth, _ = make_backend(delay)
+    text = " ".join(f"Line {i} is exactly long enough to be its own chunk here." for i in range(4))
+    chunks = speech_generator.split_into_chunks(text, max_chars=60)
+    assert len(chunks) == 4
+
+    started = time.perf_counter()
+    pcm = b"".join(speech_generator.iter_speech_pcm(text, synth_fn=synth, max_workers=4, max_chars=60))
+    elapsed = time.perf_counter() - started
+
+    assert pcm == b"".join(fake_pcm(c) for c in chunks)
+    # Serial synthesis would take 4 * delay
+    assert elapsed < delay * 2
+
+
+def test_backend_error_is_reported():
+    def broken(text, voice_name):
+        raise RuntimeError("quota")
+
+    wav_bytes, err = speech_generator.generate_speech("Hello there.", synth_fn=broken)
+    assert wav_bytes is None
+    assert "quota" in err
+
+
+if __name__ == "__main__":
+    test_chunks_respect_limit_and_keep_all_text()
+    test_no_truncation_and_ordered_stitching()
+    test_latency_tracks_slowest_chunk()
+    test_backend_error_is_reported()
+    print("SUCCESS! Chunked TTS behaves.")
@@ -0,0 +1,78 @@
+import random
+import time
+
+import story_memory
+
+# Offline: the story index recalls old facts and stays fast on huge campaigns.
+
+TURNS = 100_000
+WORDS = ("ring map oath ship debt guard tavern blade storm lantern crypt bridge "
+         "harbor spice wolf ember mirror crown banner orchard").split()
+NAMES = ("Seraphine", "Kael", "Ravenholm", "Ysolde", "Brannoc", "Ashgrove")
+
+
+def make_history(turns, seed=3):
+    rng = random.Random(seed)
+    history = []
+    for i in range(turns):
+        words = " ".join(rng.choice(WORDS) for _ in range(12))
+        if i % 2 == 0:
+            history.append(f"Hero{i % 5}: I look at the {words}.")
+        else:
+            history.append(f"DM: The {words} waits while {rng.choice(NAMES)} watches.")
+    return history
+
+
+def test_recalls_old_promise_outside_recent_window():
+    history = make_history(2000)
+    history[37] = "DM: Old Morwick the ferryman swears an oath to carry you across the Greywater at the black moon."
+    index = story_memory.StoryIndex()
+    index.sync(history)
+
+    recalled = story_memory.recall(index, history, "What did Morwick promise about the Greywater?", exclude_recent=200)
+    assert "[Turn 37 · Greywater, Morwick]" in recalled
+
+    # Lines inside the recent window are already in the prompt, so never recalled
+    history.append("DM: Morwick waves from the dock.")
+    index.sync(history)
+    hits = index.search("Morwick", before=len(history) - 200)
+    assert [doc_id for doc_id, _ in hits] == [37]
+
+
+def test_fix_resets_index():
+    history = make_history(50)
+    index = story_memory.StoryIndex()
+    index.sync(history)
+    history.clear()
+    history.append("DM: A fresh start.")
+    index.sync(history)
+    assert len(index) == 1
+
+
+def test_incremental_updates_and_queries_fast_at_100k_turns():
+    history = make_history(TURNS)
+    index = story_memory.StoryIndex()
+    index.sync(history)
+
+    started = time.perf_counter()
+    for i in range(200):
+        history.append(f"DM: Turn {i} with Kael by the harbor.")
+        index.sync(history)
+    per_add = (time.perf_counter() - started) / 200
+    assert len(index) == TURNS + 200
+    assert per_add < 0.002  # O(new turn), not O(history)
+
+    timings = []
+    for query in ["I ask Seraphine about the ring", "Where is the crown?", "wolf ember mirror", "Brannoc"] * 25:
+        started = time.perf_counter()
+        index.search(query, before=len(history) - 200)
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    assert timings[int(0.95 * len(timings))] < 0.015
+
+
+if __name__ == "__main__":
+    test_recalls_old_promise_outside_recent_window()
+    test_fix_resets_index()
+    test_incremental_updates_and_queries_fast_at_100k_turns()
+    print("SUCCESS! Story memory recalls.")
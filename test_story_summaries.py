@@ -0,0 +1,81 @@
+import asyncio
+import os
+import tempfile
+
+from story_summaries import StorySummarizer
+
+# Offline: summaries materialize tier by tier and are only recomputed when their span changes.
+
+WINDOW = 20
+
+
+class FakeSummarizer:
+    def __init__(self):
+        self.prompts = []
+
+    def __call__(self, prompt):
+        self.prompts.append(prompt)
+        return f"summary #{len(self.prompts)}"
+
+
+def drain(summarizer, history):
+    async def run():
+        while await summarizer.step(history, WINDOW, max_calls=2):
+            pass
+    asyncio.run(run())
+
+
+def test_tiers_materialize_and_are_cached():
+    fake = FakeSummarizer()
+    summarizer = StorySummarizer(fake, scene_lines=10, scenes_per_session=2)
+    history = [f"line {i}" for i in range(60)]  # 40 lines out of the window -> 4 scenes
+
+    drain(summarizer, history)
+    assert len(summarizer.scenes) == 4
+    assert len(summarizer.sessions) == 2
+    assert summarizer.campaign["sessions"] == 2
+    assert len(fake.prompts) == 4 + 2 + 1
+
+    # Nothing changed: no new calls, and the prompt tiers read instantly
+    drain(summarizer, history)
+    assert len(fake.prompts) == 7
+    assert summarizer.story_so_far(history, WINDOW).startswith("[Campaign so far]\nsummary #7")
+
+    # One more scene ages out: only that scene is summarized
+    history.extend(f"line {i}" for i in range(60, 70))
+    drain(summarizer, history)
+    assert len(fake.prompts) == 8
+    assert "[Recent scene]\nsummary #8" in summarizer.story_so_far(history, WINDOW)
+
+
+def test_fix_invalidates_summaries():
+    fake = FakeSummarizer()
+    summarizer = StorySummarizer(fake, scene_lines=10, scenes_per_session=2)
+    history = [f"line {i}" for i in range(60)]
+    drain(summarizer, history)
+
+    history.clear()
+    history.extend(f"new {i}" for i in range(25))
+    assert summarizer.story_so_far(history, WINDOW) == ""
+    assert summarizer.campaign is None and not summarizer.legend()
+
+
+def test_persistence_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "summaries.json")
+        history = [f"line {i}" for i in range(60)]
+        summarizer = StorySummarizer(FakeSummarizer(), scene_lines=10, scenes_per_session=2, persist_path=path)
+        drain(summarizer, history)
+        summarizer.save_if_dirty()()
+
+        restored = StorySummarizer(FakeSummarizer(), scene_lines=10, scenes_per_session=2, persist_path=path)
+        restored.load()
+        assert restored.story_so_far(history, WINDOW) == summarizer.story_so_far(history, WINDOW)
+        assert restored.legend()[0] == "summary #7"
+
+
+if __name__ == "__main__":
+    test_tiers_materialize_and_are_cached()
+    test_fix_invalidates_summaries()
+    test_persistence_round_trip()
+    print("SUCCESS! Summaries materialize.")
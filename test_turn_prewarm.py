@@ -0,0 +1,62 @@
+import asyncio
+import time
+
+import bench_load
+import turn_prewarm
+
+# Offline: typing prepares the next turn; messages use it only while it still matches.
+
+
+def slow_prepare(snapshot):
+    """Stands in for dm_turn.prepare_turn."""
+    time.sleep(snapshot.get("seconds", 0.05))
+    return {"history_text": "\n".join(snapshot["history"])}, {"cache_lookup": 0.04, "context_build": 0.01}
+
+
+def test_prepared_turn_is_used_only_while_it_matches():
+    prewarmer = turn_prewarm.TurnPrewarmer(slow_prepare, min_interval=1.0)
+
+    async def main():
+        # Typing prepares the turn; repeated typing events don't redo it
+        assert prewarmer.on_typing("c1", ("2:ab", 1), {"history": ["a", "b"]})
+        assert not prewarmer.on_typing("c1", ("2:ab", 1), {"history": ["a", "b"]})
+        await asyncio.sleep(0.1)
+        assert (await prewarmer.take("c1", ("2:ab", 1))) == {"history_text": "a\nb"}
+
+        # Another turn landed since: the prepared parts are stale
+        prewarmer.min_interval = 0
+        prewarmer.on_typing("c1", ("3:cd", 2), {"history": ["c"]})
+        await asyncio.sleep(0.1)
+        assert (await prewarmer.take("c1", ("4:ef", 3))) is None
+
+        # A message arriving mid-prewarm joins it...
+        prewarmer.on_typing("c1", ("4:ef", 3), {"history": ["e"], "seconds": 0.1})
+        assert (await prewarmer.take("c1", ("4:ef", 3))) == {"history_text": "e"}
+        # ...unless the prewarm is already outdated, then it's cancelled
+        prewarmer.on_typing("c1", ("5:gh", 4), {"history": ["g"], "seconds": 0.1})
+        assert (await prewarmer.take("c1", ("6:ij", 5))) is None
+
+        # Rate limit per channel
+        prewarmer.min_interval = 60
+        assert not prewarmer.on_typing("c1", ("7:kl", 6), {"history": []})
+        assert (await prewarmer.take("c2", ("1:zz", 0))) is None
+
+    asyncio.run(main())
+    s = prewarmer.stats()
+    assert (s["hits"], s["stale"], s["misses"], s["cancelled"], s["rate_limited"]) == (2, 1, 2, 1, 1)
+    assert s["saved_seconds"] >= 0.05  # The first hit saved all of its 50ms
+    assert "Prewarm: 40% hit rate" in prewarmer.format_stats()
+
+
+def test_load_harness_with_typing():
+    result = bench_load.run(turns=20, channels=1, players=2, latency=0.005, jitter=0.002,
+                            reply_chars=600, send_latency=0.001, typing=0.02)
+    assert result["completed_turns"] == 20 and result["failed_turns"] == 0
+    assert result["prewarm"]["hit_rate"] >= 0.9
+    assert result["stages"]["prewarm_saved"]["count"] == result["prewarm"]["hits"]
+
+
+if __name__ == "__main__":
+    test_prepared_turn_is_used_only_while_it_matches()
+    test_load_harness_with_typing()
+    print("SUCCESS! Typing prewarms the next turn.")
@@ -0,0 +1,71 @@
+import os
+import tempfile
+from types import SimpleNamespace
+
+import usage_tracker
+import speech_generator
+
+# Offline checks: usage is billed to the right scope, even from worker threads.
+
+
+def fake_response(prompt=1000, cached=800, output=100):
+    return SimpleNamespace(usage_metadata=SimpleNamespace(
+        prompt_token_count=prompt, cached_content_token_count=cached,
+        candidates_token_count=output, thoughts_token_count=None,
+    ))
+
+
+def reset(path=None):
+    usage_tracker._store = {"lifetime": {}, "days": {}, "budgets": {}}
+    usage_tracker._dirty = False
+    usage_tracker.persist_path = path
+
+
+def test_tts_workers_bill_the_calling_command():
+    reset()
+
+    def fake_synth(chunk, voice_name):
+        usage_tracker.record_response(fake_response(), kind="tts")
+        return b"\0\0" * 10
+
+    with usage_tracker.attribute("narrate", player="p1", campaign="c1") as scope:
+        list(speech_generator.iter_speech_pcm("One. Two. Three. " * 50, "Kore", synth_fn=fake_synth, max_chars=100))
+
+    calls = scope.totals["tts"]
+    assert calls > 1
+    assert usage_tracker.totals("by_command", "narrate")["tts"] == calls
+    assert usage_tracker.totals("by_player", "p1", days=1)["tts"] == calls
+    assert usage_tracker.totals("by_command", "other")["tts"] == 0
+
+
+def test_budget_states():
+    reset()
+    with usage_tracker.attribute("turn", campaign="c1"):
+        usage_tracker.record_response(fake_response())
+    cost = usage_tracker.totals("by_campaign", "c1")["cost"]
+    assert usage_tracker.budget_state("c1") == "ok"  # No budget set
+    usage_tracker.set_budget("c1", cost / usage_tracker.BUDGET_WARN_RATIO * 0.99)
+    assert usage_tracker.budget_state("c1") == "warn"
+    usage_tracker.set_budget("c1", cost / 2)
+    assert usage_tracker.budget_state("c1") == "over"
+
+
+def test_persistence_round_trip():
+    with tempfile.TemporaryDirectory() as tmp:
+        reset(os.path.join(tmp, "usage.json"))
+        with usage_tracker.attribute("snapshot", campaign="c1"):
+            usage_tracker.record_image()
+        usage_tracker.save_if_dirty()()
+        assert usage_tracker.save_if_dirty() is None
+
+        usage_tracker._store = {"lifetime": {}, "days": {}, "budgets": {}}
+        usage_tracker.load()
+        assert usage_tracker.totals("by_campaign", "c1")["images"] == 1
+    reset()
+
+
+if __name__ == "__main__":
+    test_tts_workers_bill_the_calling_command()
+    test_budget_states()
+    test_persistence_round_trip()
+    print("SUCCESS! Usage is attributed.")
@@ -0,0 +1,85 @@
+import asyncio
+import threading
+import time
+
+import voice_narrator
+from voice_narrator import FRAME_BYTES
+
+# Offline: a fake voice client that pulls frames on its own thread like
+# discord.py's AudioPlayer, and a fake TTS backend with a fixed delay per chunk.
+
+CHUNK_DELAY = 0.15
+NARRATION = " ".join(f"Sentence number {i} echoes through the vaulted hall." for i in range(12))
+
+
+class FakeVoiceClient:
+    def __init__(self):
+        self.frames = []
+        self.thread = None
+
+    def is_playing(self):
+        return self.thread is not None and self.thread.is_alive()
+
+    def stop(self):
+        pass
+
+    def play(self, source):
+        def pump():
+            while True:
+                frame = source.read()
+                if not frame:
+                    break
+                self.frames.append(frame)
+                time.sleep(0.001)  # Real player paces at 20 ms; keep the test quick
+        self.thread = threading.Thread(target=pump, daemon=True)
+        self.thread.start()
+
+
+def fake_pcm(text):
+    return (len(text) % 100 + 1).to_bytes(2, "little") * (len(text) * 10)
+
+
+def fake_synth(text, voice_name):
+    time.sleep(CHUNK_DELAY)
+    return fake_pcm(text)
+
+
+def test_to_discord_pcm_doubles_rate_and_channels():
+    mono = (1).to_bytes(2, "little", signed=True) + (-2).to_bytes(2, "little", signed=True)
+    out = voice_narrator.to_discord_pcm(mono)
+    assert len(out) == len(mono) * 4
+    samples = [int.from_bytes(out[i:i + 2], "little", signed=True) for i in range(0, len(out), 2)]
+    assert samples == [1, 1, 1, 1, -2, -2, -2, -2]
+
+
+def test_streams_in_order_and_starts_early():
+    vc = FakeVoiceClient()
+    started = time.perf_counter()
+    source = asyncio.run(voice_narrator.play_narration(vc, NARRATION, synth_fn=fake_synth))
+    synth_done = time.perf_counter() - started
+    vc.thread.join(timeout=10)
+
+    chunks = voice_narrator.speech_generator.split_into_chunks(NARRATION)
+    expected = b"".join(voice_narrator.to_discord_pcm(fake_pcm(c)) for c in chunks)
+    audio = b"".join(f for f in vc.frames if f != voice_narrator.SILENCE_FRAME)
+    assert audio.rstrip(b"\x00") == expected.rstrip(b"\x00")
+    assert all(len(f) == FRAME_BYTES for f in vc.frames)
+
+    # Playback began after the first chunk, well before synthesis of everything finished
+    assert source.time_to_first_audio is not None
+    assert source.time_to_first_audio < CHUNK_DELAY * 2
+    assert len(chunks) > 1 and source.time_to_first_audio < synth_done
+
+
+def test_finish_without_audio_ends_playback():
+    source = voice_narrator.StreamingPCMSource()
+    source.finish()
+    assert source.read() == b""
+    assert source.time_to_first_audio is None
+
+
+if __name__ == "__main__":
+    test_to_discord_pcm_doubles_rate_and_channels()
+    test_streams_in_order_and_starts_early()
+    test_finish_without_audio_ends_playback()
+    print("SUCCESS! Voice streaming behaves.")
@@ -0,0 +1,121 @@
+import asyncio
+import os
+import time
+
+import bench_load
+import dm_turn
+import metrics
+import usage_tracker
+import worker_pool
+
+# Offline: turns run concurrently in worker processes and reach each channel in order.
+
+
+async def fake_turn(request):
+    """Stands in for dm_turn.run_turn inside a worker."""
+    if request.get("crash"):
+        os._exit(1)
+    with metrics.span("model_round"):
+        await asyncio.sleep(request["seconds"])
+    usage_tracker.record_image()
+    return {"ok": True, "text": f"reply to {request['n']}", "images": [], "pid": os.getpid(),
+            "parent": os.getppid(), "rules": dm_turn.RULES}
+
+
+def test_channel_order_delivers_in_arrival_order():
+    order = worker_pool.ChannelOrder()
+    delivered = []
+
+    async def turn(channel, n, seconds):
+        async with order.slot(channel) as slot:
+            await asyncio.sleep(seconds)  # Later turns finish processing first
+            await slot.wait()
+            delivered.append((channel, n))
+
+    async def main():
+        await asyncio.gather(turn("a", 1, 0.15), turn("a", 2, 0.05), turn("b", 1, 0.01), turn("a", 3, 0.0))
+
+    asyncio.run(main())
+    assert [n for channel, n in delivered if channel == "a"] == [1, 2, 3]
+    assert delivered[0] == ("b", 1)  # Other channels don't wait
+
+
+def test_workers_run_turns_concurrently_and_report_usage():
+    pool = worker_pool.WorkerPool(2)
+    pool.start()
+    old_rules = dm_turn.RULES
+    try:
+        async def main():
+            with usage_tracker.attribute("turn", player="p1") as scope:
+                started = time.perf_counter()
+                results = await asyncio.gather(*(pool.run(fake_turn, {"n": n, "seconds": 0.3}) for n in range(8)))
+                elapsed = time.perf_counter() - started
+                for result in results:
+                    worker_pool.apply_report(result)
+            return results, elapsed, scope
+
+        results, elapsed, scope = asyncio.run(main())
+        assert [r["text"] for r in results] == [f"reply to {n}" for n in range(8)]
+        assert {r["pid"] for r in results} - {os.getpid()} == {r["pid"] for r in results}
+        assert len({r["pid"] for r in results}) == 2
+        assert elapsed < 1.0  # 8 turns x 0.3s on 2 workers: concurrent within each worker
+        assert scope.totals["images"] == 8
+        assert all(stage == "model_round" for r in results for stage, _ in r["spans"])
+
+        # A worker dying mid-turn fails that turn only; the pool replaces it,
+        # without forking this (threaded) process, and hands it the loaded rules
+        dm_turn.RULES = {"monsters": {"ghoul": {"hp": 22}}}
+
+        async def crash():
+            try:
+                await pool.run(fake_turn, {"n": 0, "seconds": 0, "crash": True})
+                return False
+            except worker_pool.BrokenProcessPool:
+                return True
+        assert asyncio.run(crash())
+        time.sleep(0.1)
+        async def after():
+            return await asyncio.gather(*(pool.run(fake_turn, {"n": n, "seconds": 0.2}) for n in (9, 10)))
+        after_results = asyncio.run(after())
+        assert [r["text"] for r in after_results] == ["reply to 9", "reply to 10"]
+        replaced = [r for r in after_results if r["pid"] not in {r["pid"] for r in results}]
+        assert len(replaced) == 1
+        assert replaced[0]["parent"] != os.getpid() and replaced[0]["rules"] == dm_turn.RULES
+    finally:
+        dm_turn.RULES = old_rules
+        pool.shutdown()
+
+
+def test_no_workers_left_raises_broken_pool():
+    # Replacements can't start (bad start method, unpicklable INHERITED, ...): the caller
+    # gets BrokenProcessPool, which main answers by playing the turn in the bot process
+    pool = worker_pool.WorkerPool(1)
+    real_start = worker_pool.REPLACEMENT_START
+    worker_pool.REPLACEMENT_START = "no-such-method"
+    try:
+        asyncio.run(pool.run(fake_turn, {"n": 0, "seconds": 0}))
+        assert False, "expected BrokenProcessPool"
+    except worker_pool.BrokenProcessPool:
+        pass
+    finally:
+        worker_pool.REPLACEMENT_START = real_start
+        pool.shutdown()
+
+
+def test_load_harness_with_workers():
+    result = bench_load.run(turns=40, channels=2, players=2, latency=0.005, jitter=0.002,
+                            reply_chars=600, send_latency=0.001, workers=2)
+    assert result["completed_turns"] == 40
+    assert result["failed_turns"] == 0 and not result["errors"]
+    assert result["history_lines"] == 80
+    assert result["stages"]["worker_turn"]["count"] == 40
+    assert result["stages"]["model_round"]["count"] > 40  # Reported back from the workers
+    assert result["estimated_cost_usd"] > 0
+
+
+if __name__ == "__main__":
+    test_channel_order_delivers_in_arrival_order()
+    test_workers_run_turns_concurrently_and_report_usage()
+    test_no_workers_left_raises_broken_pool()
+    test_load_harness_with_workers()
+    print("SUCCESS! Worker processes deliver in order.")
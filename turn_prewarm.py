@@ -0,0 +1,140 @@
+import asyncio
+import time
+
+import metrics
+import structured_log
+
+# Typing-triggered prewarming. When a registered player starts typing, the
+# channel's next turn is prepared in a worker thread: the mode's context cache
+# is resolved (listing or creating it if our trust in it lapsed), the state is
+# serialized and the history window joined. When the message arrives and
+# nothing changed since (same history turn, same state generation), the turn
+# uses the prepared parts and only the prompt and the model call remain.
+#
+# One prewarm per channel at a time, and a turn that is already prepared isn't
+# prepared again (Discord repeats typing events every ~10s). Beyond that, at most
+# one run per channel every PREWARM_MIN_INTERVAL_SECONDS; a newer turn cancels an
+# outdated one.
+
+PREWARM_MIN_INTERVAL_SECONDS = 2
+# Prepared parts older than this aren't trusted (the cache may have moved on)
+PREWARM_TTL_SECONDS = 120
+
+
+class TurnPrewarmer:
+    """
+    Prepares a channel's next turn while a player types.
+
+    prepare_fn(snapshot) is blocking and returns (parts, timings): the prepared
+    request parts and the seconds each step took (what a hit saves). It runs in
+    a worker thread so the event loop never waits on it.
+    """
+
+    def __init__(self, prepare_fn, min_interval=PREWARM_MIN_INTERVAL_SECONDS, ttl=PREWARM_TTL_SECONDS):
+        self.prepare_fn = prepare_fn
+        self.min_interval = min_interval
+        self.ttl = ttl
+
+        self._entries = {}       # channel -> (fingerprint, parts, timings, ready_at monotonic)
+        self._pending = {}       # channel -> (fingerprint, task)
+        self._last_started = {}  # channel -> monotonic
+
+        self.prewarms = 0
+        self.hits = 0
+        self.misses = 0
+        self.stale = 0
+        self.cancelled = 0
+        self.rate_limited = 0
+        self.failed = 0
+        self.saved_seconds = 0.0
+
+    def on_typing(self, channel, fingerprint, snapshot):
+        """Starts preparing this channel's next turn unless it is ready, running or rate-limited."""
+        now = time.monotonic()
+        entry = self._entries.get(channel)
+        if entry and entry[0] == fingerprint and now - entry[3] < self.ttl:
+            return False
+        pending = self._pending.get(channel)
+        if pending and pending[0] == fingerprint:
+            return False
+        if now - self._last_started.get(channel, float("-inf")) < self.min_interval:
+            self.rate_limited += 1
+            return False
+        self.cancel(channel)
+        self._last_started[channel] = now
+        task = asyncio.create_task(self._run(channel, fingerprint, snapshot))
+        self._pending[channel] = (fingerprint, task)
+        return True
+
+    async def take(self, channel, fingerprint):
+        """The prepared parts if they still match this turn, else None. Joins a prewarm still running."""
+        waited = 0.0
+        pending = self._pending.get(channel)
+        if pending:
+            if pending[0] == fingerprint:
+                # Half done beats starting over (the thread can't be stopped anyway)
+                started = time.perf_counter()
+                await asyncio.wait({pending[1]})
+                waited = time.perf_counter() - started
+            else:
+                self.cancel(channel)
+
+        entry = self._entries.pop(channel, None)
+        if entry is None:
+            self.misses += 1
+            return None
+        entry_fingerprint, parts, timings, ready_at = entry
+        if entry_fingerprint != fingerprint or time.monotonic() - ready_at > self.ttl:
+            self.stale += 1
+            return None
+        self.hits += 1
+        saved = max(0.0, sum(timings.values()) - waited)
+        self.saved_seconds += saved
+        metrics.observe("prewarm_saved", saved)
+        return parts
+
+    def cancel(self, channel):
+        pending = self._pending.pop(channel, None)
+        if pending and not pending[1].done():
+            pending[1].cancel()
+            self.cancelled += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses + self.stale
+        return {
+            "prewarms": self.prewarms,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale": self.stale,
+            "hit_rate": (self.hits / lookups) if lookups else 0.0,
+            "cancelled": self.cancelled,
+            "rate_limited": self.rate_limited,
+            "failed": self.failed,
+            "saved_seconds": round(self.saved_seconds, 4),
+            "saved_per_hit_ms": round(self.saved_seconds / self.hits * 1000, 1) if self.hits else 0.0,
+        }
+
+    def format_stats(self):
+        s = self.stats()
+        return (
+            f"Prewarm: {s['hit_rate']:.0%} hit rate ({s['hits']}/{s['hits'] + s['misses'] + s['stale']}), "
+            f"~{s['saved_per_hit_ms']:.0f}ms saved per hit, {s['prewarms']} runs, "
+            f"{s['stale']} stale, {s['cancelled']} cancelled, {s['rate_limited']} rate-limited"
+        )
+
+    # --- INTERNALS ---
+
+    async def _run(self, channel, fingerprint, snapshot):
+        self.prewarms += 1
+        task = asyncio.current_task()
+        try:
+            parts, timings = await asyncio.to_thread(self.prepare_fn, snapshot)
+        except Exception as e:
+            self.failed += 1
+            structured_log.warn("prewarm", f"Failed: {e}")
+            return None
+        finally:
+            if self._pending.get(channel, (None, None))[1] is task:
+                del self._pending[channel]
+        self._entries[channel] = (fingerprint, parts, timings, time.monotonic())
+        return parts
@@ -0,0 +1,249 @@
+import os
+import json
+import threading
+import contextvars
+from contextlib import contextmanager
+from datetime import date, timedelta
+
+import structured_log
+
+# Token/cost accounting for every model call, attributed to the command, player
+# and campaign that caused it. Totals are kept lifetime plus in daily buckets
+# (last RETENTION_DAYS), persisted to a small JSON file.
+
+# Approximate pricing (USD). Cached input is billed at a fraction of fresh input.
+INPUT_PRICE_PER_M = 0.50
+CACHED_INPUT_PRICE_PER_M = 0.05
+OUTPUT_PRICE_PER_M = 3.00
+IMAGE_PRICE = 0.03
+
+RETENTION_DAYS = 30
+# Past this share of a campaign's budget, speculative work (prefetch) stops;
+# past 100%, autonomous illustration and !snapshot stop too.
+BUDGET_WARN_RATIO = 0.8
+# Applies to any campaign without its own budget (set via !usage budget <usd>)
+DEFAULT_CAMPAIGN_BUDGET_USD = float(os.getenv("CAMPAIGN_BUDGET_USD", "0")) or None
+
+FIELDS = ("calls", "prompt", "cached", "output", "images", "tts", "cost")
+
+_scope = contextvars.ContextVar("usage_scope", default=None)
+_lock = threading.Lock()
+_store = {"lifetime": {}, "days": {}, "budgets": {}}
+_dirty = False
+persist_path = None
+
+
+def _empty():
+    return dict.fromkeys(FIELDS, 0)
+
+
+def estimate_cost(usage):
+    """Rough USD cost of one call from its usage_metadata (None-safe)."""
+    if usage is None:
+        return 0.0
+    prompt = getattr(usage, "prompt_token_count", None) or 0
+    cached = getattr(usage, "cached_content_token_count", None) or 0
+    output = (getattr(usage, "candidates_token_count", None) or 0) + (getattr(usage, "thoughts_token_count", None) or 0)
+    fresh = max(prompt - cached, 0)
+    return (fresh * INPUT_PRICE_PER_M + cached * CACHED_INPUT_PRICE_PER_M + output * OUTPUT_PRICE_PER_M) / 1_000_000
+
+
+class Scope:
+    """Who a block of model calls is billed to, plus that block's own running totals."""
+
+    def __init__(self, command, player=None, campaign=None):
+        self.command = command
+        self.player = player
+        self.campaign = campaign
+        self.totals = _empty()
+
+    def describe(self):
+        t = self.totals
+        return (f"{t['prompt']} prompt ({t['cached']} cached) + {t['output']} out tokens, "
+                f"{t['images']} image(s), {t['tts']} TTS call(s), ~${t['cost']:.4f}")
+
+
+@contextmanager
+def attribute(command, player=None, campaign=None):
+    """Bills every call inside the block (including worker threads started from it)."""
+    scope = Scope(command, player, campaign)
+    token = _scope.set(scope)
+    try:
+        yield scope
+    finally:
+        _scope.reset(token)
+
+
+def _add(**amounts):
+    global _dirty
+    scope = _scope.get() or Scope("other")
+    keys = [("by_command", scope.command)]
+    if scope.player:
+        keys.append(("by_player", scope.player))
+    if scope.campaign:
+        keys.append(("by_campaign", scope.campaign))
+
+    today = date.today().isoformat()
+    with _lock:
+        day = _store["days"].setdefault(today, {})
+        for bucket in (_store["lifetime"], day):
+            for group, key in keys:
+                totals = bucket.setdefault(group, {}).setdefault(key, _empty())
+                for field, amount in amounts.items():
+                    totals[field] += amount
+        for field, amount in amounts.items():
+            scope.totals[field] += amount
+        _dirty = True
+
+
+_CALL_FIELD = {"text": "calls", "image": "images", "tts": "tts"}
+
+
+def record_response(response, kind="text"):
+    """Captures usage_metadata from a generate_content response (kind: text, image or tts)."""
+    counts = {_CALL_FIELD[kind]: 1}
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None:
+        _add(**counts)
+        return
+    _add(
+        **counts,
+        prompt=usage.prompt_token_count or 0,
+        cached=usage.cached_content_token_count or 0,
+        output=(usage.candidates_token_count or 0) + (usage.thoughts_token_count or 0),
+        cost=estimate_cost(usage),
+    )
+
+
+def record_totals(amounts):
+    """Adds totals measured elsewhere (a worker process's Scope.totals) to the current scope."""
+    amounts = {field: amount for field, amount in amounts.items() if field in FIELDS and amount}
+    if amounts:
+        _add(**amounts)
+
+
+def record_image(count=1):
+    """Imagen calls are billed per image, not per token."""
+    _add(images=count, cost=IMAGE_PRICE * count)
+
+
+def reset():
+    """Forgets all usage and budgets (benchmarks, tests)."""
+    global _store, _dirty
+    with _lock:
+        _store = {"lifetime": {}, "days": {}, "budgets": {}}
+        _dirty = False
+
+
+# --- QUERIES ---
+
+def totals(group, key, days=None):
+    """Lifetime totals for one command/player/campaign, or the sum of the last `days` days."""
+    with _lock:
+        if days is None:
+            return dict(_store["lifetime"].get(group, {}).get(key, _empty()))
+        result = _empty()
+        for offset in range(days):
+            day = _store["days"].get((date.today() - timedelta(days=offset)).isoformat(), {})
+            for field, amount in day.get(group, {}).get(key, {}).items():
+                result[field] += amount
+        return result
+
+
+def breakdown(group, days=None):
+    """{key: totals} for a whole group, most expensive first."""
+    with _lock:
+        if days is None:
+            keys = list(_store["lifetime"].get(group, {}))
+        else:
+            keys = {k for d in _store["days"].values() for k in d.get(group, {})}
+    rows = {key: totals(group, key, days) for key in keys}
+    return dict(sorted(rows.items(), key=lambda kv: kv[1]["cost"], reverse=True))
+
+
+# --- BUDGETS ---
+
+def set_budget(campaign, usd):
+    global _dirty
+    with _lock:
+        if usd:
+            _store["budgets"][campaign] = float(usd)
+        else:
+            _store["budgets"].pop(campaign, None)
+        _dirty = True
+
+
+def get_budget(campaign):
+    return _store["budgets"].get(campaign, DEFAULT_CAMPAIGN_BUDGET_USD)
+
+
+def budget_state(campaign):
+    """'ok', 'warn' (stop speculative work) or 'over' (stop optional spending)."""
+    budget = get_budget(campaign)
+    if not budget:
+        return "ok"
+    spent = totals("by_campaign", campaign)["cost"]
+    if spent >= budget:
+        return "over"
+    if spent >= budget * BUDGET_WARN_RATIO:
+        return "warn"
+    return "ok"
+
+
+# --- PERSISTENCE ---
+
+def load():
+    global _store
+    if not persist_path or not os.path.exists(persist_path):
+        return
+    try:
+        with open(persist_path, "r") as f:
+            data = json.load(f)
+        with _lock:
+            _store = {"lifetime": data.get("lifetime", {}), "days": data.get("days", {}),
+                      "budgets": data.get("budgets", {})}
+    except Exception as e:
+        structured_log.warn("usage", f"Could not load usage store: {e}")
+
+
+def save_if_dirty():
+    """Returns a blocking save callable (for asyncio.to_thread) or None if nothing changed."""
+    global _dirty
+    if not persist_path or not _dirty:
+        return None
+    cutoff = (date.today() - timedelta(days=RETENTION_DAYS)).isoformat()
+    with _lock:
+        for day in [d for d in _store["days"] if d < cutoff]:
+            del _store["days"][day]
+        data = json.dumps(_store, separators=(",", ":"))
+        _dirty = False
+    path = persist_path
+
+    def write():
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return write
+
+
+# --- METRICS ---
+
+def prometheus_lines():
+    """Lifetime counters for metrics.register_exporter."""
+    lines = [
+        "# HELP dm_model_tokens_total Model tokens by command and kind.",
+        "# TYPE dm_model_tokens_total counter",
+    ]
+    commands = breakdown("by_command")
+    for command, t in commands.items():
+        for kind in ("prompt", "cached", "output"):
+            lines.append(f'dm_model_tokens_total{{command="{command}",kind="{kind}"}} {t[kind]}')
+    lines += ["# HELP dm_model_calls_total API calls by command and type.", "# TYPE dm_model_calls_total counter"]
+    for command, t in commands.items():
+        for kind, field in (("text", "calls"), ("image", "images"), ("tts", "tts")):
+            lines.append(f'dm_model_calls_total{{command="{command}",type="{kind}"}} {t[field]}')
+    lines += ["# HELP dm_estimated_cost_usd_total Estimated spend by campaign.", "# TYPE dm_estimated_cost_usd_total counter"]
+    for campaign, t in breakdown("by_campaign").items():
+        lines.append(f'dm_estimated_cost_usd_total{{campaign="{campaign}"}} {t["cost"]:.6f}')
+    return lines
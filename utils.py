@@ -1,53 +1,179 @@
 import asyncio
-import functools
-import random
-from google.api_core import exceptions
-import google.genai
-
-def retry_with_backoff(retries=3, initial_delay=2, factor=2):
-    """
-    Decorator to retry async functions on ResourceExhausted (429) errors.
-    """
-    def decorator(func):
-        @functools.wraps(func)
-        async def wrapper(*args, **kwargs):
-            delay = initial_delay
-            for i in range(retries):
-                try:
-                    return await func(*args, **kwargs)
-                except Exception as e:
-                    # In google-genai, the error structure might vary, but we look for 429
-                    error_str = str(e)
-                    if "429" in error_str or "RESOURCE_EXHAUSTED" in error_str or isinstance(e, exceptions.ResourceExhausted):
-                        if i == retries - 1:
-                            raise e # Give up on last try
-                        
-                        jitter = random.uniform(0, 1)
-                        wait_time = delay + jitter
-                        print(f"⚠️ Rate Limit (429). Retrying in {wait_time:.2f}s... ({i+1}/{retries})")
-                        await asyncio.sleep(wait_time)
-                        delay *= factor
-                    else:
-                        raise e # Re-raise non-429 errors
-            return None # Should not be reached
-        return wrapper
-    return decorator
+import collections
+import re
+import discord
 
-async def send_chunked_message(ctx, text):
+# --- DISCORD MESSAGE PACKING ---
+# Plain messages cap at 2000 chars, but a single message can carry up to 10 embeds
+# totalling 6000 chars (4096 per description). Long DM replies therefore go out as
+# embeds, cutting a 10k-char reply from 6 requests to 2.
+MESSAGE_LIMIT = 2000
+EMBED_DESCRIPTION_LIMIT = 4096
+EMBED_TOTAL_LIMIT = 6000
+MAX_EMBEDS_PER_MESSAGE = 10
+EMBED_COLOR = 0x8B0000
+# Room left for markdown we have to close/reopen at a cut
+MARKDOWN_RESERVE = 24
+
+# Discord allows roughly 5 messages per 5 seconds per channel
+CHANNEL_RATE_LIMIT = 5
+CHANNEL_RATE_PERIOD = 5.0
+
+# Longest first so '**' wins over '*'. Underscores are skipped: too common inside words.
+_MARKERS = ("```", "**", "~~", "||", "`", "*")
+_SENTENCE_SPLIT = re.compile(r'(?<=[.!?…])\s+')
+
+def _scan_markdown(text, stack):
+    """Walks text and returns the stack of markdown spans still open at the end."""
+    stack = list(stack)
+    i = 0
+    n = len(text)
+    while i < n:
+        top = stack[-1] if stack else None
+        if top in ("```", "`"):
+            # Inside code nothing else is markup
+            end = text.find(top, i)
+            if end == -1:
+                break
+            stack.pop()
+            i = end + len(top)
+            continue
+
+        for marker in _MARKERS:
+            if text.startswith(marker, i):
+                break
+        else:
+            i += 1
+            continue
+
+        if marker == "*" and (i == 0 or text[i - 1] == "\n") and text[i + 1:i + 2] == " ":
+            i += 1  # '* ' at line start is a bullet, not italics
+            continue
+        if marker in stack:
+            while stack and stack.pop() != marker:
+                pass
+        else:
+            stack.append(marker)
+        i += len(marker)
+    return stack
+
+def _split_units(text, limit):
+    """Breaks text into pieces no longer than limit, preferring paragraph > line > sentence > word cuts."""
+    units = []
+    for para in re.split(r'(\n\s*\n)', text):
+        if len(para) <= limit:
+            units.append(para)
+            continue
+        for line in re.split(r'(\n)', para):
+            if len(line) <= limit:
+                units.append(line)
+                continue
+            for sentence in _SENTENCE_SPLIT.split(line):
+                while len(sentence) > limit:
+                    cut = sentence.rfind(" ", 0, limit)
+                    if cut <= 0:
+                        cut = limit
+                    units.append(sentence[:cut])
+                    sentence = sentence[cut:]
+                units.append(sentence + " ")
+    return [u for u in units if u]
+
+def _reopen(spans):
+    return "".join(m + "\n" if m == "```" else m for m in spans)
+
+def _close(spans):
+    return "".join("\n" + m if m == "```" else m for m in reversed(spans))
+
+def split_markdown(text, limit=MESSAGE_LIMIT):
+    """
+    Splits text into chunks of at most `limit` chars on natural boundaries,
+    closing bold/italic/code spans at each cut and reopening them in the next chunk.
     """
-    Splits long text into chunks of 1900 chars (safe under 2000 limit) 
-    and sends them sequentially to the discord context.
+    budget = limit - MARKDOWN_RESERVE
+    chunks = []
+    current = ""
+    open_spans = []  # Spans open at the start of `current`
+
+    def flush():
+        nonlocal current, open_spans
+        body = current.strip()
+        if body:
+            still_open = _scan_markdown(body, open_spans)
+            chunks.append(f"{_reopen(open_spans)}{body}{_close(still_open)}")
+            open_spans = still_open
+        current = ""
+
+    for unit in _split_units(text, budget):
+        if len(current) + len(unit) > budget:
+            flush()
+        current += unit
+    flush()
+    return chunks
+
+def pack_reply(text):
+    """
+    Plans the fewest Discord requests for a reply.
+    Returns a list of messages, each either {'content': str} or {'embeds': [str, ...]}.
     """
     if not text:
+        return []
+    if len(text) <= MESSAGE_LIMIT:
+        return [{"content": text}]
+
+    messages = []
+    # Each embed cut can add reopen/close markers, so leave room for them in the part
+    for part in split_markdown(text, EMBED_TOTAL_LIMIT - MARKDOWN_RESERVE):
+        descriptions = split_markdown(part, EMBED_DESCRIPTION_LIMIT)
+        for i in range(0, len(descriptions), MAX_EMBEDS_PER_MESSAGE):
+            messages.append({"embeds": descriptions[i:i + MAX_EMBEDS_PER_MESSAGE]})
+    return messages
+
+class ChannelRateLimiter:
+    """
+    Local per-channel send queue. Sends to one channel go out in order and never
+    faster than Discord's per-channel limit, so we don't burn requests on 429s.
+    """
+
+    def __init__(self, rate=CHANNEL_RATE_LIMIT, per=CHANNEL_RATE_PERIOD):
+        self.rate = rate
+        self.per = per
+        self._locks = {}
+        self._sent = {}
+
+    def lock_for(self, key):
+        if key not in self._locks:
+            self._locks[key] = asyncio.Lock()
+            self._sent[key] = collections.deque(maxlen=self.rate)
+        return self._locks[key]
+
+    async def wait_turn(self, key):
+        """Call while holding lock_for(key); sleeps until a send slot is free."""
+        sent = self._sent[key]
+        loop = asyncio.get_running_loop()
+        if len(sent) == self.rate:
+            wait = sent[0] + self.per - loop.time()
+            if wait > 0:
+                await asyncio.sleep(wait)
+        sent.append(loop.time())
+
+channel_limiter = ChannelRateLimiter()
+
+async def send_chunked_message(ctx, text):
+    """
+    Sends a long reply in as few requests as possible: plain text when it fits,
+    otherwise markdown-safe embed pages. Works with a Context or a channel.
+    """
+    messages = pack_reply(text)
+    if not messages:
         return
 
-    # specific Discord limit is 2000, using 1900 for safety buffer
-    chunk_size = 1900
-    
-    if len(text) <= chunk_size:
-        await ctx.send(text)
-    else:
-        # Split text into chunks
-        chunks = [text[i:i+chunk_size] for i in range(0, len(text), chunk_size)]
-        for chunk in chunks:
-            await ctx.send(chunk)
+    channel = getattr(ctx, "channel", None) or ctx
+    key = getattr(channel, "id", id(channel))
+    async with channel_limiter.lock_for(key):
+        for message in messages:
+            await channel_limiter.wait_turn(key)
+            if "content" in message:
+                await ctx.send(message["content"])
+            else:
+                embeds = [discord.Embed(description=d, color=EMBED_COLOR) for d in message["embeds"]]
+                await ctx.send(embeds=embeds)
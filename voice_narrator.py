@@ -0,0 +1,113 @@
+import asyncio
+import threading
+import time
+from array import array
+
+import discord
+
+import speech_generator
+
+# discord.py voice wants 20 ms frames of 48 kHz 16-bit stereo PCM.
+# Gemini TTS gives us 24 kHz 16-bit mono, so every sample is doubled in time and channels.
+FRAME_BYTES = 3840
+SILENCE_FRAME = b"\x00" * FRAME_BYTES
+# How long read() waits for the next chunk before padding with silence.
+UNDERRUN_WAIT_SECONDS = 0.015
+
+
+def to_discord_pcm(pcm_data):
+    """24 kHz mono s16le -> 48 kHz stereo s16le."""
+    if len(pcm_data) % 2:
+        pcm_data = pcm_data[:-1]
+    mono = array("h", pcm_data)
+    out = array("h", bytes(len(mono) * 8))
+    for offset in range(4):
+        out[offset::4] = mono
+    return out.tobytes()
+
+
+class StreamingPCMSource(discord.AudioSource):
+    """
+    An AudioSource that is fed TTS audio chunk-by-chunk while it plays.
+
+    The voice client starts pulling frames immediately; until the first chunk
+    arrives (or whenever synthesis falls behind) it gets silence instead of EOF.
+    """
+
+    def __init__(self, clock=time.perf_counter):
+        self._clock = clock
+        self._buffer = bytearray()
+        self._cond = threading.Condition()
+        self._finished = False
+        self.created_at = clock()
+        self.first_audio_at = None
+        self.frames_played = 0
+        self.underruns = 0
+
+    @property
+    def time_to_first_audio(self):
+        """Seconds from creation until the first real frame went out, or None."""
+        if self.first_audio_at is None:
+            return None
+        return self.first_audio_at - self.created_at
+
+    def feed(self, pcm_data):
+        """Appends raw Gemini TTS PCM (24 kHz mono)."""
+        converted = to_discord_pcm(pcm_data)
+        with self._cond:
+            self._buffer.extend(converted)
+            self._cond.notify_all()
+
+    def finish(self):
+        """No more audio is coming; play out what's buffered, then stop."""
+        with self._cond:
+            self._finished = True
+            self._cond.notify_all()
+
+    def read(self):
+        with self._cond:
+            if len(self._buffer) < FRAME_BYTES and not self._finished:
+                self._cond.wait(UNDERRUN_WAIT_SECONDS)
+
+            if len(self._buffer) >= FRAME_BYTES:
+                frame = bytes(self._buffer[:FRAME_BYTES])
+                del self._buffer[:FRAME_BYTES]
+            elif self._finished:
+                if not self._buffer:
+                    return b""  # Tells the player we're done
+                frame = bytes(self._buffer).ljust(FRAME_BYTES, b"\x00")
+                self._buffer.clear()
+            else:
+                self.underruns += 1
+                return SILENCE_FRAME
+
+        if self.first_audio_at is None:
+            self.first_audio_at = self._clock()
+        self.frames_played += 1
+        return frame
+
+    def is_opus(self):
+        return False
+
+
+def stream_narration(source, text, voice_name='Kore', synth_fn=None):
+    """Blocking: pushes synthesized chunks into the source in story order as they finish."""
+    try:
+        for pcm in speech_generator.iter_speech_pcm(text, voice_name, synth_fn=synth_fn):
+            source.feed(pcm)
+    finally:
+        source.finish()
+
+
+async def play_narration(voice_client, text, voice_name='Kore', synth_fn=None):
+    """
+    Starts playback right away and feeds it as TTS produces audio.
+    Returns the source once synthesis is done (playback may still be running).
+    """
+    if voice_client.is_playing():
+        voice_client.stop()
+
+    source = StreamingPCMSource()
+    voice_client.play(source)
+    await asyncio.to_thread(stream_narration, source, text, voice_name, synth_fn)
+    return source
@@ -0,0 +1,257 @@
+import os
+import sys
+import asyncio
+import importlib
+import itertools
+import threading
+import multiprocessing
+from contextlib import asynccontextmanager
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+import usage_tracker
+import structured_log
+
+# Optional gateway/worker split. With WORKER_PROCESSES=N the bot process keeps
+# only the Discord gateway, the game state and the story index; each DM turn is
+# shipped as a plain dict (see dm_turn.py) over a pipe to one of N worker
+# processes, which build the prompt, serialize the state, call the model, run
+# tools and generate images. Each worker runs many turns at once on its own
+# event loop (turns mostly wait on the API), and sends results back with the
+# turn's token usage, stage timings and log records. ChannelOrder then delivers
+# them to each channel in the order the messages arrived.
+#
+# Workers are forked once at startup, after the rules and state are loaded and
+# before the gateway connects (or any thread starts), so they start warm. A worker
+# that dies is replaced from a clean forkserver instead: forking the live bot,
+# with its writer, reader and executor threads, could copy a lock mid-use. The
+# replacement imports its modules fresh and gets INHERITED copied over.
+
+WORKER_PROCESSES = int(os.getenv("WORKER_PROCESSES", "0"))
+REPLACEMENT_START = "forkserver"  # multiprocessing start method for replacement workers
+# Module globals the gateway sets at runtime that a replacement worker needs too
+INHERITED = ("dm_turn.RULES", "genai_client.BASE_URL")
+
+
+# --- WORKER SIDE ---
+
+async def _run_one(fn, request):
+    with metrics.turn(None) as turn, usage_tracker.attribute("worker") as usage, \
+            structured_log.bind(capture=True) as logs:
+        result = await fn(request)
+    spans = [(stage, seconds) for stage, seconds in turn.spans if stage != "turn_total"]
+    return {**result, "usage": usage.totals, "spans": spans, "worker": os.getpid(),
+            "logs": logs.captured, "log_seconds": logs.seconds}
+
+
+async def _serve(conn):
+    loop = asyncio.get_running_loop()
+    send_lock = threading.Lock()
+    tasks = set()
+
+    def reply(message):
+        with send_lock:
+            conn.send(message)
+
+    async def handle(job_id, fn, request):
+        try:
+            message = (job_id, True, await _run_one(fn, request))
+        except Exception as e:
+            message = (job_id, False, f"{type(e).__name__}: {e}")
+        await loop.run_in_executor(None, reply, message)
+
+    while True:
+        try:
+            job = await loop.run_in_executor(None, conn.recv)
+        except EOFError:
+            break  # Gateway went away
+        if job is None:
+            break
+        task = asyncio.create_task(handle(*job))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    for task in list(tasks):
+        task.cancel()
+
+
+def _inherited():
+    """Gateway side: current values of INHERITED, from the modules loaded here."""
+    values = {}
+    for name in INHERITED:
+        module_name, attr = name.rsplit(".", 1)
+        module = sys.modules.get(module_name)
+        if module is not None and hasattr(module, attr):
+            values[name] = getattr(module, attr)
+    return values
+
+
+def _worker_main(conn, inherited=None):
+    for name, value in (inherited or {}).items():
+        module_name, attr = name.rsplit(".", 1)
+        setattr(importlib.import_module(module_name), attr, value)
+    usage_tracker.persist_path = None  # Usage is reported back, never saved from here
+    structured_log.configure_worker()  # So are log records
+    asyncio.run(_serve(conn))
+
+
+def apply_report(result):
+    """Gateway side: bills a worker's usage to the current scope, records its stage timings and logs."""
+    usage_tracker.record_totals(result.get("usage") or {})
+    for stage, seconds in result.get("spans") or ():
+        metrics.observe(stage, seconds)
+    structured_log.ingest(result.get("logs") or (), result.get("log_seconds", 0.0))
+
+
+# --- GATEWAY SIDE ---
+
+class _Worker:
+    def __init__(self, context, pool, inherited=None):
+        self.conn, child_conn = context.Pipe()
+        self.process = context.Process(target=_worker_main, args=(child_conn, inherited), daemon=True)
+        self.process.start()
+        child_conn.close()
+        self.pending = {}  # job id -> (loop, future)
+        self.send_lock = threading.Lock()
+        self.stopping = False
+        self._reader = threading.Thread(target=self._read, args=(pool,), daemon=True)
+        self._reader.start()
+
+    def _read(self, pool):
+        while True:
+            try:
+                job_id, ok, payload = self.conn.recv()
+            except (EOFError, OSError):
+                break
+            loop, future = self.pending.pop(job_id, (None, None))
+            if future is not None:
+                loop.call_soon_threadsafe(_settle, future, ok, payload)
+        if not self.stopping:
+            pool._worker_died(self)
+        for loop, future in list(self.pending.values()):
+            loop.call_soon_threadsafe(_settle, future, False, None)
+        self.pending.clear()
+
+    def submit(self, job_id, fn, request):
+        future = asyncio.get_running_loop().create_future()
+        self.pending[job_id] = (asyncio.get_running_loop(), future)
+        try:
+            with self.send_lock:
+                self.conn.send((job_id, fn, request))
+        except OSError as e:
+            self.pending.pop(job_id, None)
+            raise BrokenProcessPool(f"Worker pipe closed: {e}") from e
+        return future
+
+    def stop(self):
+        self.stopping = True
+        try:
+            with self.send_lock:
+                self.conn.send(None)
+        except OSError:
+            pass
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+        self.conn.close()
+
+
+def _settle(future, ok, payload):
+    if future.done():
+        return
+    if ok:
+        future.set_result(payload)
+    elif payload is None:
+        future.set_exception(BrokenProcessPool("Worker process died mid-turn"))
+    else:
+        future.set_exception(RuntimeError(payload))
+
+
+class WorkerPool:
+    """Runs async fn(request) -> dict in worker processes, many at a time per worker."""
+
+    def __init__(self, processes):
+        self.processes = processes
+        self._workers = []
+        self._ids = itertools.count()
+        self._lock = threading.Lock()
+        self._starting = threading.Lock()
+        self.turns = 0
+
+    def start(self):
+        """Forks the workers now (call before connecting and before starting any thread)."""
+        self._fill(multiprocessing.get_context("fork"))
+        structured_log.info("workers", f"{len(self._workers)} worker process(es) ready.")
+
+    def _fill(self, context, inherited=None):
+        # Starting a process is slow: hold _starting, not the lock run() picks workers under
+        with self._starting:
+            while len(self._workers) < self.processes:
+                worker = _Worker(context, self, inherited)
+                with self._lock:
+                    self._workers.append(worker)
+
+    def _replace(self):
+        """Blocking: starts workers for the ones that died, without forking this (busy) process."""
+        self._fill(multiprocessing.get_context(REPLACEMENT_START), _inherited())
+        structured_log.info("workers", f"Replacement worker(s) started ({REPLACEMENT_START}).")
+
+    def _worker_died(self, worker):
+        structured_log.warn("workers", f"Worker {worker.process.pid} exited; a new one starts on the next turn.")
+        with self._lock:
+            if worker in self._workers:
+                self._workers.remove(worker)
+
+    async def run(self, fn, request):
+        """fn(request) in the least busy worker. Raises BrokenProcessPool if that worker dies."""
+        if len(self._workers) < self.processes:
+            try:
+                await asyncio.to_thread(self._replace)
+            except Exception as e:
+                # Carry on with the workers still alive; with none, the caller plays the turn itself
+                structured_log.warn("workers", f"Could not start a replacement worker: {e}")
+        with self._lock:
+            if not self._workers:
+                raise BrokenProcessPool("No worker processes available")
+            worker = min(self._workers, key=lambda w: len(w.pending))
+        result = await worker.submit(next(self._ids), fn, request)
+        self.turns += 1
+        return result
+
+    def in_flight(self):
+        return sum(len(w.pending) for w in self._workers)
+
+    def shutdown(self):
+        with self._lock:
+            workers, self._workers = self._workers, []
+        for worker in workers:
+            worker.stop()
+
+
+class ChannelOrder:
+    """Turns in one channel may be processed concurrently but are delivered in arrival order."""
+
+    def __init__(self):
+        self._tails = {}  # channel -> future resolved when its latest turn has been delivered
+
+    @asynccontextmanager
+    async def slot(self, key):
+        """Take a place in line as the turn starts; `await slot.wait()` before delivering."""
+        done = asyncio.get_running_loop().create_future()
+        slot = _Slot(self._tails.get(key))
+        self._tails[key] = done
+        try:
+            yield slot
+        finally:
+            done.set_result(None)
+            if self._tails.get(key) is done:
+                del self._tails[key]
+
+
+class _Slot:
+    def __init__(self, previous):
+        self._previous = previous
+
+    async def wait(self):
+        """Returns once every earlier turn in the channel has been delivered."""
+        if self._previous is not None:
+            await asyncio.shield(self._previous)